@@ -1,11 +1,26 @@
 import streamlit as st
 from version import VERSION, LAST_UPDATED
 from datetime import datetime
+import importlib.util
+import pandas as pd
 import pytz
 
 # Extra utilities
 from streamlit_extras.add_vertical_space import add_vertical_space
 
+from utils.pool import WORKER_MAIN
+
+# Streamlit chạy script này trong một module mới đặt vào sys.modules["__main__"]. Mỗi
+# worker process (spawn / forkserver, kể cả khi forkserver đã preload utils.parallel) khi
+# khởi động lại chạy module __main__ của process chính: theo __spec__ nếu có, không thì
+# chạy lại file script (cả app). Đặt __spec__ bằng utils.worker để worker chỉ import các
+# stage (xem tests/test_pool.py)
+__spec__ = importlib.util.find_spec(WORKER_MAIN)
+
+# Copy-on-write cho cả app (option toàn cục của pandas, đặt một lần ở đây): frame do
+# pipeline trả về dùng chung bộ nhớ với kết quả trong memo, sửa frame không làm hỏng memo
+pd.set_option("mode.copy_on_write", True)
+
 st.set_page_config(layout="wide")
 
 
@@ -0,0 +1,12 @@
+import os
+import tempfile
+
+import pandas as pd
+
+# SKU master của các test nằm trong thư mục tạm (không ghi vào thư mục của app)
+os.environ.setdefault(
+    "SKU_MASTER_PATH", os.path.join(tempfile.mkdtemp(), "sku_master.sqlite")
+)
+
+# Copy-on-write giống app (xem streamlit_app.py)
+pd.set_option("mode.copy_on_write", True)
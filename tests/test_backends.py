@@ -0,0 +1,91 @@
+import datetime
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from utils import stages
+from utils.pipeline import PANDAS, POLARS, Pipeline, StageMemo
+
+FIXTURES = Path(__file__).parent / "fixtures"
+ROOT = Path(__file__).parent.parent
+
+STRING_COLUMNS = ["Order ID", "Seller SKU", "SKU ID", "Product Name", "Package ID", "Tracking ID"]
+NUMERIC_COLUMNS = [
+    "SKU Unit Original Price",
+    "SKU Subtotal Before Discount",
+    "SKU Platform Discount",
+    "SKU Seller Discount",
+    "SKU Subtotal After Discount",
+    "Shipping Fee After Discount",
+    "Original Shipping Fee",
+    "Shipping Fee Seller Discount",
+    "Shipping Fee Platform Discount",
+    "Payment platform discount",
+    "Taxes",
+    "Order Amount",
+    "Order Refund Amount",
+]
+
+PERIODS = [
+    ("Q1", datetime.date(2025, 1, 1), datetime.date(2025, 3, 31)),
+    ("Sale", datetime.date(2025, 3, 15), datetime.date(2025, 6, 30)),
+]
+
+
+def build(backend):
+    # Các stage giống page DataCleaning (đủ các section)
+    path = FIXTURES / "orders.csv"
+    with open(ROOT / "province_mapping.json", encoding="utf-8") as f:
+        province_mapping = json.load(f)
+
+    pipeline = Pipeline(StageMemo(), backend=backend)
+    pipeline.load(
+        stages.READ_FILE,
+        _file_path=str(path),
+        file_fingerprint=path.name,
+        file_extension="csv",
+        string_columns=STRING_COLUMNS,
+        numeric_columns=NUMERIC_COLUMNS,
+    )
+    pipeline.define(stages.CLEAN_PROVINCE, province_mapping=province_mapping)
+    pipeline.define(
+        stages.PRODUCT_COLUMNS,
+        brands=["Ensure", "Similac", "Glucerna", "PediaSure", "Grow"],
+        outliers_size=["COMBO 4 LỐC (24 CHAI) SỮA NƯỚC GLUCERNA HƯƠNG VANI"],
+    )
+    for stage in [
+        stages.BRAND_SIZE,
+        stages.FSP,
+        stages.FORMAT,
+        stages.DATE,
+        stages.CLP_REGION,
+        stages.VOUCHER,
+        stages.TIMELINE,
+        stages.SCHEME,
+        stages.CLEAN_1ST_SKU,
+    ]:
+        pipeline.define(stage)
+    pipeline.define(
+        stages.SUBTOTAL_USD,
+        fx_rates=[("2020-01-01", 26600.0), ("2025-03-15", 25000.0)],
+    )
+    pipeline.define(stages.KOL, kol_outliers=["QUYỀN LEO"], exclude_outliers=["date"])
+    pipeline.define(stages.GIFT, gifts=[("TẶNG", "QUÀ")])
+    pipeline.define(stages.PERIOD, periods=PERIODS)
+    return pipeline
+
+
+@pytest.mark.parametrize("rows", [None, slice(0, 50), slice(40, 100)])
+def test_pandas_polars_same_output(rows):
+    expected = build(PANDAS).materialize(rows=rows)
+    result = build(POLARS).materialize(rows=rows)
+
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_index_equal(result.index, expected.index)
+    for name in expected.columns:
+        assert result[name].dtype == expected[name].dtype, name
+        # Cùng giá trị và cùng kiểu Python của từng giá trị (vd: Scheme int / str)
+        pd.testing.assert_series_equal(result[name], expected[name], obj=name)
+        assert result[name].map(type).equals(expected[name].map(type)), name
@@ -0,0 +1,121 @@
+import io
+import os
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import xlsxwriter
+
+from utils import export
+from utils.export import write_excel
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "Order ID": ["1", "2", None, "4"],
+            "Quantity": [1, 2, 3, 4],
+            "FSP": [1.5, np.nan, np.inf, 0.25],
+            "Created Time": pd.to_datetime(
+                ["2025-01-07 16:21:00", None, "2025-07-04 23:36:00", "1900-01-01 08:00:00"]
+            ),
+            "Scheme": [1, "Không extract được scheme", 2.5, None],
+            "IS KOL": [True, False, True, False],
+        }
+    )
+
+
+def read_cells(data):
+    workbook = openpyxl.load_workbook(io.BytesIO(data))
+    worksheet = workbook.active
+    tables = dict(worksheet.tables.items())
+    return list(worksheet.values), tables
+
+
+def test_xlsxwriter_version_checked():
+    # _add_table dùng thuộc tính nội bộ của xlsxwriter: kiểm tra lại khi nâng version
+    assert xlsxwriter.__version__ in export.XLSXWRITER_TABLE_VERSIONS
+
+
+def test_write_excel_same_cells_as_to_excel(df):
+    output = io.BytesIO()
+    df.to_excel(output, index=False, engine="xlsxwriter")
+
+    cells, tables = read_cells(write_excel(df))
+
+    assert cells == read_cells(output.getvalue())[0]
+    assert tables == {}
+
+
+def test_write_excel_table(df):
+    cells, tables = read_cells(write_excel(df, table_style="Table Style Light 13"))
+
+    assert list(tables.values()) == ["A1:F5"]
+    assert cells[0] == tuple(df.columns)
+    assert cells == read_cells(write_excel(df))[0]
+
+
+def test_write_excel_table_unchecked_version(df, monkeypatch):
+    expected = read_cells(write_excel(df, table_style="Table Style Light 13"))
+
+    # Version chưa kiểm tra: ghi lại theo cách thông thường, cùng kết quả
+    monkeypatch.setattr(export, "XLSXWRITER_TABLE_VERSIONS", ())
+    with pytest.warns(UserWarning, match="constant_memory"):
+        data = write_excel(df, table_style="Table Style Light 13")
+
+    assert read_cells(data) == expected
+
+
+def test_write_arrow_parquet_mixed_column(df):
+    for data in [export.write_arrow(df), export.write_parquet(df)]:
+        table = (
+            pa.ipc.open_file(data).read_all()
+            if data[:6] == b"ARROW1"
+            else pq.read_table(io.BytesIO(data))
+        )
+
+        # Cột có giá trị nhiều kiểu được lưu dạng string, các cột khác giữ kiểu
+        assert table.schema.field("Scheme").type == pa.string()
+        assert table.column("Scheme").to_pylist() == ["1", "Không extract được scheme", "2.5", None]
+        assert table.schema.field("Quantity").type == pa.int64()
+        assert table.schema.field("Created Time").type == pa.timestamp("ns")
+
+
+def test_write_zip_keeps_newest_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "ZIP_DIR", tmp_path)
+    monkeypatch.setattr(export, "ZIP_MAX_FILES", 2)
+
+    paths = []
+    for i in range(3):
+        paths.append(export.write_zip(iter([(f"file_{i}.csv", b"a,b\n1,2\n")])))
+        # File tạo trước có thời gian sửa đổi cũ hơn
+        os.utime(paths[-1], (i, i))
+
+    with zipfile.ZipFile(paths[-1]) as zf:
+        assert zf.namelist() == ["file_2.csv"]
+        assert zf.read("file_2.csv") == b"a,b\n1,2\n"
+    assert sorted(tmp_path.glob("*.zip")) == sorted(map(Path, paths[1:]))
+
+
+@pytest.mark.parametrize(
+    "months, row_groups",
+    [
+        # Các tháng liền nhau: mỗi tháng một row group
+        (["2025-03", "2025-03", "2025-01", None, None, "2025-02"], 4),
+        # Các dòng của một tháng không liền nhau: một row group, không sắp xếp lại
+        (["2025-03", "2025-01", "2025-03", "2025-02"], 1),
+    ],
+)
+def test_write_parquet_keeps_row_order(months, row_groups):
+    df = pd.DataFrame({"Order ID": range(len(months)), "Created Year Month": months})
+
+    result = pq.ParquetFile(io.BytesIO(export.write_parquet(df)))
+
+    assert result.num_row_groups == row_groups
+    assert result.read().column("Order ID").to_pylist() == list(range(len(months)))
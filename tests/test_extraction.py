@@ -0,0 +1,416 @@
+import re
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from utils.extraction import (
+    CompiledExtractor,
+    extract_clp_regions,
+    extract_gifts,
+    extract_kols,
+    extract_product_columns,
+    normalize_text,
+)
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+OUTLIERS_SIZE = [
+    "COMBO 4 LỐC (24 CHAI) SỮA NƯỚC GLUCERNA HƯƠNG VANI",
+    "COMBO 5 LỐC (30 CHAI) SỮA NƯỚC GLUCERNA HƯƠNG VANI",
+    "1 THÙNG 24 CHAI SỮA NƯỚC GLUCERNA HƯƠNG VANI",
+    "[TẶNG BÌNH GIỮ NHIỆT] COMBO 24 CHAI SỮA NƯỚC GLUCERNA HƯƠNG VANI",
+]
+
+BRANDS = ["Grow", "PediaSure", "Ensure", "Similac", "Glucerna"]
+KOL_OUTLIERS = ["Quyền Leo", "Hằng Du Mục"]
+EXCLUDE_OUTLIERS = ["Hot Deal", "Deal Hè"]
+
+# Gift outliers mặc định của DataCleaning (st.session_state.gifts)
+GIFT_OUTLIERS = [
+    ("TĂNG KHĂN CHOÀNG TẮM", "TẶNG KHĂN CHOÀNG TẮM"),
+    ("TẶNG GHÉ SOFA HƯƠU VÀNG", "TẶNG GHẾ SOFA HƯƠU VÀNG"),
+    (
+        "TẶNG LY THUỶ TINH ENSURE GOLD MỚI CẢI TIẾN DẠNG BỘT HƯƠNG VANI 400G",
+        "TẶNG LY THUỶ TINH",
+    ),
+    (
+        "TẶNG ẤM ĐUN COMBO 3 LON SỮA ENSURE GOLD CẢI TIẾN MỚI DẠNG BỘT HƯƠNG VANI 850G",
+        "TẶNG ẤM ĐUN",
+    ),
+    (
+        "TẶNG LY THỦY TINH LON ENSURE GOLD CẢI TIẾN MỚI DẠNG BỘT HƯƠNG VANI 400G",
+        "TẶNG LY THỦY TINH",
+    ),
+    (
+        "TẶNG CÂN COMBO 2 LON SỮA ENSURE GOLD CẢI TIẾN MỚI DẠNG BỘT HƯƠNG VANI 850G",
+        "TẶNG CÂN",
+    ),
+    (
+        "TẶNG BÌNH GIỮ NHIỆT LON ENSURE GOLD CẢI TIẾN MỚI DẠNG BỘT HƯƠNG VANI 850G",
+        "TẶNG BÌNH GIỮ NHIỆT",
+    ),
+    (
+        "[DEAL HÈ] [DATE TỪ 01.01.2025 TRỞ ĐI] 1 Lon Thực phẩm Dinh Dưỡng Sữa Bột PediaSure 400g, Túi Đeo Chéo",
+        "TÚI ĐEO CHÉO",
+    ),
+    ("THẺ QUÀ TẶNG", "THẺ QUÀ TẶNG"),
+]
+
+
+def extract_size(product_name):
+    # Bản cũ (apply từng dòng) của Section 5, giữ nguyên để so sánh
+    product_name_lower = product_name.lower()
+    if "ensure" in product_name_lower:
+        if re.search(r"\b237\s*ml\b", product_name_lower):
+            if "original" in product_name_lower:
+                return "Original 237ml"
+            else:
+                return "Gold 237ml"
+    cleaned_name = re.sub(r"[^\w\s\.]", " ", product_name)
+    words = cleaned_name.split()
+    for word in words:
+        if word.lower() == "5g":
+            continue
+        if re.search(r"\d", word) and re.search(r"(g|kg|ml)", word, re.IGNORECASE):
+            cleaned_word = re.sub(r"gr\b", "g", word, flags=re.IGNORECASE)
+            return cleaned_word.lower()
+    return None
+
+
+def extract_scheme(row):
+    # Bản cũ (apply từng dòng) của DataCleaningMulti, có thêm nhánh LỐC không có COMBO
+    try:
+        name = row["Product Name"]
+        brand = row["Brand"]
+
+        idx = name.upper().find("COMBO")
+        if idx != -1:
+            after_combo = name[idx + 6 : idx + 11]
+            qty = int(after_combo[0]) if after_combo[0].isdigit() else 1
+
+            if "LỐC" in after_combo.upper():
+                divisor = 5 if brand == "Glucerna" else 4 if brand == "Ensure" else 12
+                return qty / divisor
+            else:
+                return qty
+
+        if "LỐC" in name.upper():
+            upper_name = name.upper()
+            loc_pos = upper_name.find("LỐC")
+            before_loc = upper_name[max(0, loc_pos - 10) : loc_pos].strip()
+            numbers = re.findall(r"\d+", before_loc)
+            qty = int(numbers[-1]) if numbers else 1
+
+            size = str(row["Size"]).upper()
+            if "110ML" in size or "180ML" in size:
+                divisor = 12
+            elif "237ML" in size or "220ML" in size:
+                divisor = 4
+            else:
+                return "Không extract được scheme do không tìm thấy liquid size"
+            return qty / divisor
+
+        return 1
+
+    except Exception:
+        return 1
+
+
+def extract_scheme_single(row):
+    # Bản cũ (apply từng dòng) của DataCleaning, chỉ xử lý COMBO
+    try:
+        name = row["Product Name"]
+        brand = row["Brand"]
+
+        idx = name.upper().find("COMBO")
+        if idx == -1:
+            return 1
+
+        after_combo = name[idx + 6 : idx + 11]
+        qty = int(after_combo[0])
+
+        if "LỐC" in after_combo.upper():
+            divisor = 5 if brand == "Glucerna" else 4 if brand == "Ensure" else 12
+            return qty / divisor
+        else:
+            return qty
+
+    except Exception:
+        return 1
+
+
+def extract_clean_sku(row):
+    # Bản cũ (apply từng dòng) của Clean 1st SKU
+    try:
+        brand = str(row["Brand"]).strip()
+        size = str(row["Size"]).strip()
+        name = str(row["Product Name"])
+
+        base_sku = f"{brand} {size}"
+        if base_sku == "Ensure 800g" and "ít ngọt" in name.lower():
+            base_sku = "Ensure Low Sugar Vanilla 800g"
+
+        clean_sku = base_sku
+        if brand == "Grow" and "bột" in name.lower() and "Abbott Grow" in name:
+            idx = name.find("Abbott Grow") + 12
+            clean_sku = f"Grow {name[idx:].strip()}"
+        elif brand == "Similac" and "bột" in name.lower() and "Similac " in name:
+            idx = name.find("Similac ") + 8
+            clean_sku = f"Similac {name[idx:].strip()}"
+
+        if clean_sku == "Glucerna 220ml":
+            if "(30 CHAI)" in name:
+                return "Glucerna 220ml 30 chai"
+            else:
+                return "Glucerna 220ml 24 chai"
+
+        return clean_sku
+
+    except Exception:
+        return None
+
+
+def extract_deal_info(product_name, exclude_outliers, kol_outliers):
+    # Bản cũ (apply từng dòng) của cột KOL
+    special_phrases = [
+        kol.upper() for kol in kol_outliers if kol.upper() in product_name.upper()
+    ]
+    if special_phrases:
+        return special_phrases[0]
+
+    brackets = re.findall(r"\[(.*?)\]", product_name)
+    brackets = [
+        b
+        for b in brackets
+        if all(excl.lower() not in b.lower() for excl in exclude_outliers)
+    ]
+
+    deal_phrases = [phrase for phrase in brackets if "DEAL" in phrase.upper()]
+    if deal_phrases:
+        deal_info = deal_phrases[0].split("DEAL")[1].strip().upper()
+        return deal_info
+
+    return "No KOLs"
+
+
+def extract_gift_name(product_name, list_outliers):
+    # Bản cũ (apply từng dòng) của cột Gift
+    for key, value in list_outliers:
+        if key in product_name:
+            if "THẺ QUÀ TẶNG" in key:
+                return value
+
+            result = value.upper().replace("TẶNG", "").strip()
+            return result
+
+    brackets = re.findall(r"\[(.*?)\]", product_name)
+    for bracket in brackets:
+        if "TẶNG" in bracket.upper():
+            gift_part = bracket.upper().split("TẶNG", 1)[1]
+            return gift_part.strip()
+
+    if "TẶNG" in product_name.upper():
+        gift_part = product_name.upper().split("TẶNG", 1)[1]
+        return gift_part.strip()
+
+    return "NO GIFT"
+
+
+def extract_clp_region(name):
+    # Bản cũ (apply từng dòng) của cột Warehouse Region
+    exception_in_brackets = {
+        "q6": "Hồ Chí Minh",
+        "củ chi": "Hồ Chí Minh",
+        "hcm": "Hồ Chí Minh",
+        "tuy hòa": "Phú Yên",
+        "tuy hoà": "Phú Yên",
+        "hn": "Hà Nội",
+    }
+    exception_outside = {
+        "hn": "Hà Nội",
+        "đn": "Đà Nẵng",
+        "hcm": "Hồ Chí Minh",
+        "bách hóa sữa bột 2": "Hồ Chí Minh",
+    }
+
+    match = re.search(r"\((.*?)\)", name)
+    if match:
+        region_hint = match.group(1).strip().lower()
+        for key, value in exception_in_brackets.items():
+            if key in region_hint:
+                return value
+        return match.group(1).strip().title()
+
+    name_lower = name.lower()
+    for key, value in exception_outside.items():
+        if key in name_lower:
+            return value
+
+    return name
+
+
+@pytest.fixture(scope="module")
+def product_names():
+    text = (FIXTURES / "product_names.txt").read_text(encoding="utf-8")
+    return pd.Series(text.splitlines(), dtype=object)
+
+
+@pytest.fixture(scope="module")
+def nfc_names(product_names):
+    # Bản cũ chạy trên tên đã chuẩn hóa NFC (bản mới chuẩn hóa trước khi extract)
+    return product_names.map(normalize_text)
+
+
+@pytest.fixture(scope="module")
+def product_columns(product_names):
+    return extract_product_columns(product_names, BRANDS)
+
+
+@pytest.fixture(scope="module")
+def old_input(nfc_names, product_columns):
+    return pd.DataFrame(
+        {
+            "Product Name": nfc_names,
+            "Brand": product_columns["Brand"],
+            "Size": product_columns["Size"],
+        }
+    )
+
+
+def test_size_matches_old_extract_size(product_names):
+    expected = product_names.apply(extract_size)
+    # Outlier so khớp trên tên đã chuẩn hóa NFC (tên NFD cũng được gán "220ml")
+    is_outlier = product_names.map(normalize_text).isin(OUTLIERS_SIZE)
+    expected[is_outlier & expected.isna()] = "220ml"
+
+    sizes = extract_product_columns(product_names, ["Ensure"], OUTLIERS_SIZE)["Size"]
+
+    pd.testing.assert_series_equal(
+        sizes.fillna("<none>"), expected.fillna("<none>"), check_names=False
+    )
+
+
+def test_size_null_product_name():
+    product_names = pd.Series(["Ensure Gold 800g", None], dtype=object)
+    sizes = extract_product_columns(product_names, ["Ensure"])["Size"]
+
+    assert sizes.tolist()[0] == "800g"
+    assert pd.isna(sizes.tolist()[1])
+
+
+def test_scheme_matches_old_extract_scheme(old_input, product_columns):
+    expected = old_input.apply(extract_scheme, axis=1)
+
+    assert product_columns["Scheme"].tolist() == expected.tolist()
+
+
+def test_scheme_single_file_only_differs_on_loc(old_input, product_columns):
+    # Bản single-file không có nhánh LỐC (không COMBO): nay dùng chung semantics của
+    # bản multi-file, các dòng còn lại phải giữ nguyên kết quả
+    names_upper = old_input["Product Name"].str.upper()
+    is_loc_only = names_upper.str.contains("LỐC") & ~names_upper.str.contains("COMBO")
+    expected = old_input.apply(extract_scheme_single, axis=1)
+
+    assert is_loc_only.any()
+    assert (
+        product_columns["Scheme"][~is_loc_only].tolist()
+        == expected[~is_loc_only].tolist()
+    )
+
+
+def test_clean_sku_matches_old_extract_clean_sku(old_input, product_columns):
+    expected = old_input.apply(extract_clean_sku, axis=1)
+
+    assert product_columns["Clean 1st SKU"].tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize(
+    "kol_outliers, exclude_outliers",
+    [
+        (KOL_OUTLIERS, EXCLUDE_OUTLIERS),
+        (KOL_OUTLIERS[::-1], EXCLUDE_OUTLIERS),
+        ([], EXCLUDE_OUTLIERS),
+    ],
+)
+def test_kol_matches_old_extract_deal_info(
+    product_names, nfc_names, kol_outliers, exclude_outliers
+):
+    expected = nfc_names.apply(
+        lambda x: extract_deal_info(x, exclude_outliers, kol_outliers)
+    )
+
+    kols = extract_kols(product_names, kol_outliers, exclude_outliers)
+
+    assert kols.tolist() == expected.tolist()
+
+
+def test_kol_mixed_case_deal():
+    # Bản cũ lỗi IndexError khi cụm [...] có "Deal" không viết hoa (split("DEAL"))
+    product_names = pd.Series(["[Deal Hè] Grow 900g", "[HOT DEAL] [Quyền Leo] Grow"])
+
+    kols = extract_kols(product_names, KOL_OUTLIERS, [])
+
+    assert kols.tolist() == ["HÈ", "QUYỀN LEO"]
+
+
+@pytest.mark.parametrize(
+    "gift_outliers", [GIFT_OUTLIERS, GIFT_OUTLIERS[::-1], []], ids=["list", "reversed", "empty"]
+)
+def test_gift_matches_old_extract_gift_name(product_names, nfc_names, gift_outliers):
+    expected = nfc_names.apply(lambda x: extract_gift_name(x, gift_outliers))
+
+    gifts = extract_gifts(product_names, gift_outliers)
+
+    assert gifts.tolist() == expected.tolist()
+
+
+def test_gift_first_outlier_in_list_wins():
+    # Key đứng trước trong list thắng, không phụ thuộc vị trí trong Product Name
+    product_names = pd.Series(["THẺ QUÀ TẶNG + TĂNG KHĂN CHOÀNG TẮM"])
+
+    assert extract_gifts(product_names, GIFT_OUTLIERS).tolist() == ["KHĂN CHOÀNG TẮM"]
+    assert extract_gifts(product_names, GIFT_OUTLIERS[::-1]).tolist() == ["THẺ QUÀ TẶNG"]
+
+
+def test_clp_region_matches_old_extract_clp_region(nfc_names):
+    warehouse_names = pd.concat(
+        [
+            nfc_names,
+            pd.Series(
+                [
+                    "Kho (Q6)",
+                    "Kho Tuy Hoà (tuy hoà)",
+                    "Kho ( Hà Đông HN )",
+                    "Kho (Cần Thơ)",
+                    "Kho HCM (Đà Lạt)",
+                    "Kho ĐN",
+                    "Bách Hóa Sữa Bột 2",
+                    "Kho Bình Dương",
+                ]
+            ),
+        ],
+        ignore_index=True,
+    )
+    expected = warehouse_names.apply(extract_clp_region)
+
+    regions = extract_clp_regions(warehouse_names)
+
+    assert regions.tolist() == expected.tolist()
+
+
+def test_compiled_extractor_bounded_results():
+    calls = []
+
+    def extract_unique(names):
+        calls.append(names.names.tolist())
+        return names.upper
+
+    extractor = CompiledExtractor(extract_unique, max_entries=2)
+    product_names = pd.Series(["a", "b", "c", "a"])
+
+    assert extractor.extract(product_names).tolist() == ["A", "B", "C", "A"]
+    # Chỉ giữ 2 key dùng gần nhất ("c" và key của tên null): "a" bị đẩy ra
+    assert extractor.extract(pd.Series(["c", "a"])).tolist() == ["C", "A"]
+    assert calls[0][:3] == ["a", "b", "c"]
+    assert calls[1] == ["a"]
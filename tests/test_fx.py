@@ -0,0 +1,55 @@
+import pandas as pd
+import polars as pl
+import pytest
+
+from utils.fx import convert_to_usd, convert_to_usd_expr, load_fx_rates
+
+FX_RATES = [("2025-01-01", 25000.0), ("2025-03-01", 26000.0)]
+
+# Created Time -> tỷ giá áp dụng
+CASES = {
+    # Trước dòng đầu tiên: tỷ giá đầu tiên
+    "31/12/2024 23:59:59": 25000.0,
+    # Đúng ngày của một dòng (kể cả cuối ngày)
+    "01/01/2025 00:00:00": 25000.0,
+    "01/03/2025 23:59:59": 26000.0,
+    # Giữa hai dòng: dòng trước đó
+    "28/02/2025 12:00:00": 25000.0,
+    # Sau dòng cuối cùng
+    "15/06/2025 08:00:00": 26000.0,
+}
+
+
+def test_convert_to_usd_as_of():
+    created_time = pd.Series(list(CASES) + [None], dtype=object)
+    amounts = pd.Series([1_000_000.0] * len(created_time))
+
+    result = convert_to_usd(amounts, created_time, FX_RATES)
+
+    # Created Time trống: tỷ giá mới nhất
+    expected = [round(1_000_000 / rate, 2) for rate in [*CASES.values(), 26000.0]]
+    assert result.tolist() == expected
+
+
+def test_convert_to_usd_expr_same_as_pandas():
+    created_time = pd.Series(list(CASES) + [None], dtype=object)
+    amounts = pd.Series([1_000_000.0] * len(created_time))
+    expected = convert_to_usd(amounts, created_time, FX_RATES)
+
+    df = pl.DataFrame(
+        {"amount": amounts.to_numpy(), "Created Time": created_time.tolist()},
+        schema={"amount": pl.Float64, "Created Time": pl.String},
+    )
+    result = df.select(convert_to_usd_expr(pl.col("amount"), pl.String, FX_RATES))
+
+    assert result.to_series().to_list() == expected.tolist()
+
+
+def test_empty_rate_table(tmp_path):
+    path = tmp_path / "fx_rates.csv"
+    path.write_text("date,vnd_per_usd\n")
+
+    with pytest.raises(ValueError, match="empty"):
+        load_fx_rates(str(path))
+    with pytest.raises(ValueError, match="empty"):
+        convert_to_usd(pd.Series([1.0]), pd.Series(["01/01/2025 00:00:00"]), [])
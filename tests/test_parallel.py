@@ -0,0 +1,53 @@
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from utils import stages
+from utils.parallel import materialize_files
+from utils.pipeline import PANDAS, Pipeline, StageMemo
+from utils.sku_master import KEY_COLUMNS, SKU_MASTER_PATH, get_rules_hash
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+# Brand chỉ dùng trong test này: các SKU đều là SKU mới với rules hash này
+BRANDS = ["Ensure", "Similac", "test_parallel"]
+
+
+def build(file_fingerprint):
+    path = FIXTURES / "orders.csv"
+    pipeline = Pipeline(StageMemo(), backend=PANDAS)
+    pipeline.load(
+        stages.READ_FILE,
+        _file_path=str(path),
+        file_fingerprint=file_fingerprint,
+        file_extension="csv",
+        string_columns=KEY_COLUMNS,
+        numeric_columns=[],
+    )
+    pipeline.define(stages.PRODUCT_COLUMNS, brands=BRANDS, outliers_size=[])
+    pipeline.define(stages.BRAND_SIZE)
+    return pipeline
+
+
+def test_materialize_files_saves_new_skus():
+    # Nhiều file: product columns được tính trong worker process
+    pipelines = {key: build(key) for key in ["a", "b"]}
+    results = materialize_files(pipelines)
+    assert all("Brand" in df.columns for df in results.values())
+
+    # Key sau khi đọc file (tab bị xóa)
+    keys = pd.read_csv(FIXTURES / "orders.csv", dtype=str)[KEY_COLUMNS].dropna()
+    keys = keys.apply(lambda column: column.str.replace("\t", "", regex=False))
+    expected = set(keys.itertuples(index=False, name=None))
+
+    conn = sqlite3.connect(SKU_MASTER_PATH)
+    try:
+        saved = conn.execute(
+            "SELECT sku_id, seller_sku, product_name FROM sku_master WHERE rules_hash = ?",
+            (get_rules_hash(BRANDS, []),),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    assert set(saved) == expected
@@ -0,0 +1,132 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.periods import PERIOD_COLUMNS, validate_periods
+
+
+def to_frame(rows):
+    return pd.DataFrame(rows, columns=PERIOD_COLUMNS)
+
+
+def add_one_by_one(candidates, existing):
+    # Thêm lần lượt từng dòng theo thứ tự trong file (giống bản cũ của page)
+    periods = list(existing)
+    accepted = []
+    for index, row in candidates.iterrows():
+        if row.isnull().any():
+            continue
+        start = pd.to_datetime(row["start_date"], format="%d/%m/%Y")
+        end = pd.to_datetime(row["end_date"], format="%d/%m/%Y")
+        if start > end:
+            continue
+
+        period = (row["period_name"], start, end)
+        if period in periods:
+            continue
+        if any(
+            not (end < pd.Timestamp(other_start) or start > pd.Timestamp(other_end))
+            for _, other_start, other_end in periods
+        ):
+            continue
+        periods.append(period)
+        accepted.append(index)
+    return accepted
+
+
+def test_overlap_keeps_earlier_row_in_file():
+    # Dòng 2 bắt đầu sớm hơn nhưng nằm sau trong file: dòng 1 được giữ
+    candidates = to_frame(
+        [
+            ("B", "10/01/2025", "20/01/2025"),
+            ("A", "01/01/2025", "12/01/2025"),
+            ("C", "15/01/2025", "25/01/2025"),
+        ]
+    )
+    accepted, rejected = validate_periods(candidates, [])
+
+    assert accepted["period_name"].tolist() == ["B"]
+    assert rejected["Row"].tolist() == [2, 3]
+    assert set(rejected["Reason"]) == {"Overlaps with another period in the file"}
+
+
+def test_rejected_row_does_not_block_later_rows():
+    # A bị loại vì giao với B; C chỉ giao với A nên được giữ
+    candidates = to_frame(
+        [
+            ("B", "10/01/2025", "20/01/2025"),
+            ("A", "15/01/2025", "30/01/2025"),
+            ("C", "25/01/2025", "05/02/2025"),
+        ]
+    )
+    accepted, _ = validate_periods(candidates, [])
+
+    assert accepted["period_name"].tolist() == ["B", "C"]
+
+
+def test_adjacent_periods_are_accepted():
+    # Ngày cuối / ngày đầu liền nhau không giao; cùng một ngày thì giao
+    existing = [("Old", datetime.date(2025, 1, 1), datetime.date(2025, 1, 31))]
+    candidates = to_frame(
+        [
+            ("Feb", "01/02/2025", "28/02/2025"),
+            ("Mar", "01/03/2025", "31/03/2025"),
+            ("Edge", "31/03/2025", "05/04/2025"),
+            ("Jan", "31/01/2025", "31/01/2025"),
+        ]
+    )
+    accepted, rejected = validate_periods(candidates, existing)
+
+    assert accepted["period_name"].tolist() == ["Feb", "Mar"]
+    assert rejected["Reason"].tolist() == [
+        "Overlaps with another period in the file",
+        "Overlaps with an existing period",
+    ]
+
+
+def test_duplicates():
+    existing = [("Old", datetime.date(2025, 1, 1), datetime.date(2025, 1, 31))]
+    candidates = to_frame(
+        [
+            # Trùng period đã có (file được đọc lại): bỏ qua, không báo lỗi
+            ("Old", "01/01/2025", "31/01/2025"),
+            ("Feb", "01/02/2025", "28/02/2025"),
+            # Trùng dòng 2: báo lỗi
+            ("Feb", "01/02/2025", "28/02/2025"),
+            # Trùng cặp ngày với dòng 2
+            ("Feb 2", "01/02/2025", "28/02/2025"),
+            ("Bad", "01/01/2025", "10/01/2025"),
+            # Trùng dòng bị loại: cùng lý do
+            ("Bad", "01/01/2025", "10/01/2025"),
+        ]
+    )
+    accepted, rejected = validate_periods(candidates, existing)
+
+    assert accepted["period_name"].tolist() == ["Feb"]
+    assert rejected["Row"].tolist() == [3, 4, 5, 6]
+    assert rejected["Reason"].tolist() == [
+        "Duplicate of row 2",
+        "Period already exists",
+        "Overlaps with an existing period",
+        "Overlaps with an existing period",
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_same_as_adding_one_by_one(seed):
+    rng = np.random.default_rng(seed)
+    base = pd.Timestamp("2025-01-01")
+    rows = []
+    for i in range(200):
+        start = base + pd.Timedelta(days=int(rng.integers(0, 365)))
+        end = start + pd.Timedelta(days=int(rng.integers(-2, 20)))
+        name = f"P{rng.integers(0, 150)}"
+        rows.append((name, start.strftime("%d/%m/%Y"), end.strftime("%d/%m/%Y")))
+    candidates = to_frame(rows)
+    existing = [("Old", datetime.date(2025, 6, 1), datetime.date(2025, 6, 10))]
+
+    accepted, _ = validate_periods(candidates, existing)
+
+    assert accepted.index.tolist() == add_one_by_one(candidates, existing)
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import sys
+import types
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.pool import WORKER_MAIN, WorkerPool, map_partitions
+
+
+def get_lengths(values):
+    return np.asarray(values.map(lambda value: len(str(value)), na_action="ignore"), dtype=object)
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        pd.Series(["a", "bb", None, "cccc"], dtype=object),
+        # Giá trị không phải chuỗi: tính trực tiếp, không chuyển sang Arrow
+        pd.Series(["a", 12, 3.5, None, b"xyz"], dtype=object),
+    ],
+)
+def test_map_partitions_same_as_func(values):
+    result = map_partitions(get_lengths, values)
+
+    expected = get_lengths(values)
+    assert len(result) == len(values)
+    assert [None if pd.isna(v) else v for v in result] == [
+        None if pd.isna(v) else v for v in expected
+    ]
+
+
+APP_SCRIPT = """
+import importlib.util
+
+with open({marker!r}, "a") as f:
+    f.write(__name__ + "\\n")
+{spec}
+"""
+
+
+@pytest.mark.parametrize(
+    "spec, runs, copy_on_write",
+    [
+        # Giống streamlit_app.py: worker chỉ import utils.worker (bật copy-on-write)
+        (f"__spec__ = importlib.util.find_spec({WORKER_MAIN!r})", ["__main__"], True),
+        # Không có __spec__: worker chạy lại script khi khởi động
+        ("", ["__main__", "__mp_main__"], False),
+    ],
+)
+def test_worker_does_not_rerun_app_script(tmp_path, monkeypatch, spec, runs, copy_on_write):
+    # Giống Streamlit: script chạy trong một module mới đặt vào sys.modules["__main__"]
+    marker = tmp_path / "runs.txt"
+    script = tmp_path / "app.py"
+    script.write_text(APP_SCRIPT.format(marker=str(marker), spec=spec))
+
+    main = types.ModuleType("__main__")
+    main.__file__ = str(script)
+    exec(compile(script.read_text(), str(script), "exec"), main.__dict__)
+    monkeypatch.setitem(sys.modules, "__main__", main)
+
+    context = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    pool = WorkerPool(max_workers=1, mp_context=context)
+    try:
+        assert pool.submit(os.getpid).result() != os.getpid()
+        assert pool.submit(partial(pd.get_option, "mode.copy_on_write")).result() is copy_on_write
+    finally:
+        pool.shutdown()
+
+    assert marker.read_text().split() == runs
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.rules import FIRST, LEFTMOST, RuleSet, compile_rules
+
+RULES = [("gold", "Gold"), ("ensure", "Ensure"), ("ensure gold", "Ensure Gold")]
+
+
+def replace_loop(text, rules):
+    # Vòng lặp cũ: "for old, new in map.items(): if old in x: x = new"
+    for old, new in rules:
+        if old in text:
+            text = new
+    return text
+
+
+@pytest.mark.parametrize(
+    "text, first, leftmost",
+    [
+        # Rule đứng trước trong list thắng / rule xuất hiện sớm nhất trong chuỗi thắng
+        ("sữa ensure gold", "Gold", "Ensure"),
+        ("gold ensure", "Gold", "Gold"),
+        ("ensure 850g", "Ensure", "Ensure"),
+        ("grow", None, None),
+    ],
+)
+def test_lookup_priority(text, first, leftmost):
+    rules = RuleSet(RULES)
+
+    assert rules.lookup(text, priority=FIRST) == first
+    assert rules.lookup(text, priority=LEFTMOST) == leftmost
+
+
+def test_lookup_leftmost_tie_follows_list_order():
+    # Nhiều rule bắt đầu cùng vị trí: rule đứng trước trong list thắng (như regex "k1|k2")
+    assert RuleSet(RULES[1:]).lookup("ensure gold", LEFTMOST) == "Ensure"
+    assert RuleSet(RULES[:0:-1]).lookup("ensure gold", LEFTMOST) == "Ensure Gold"
+
+
+def test_lookup_unknown_priority():
+    with pytest.raises(ValueError, match="Unknown priority"):
+        RuleSet(RULES).lookup("gold", priority="last")
+
+
+@pytest.mark.parametrize(
+    "text", ["a", "b", "c", "ab", "xc", "cba", "hue", "dac lak", "thua thien hue", "d"]
+)
+def test_chain_matches_replace_loop(text):
+    rules = [("a", "bc"), ("b", "d"), ("c", "e"), ("hue", "thua thien hue"), ("dac", "dak")]
+
+    result = RuleSet(rules, chain=True).lookup(text, default=text)
+
+    assert result == replace_loop(text, rules)
+
+
+def test_match_series():
+    values = pd.Series(["sữa ensure gold", None, "grow", "sữa ensure gold"], index=[3, 1, 2, 0])
+
+    result = RuleSet(RULES).match(values, priority=LEFTMOST, default=np.nan)
+
+    assert result.index.tolist() == [3, 1, 2, 0]
+    assert result.tolist()[0] == "Ensure"
+    assert result.tolist()[3] == "Ensure"
+    assert result.isna().tolist() == [False, True, True, False]
+
+
+def test_compile_rules_cached_by_content():
+    rules = compile_rules(dict(RULES))
+
+    assert compile_rules(list(RULES)) is rules
+    assert compile_rules(dict(RULES), chain=True) is not rules
+    assert compile_rules(RULES[::-1]) is not rules
@@ -0,0 +1,101 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Automaton Aho–Corasick: tìm các key xuất hiện trong một chuỗi chỉ với một lần quét,
+    thời gian quét không phụ thuộc vào số lượng key.
+
+    Key được đánh số theo thứ tự trong list (index nhỏ hơn = ưu tiên cao hơn).
+    """
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+
+        # Trie: goto[node][ch] -> node, out[node] = các index key kết thúc tại node
+        self._goto = [{}]
+        self._out = [[]]
+        self._depth = [0]
+        for index, key in enumerate(self.keys):
+            node = 0
+            for ch in key:
+                if ch not in self._goto[node]:
+                    self._goto[node][ch] = len(self._goto)
+                    self._goto.append({})
+                    self._out.append([])
+                    self._depth.append(self._depth[node] + 1)
+                node = self._goto[node][ch]
+            self._out[node].append(index)
+
+        # Fail link (BFS): node có hậu tố dài nhất cũng là một tiền tố trong trie
+        self._fail = [0] * len(self._goto)
+        queue = deque()
+        for child in self._goto[0].values():
+            self._out[child] = self._out[child] + self._out[0]
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+        # Chỉ cần key ưu tiên cao nhất kết thúc tại mỗi node
+        self._best = [min(out, default=None) for out in self._out]
+
+        # Key dài nhất (bắt đầu sớm nhất) kết thúc tại mỗi node, cùng độ dài thì index nhỏ hơn
+        self._longest = [
+            min(((-len(self.keys[i]), i) for i in out), default=None)
+            for out in self._out
+        ]
+
+    def find_first(self, text):
+        """
+        Index nhỏ nhất (theo thứ tự keys) trong các key có trong text, None nếu không có.
+        """
+        goto, fail, best_at = self._goto, self._fail, self._best
+
+        best = best_at[0]
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            found = best_at[node]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+
+        return best
+
+    def find_leftmost(self, text):
+        """
+        Index của key xuất hiện sớm nhất trong text (cùng vị trí bắt đầu thì ưu tiên
+        theo thứ tự keys, giống regex "k1|k2|..."), None nếu không có.
+        """
+        goto, fail, depth, longest_at = self._goto, self._fail, self._depth, self._longest
+
+        best = None if longest_at[0] is None else (0, longest_at[0][1])
+        node = 0
+        for end, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            # Các match về sau đều bắt đầu từ vị trí của node hiện tại trở đi
+            if best is not None and end + 1 - depth[node] > best[0]:
+                break
+
+            found = longest_at[node]
+            if found is not None:
+                candidate = (end + 1 + found[0], found[1])
+                if best is None or candidate < best:
+                    best = candidate
+
+        return None if best is None else best[1]
@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+import streamlit as st
+from pandas.api.types import is_datetime64_any_dtype
+
+from utils.periods import PeriodIndex
+
+
+CREATED_TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+def parse_created_time(values, errors="coerce"):
+    """
+    Parse cột Created Time (DD/MM/YYYY HH:MM:SS) một lần cho mỗi chuỗi unique.
+    Cột đã ở dạng datetime thì trả về nguyên vẹn.
+    """
+    if is_datetime64_any_dtype(values):
+        return values
+
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(
+        pd.Series(uniques, dtype=object), format=CREATED_TIME_FORMAT, errors=errors
+    ).to_numpy()
+
+    # Thêm NaT ở cuối để code -1 (null) trỏ vào
+    parsed = np.append(parsed, np.datetime64("NaT", "ns"))
+    return pd.Series(parsed[codes], index=values.index, name=values.name)
+
+
+# Các khoảng ngày trong tháng (ngày bắt đầu, ngày kết thúc; None = cuối tháng), theo thứ tự
+DAY_BUCKETS = {
+    "Double Day": (1, 13),
+    "Mid Month": (14, 20),
+    "Pay Day": (21, None),
+}
+
+
+def to_day_keys(values):
+    """
+    Cột datetime -> key ngày (int64, số ngày từ 1970-01-01); NaT -> -1 (không dùng làm key).
+    """
+    days = values.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    return np.where(np.isnat(days), -1, days.astype(np.int64))
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def build_calendar(first_day, last_day, periods=()):
+    """
+    Bảng calendar (dimension theo ngày): mỗi ngày một dòng, từ đầu tháng của first_day
+    đến last_day, thêm một dòng cuối cho ngày trống. Các cột:
+
+    - Created Date, Created Year Month
+    - Day Bucket: Double Day (1-13), Mid Month (14-20), Pay Day (21-EOM)
+    - Timeline: nhãn của Day Bucket kèm ngày, vd: "Double Day (01.05 - 13.05)"
+    - Period: period chứa ngày đó (categorical, "No Period" nếu không thuộc period nào)
+
+    Index là key ngày (xem to_day_keys).
+    """
+    days = pd.date_range(first_day.replace(day=1), last_day, freq="D")
+
+    mm = pd.Index(days.month).astype(str).str.zfill(2)
+    eom = pd.Index(days.days_in_month).astype(str)
+
+    bucket = np.select(
+        [days.day <= 13, days.day <= 20], ["Double Day", "Mid Month"], default="Pay Day"
+    )
+    timeline = np.select(
+        [days.day <= 13, days.day <= 20],
+        [
+            "Double Day (01." + mm + " - 13." + mm + ")",
+            "Mid-Month (14." + mm + " - 20." + mm + ")",
+        ],
+        default="Pay Day (21." + mm + " - " + eom + "." + mm + ")",
+    )
+
+    keys = to_day_keys(pd.Series(days))
+    period_index = PeriodIndex(periods)
+
+    def with_missing(values, missing):
+        return np.append(np.asarray(values, dtype=object), missing)
+
+    return pd.DataFrame(
+        {
+            "Created Date": with_missing(days.date, pd.NaT),
+            "Created Year Month": with_missing(days.strftime("%Y-%m"), np.nan),
+            "Day Bucket": with_missing(bucket, np.nan),
+            "Timeline": with_missing(timeline, np.nan),
+            "Period": pd.Categorical.from_codes(
+                np.append(period_index.get_codes(keys), period_index.no_period),
+                categories=period_index.categories,
+            ),
+        },
+        index=np.append(keys, -1),
+    )
+
+
+def join_calendar(created_time, columns, periods=(), date_range=None):
+    """
+    Các cột calendar cho từng dòng của Created Time: calendar được tạo cho khoảng ngày
+    của dữ liệu, mỗi dòng lấy theo key ngày (không tính lại theo từng dòng).
+
+    date_range (min_date, max_date): khoảng ngày chung của nhiều frame (vd: tất cả các
+    file) để các frame dùng cùng một calendar, được mở rộng nếu không phủ hết dữ liệu.
+    """
+    keys = to_day_keys(created_time)
+    is_missing = keys < 0
+
+    if is_missing.all():
+        first_day = last_day = pd.Timestamp("1970-01-01").date()
+    else:
+        first_day = pd.Timestamp(keys[~is_missing].min(), unit="D").date()
+        last_day = pd.Timestamp(keys[~is_missing].max(), unit="D").date()
+
+    if date_range is not None:
+        min_date, max_date = date_range
+        if is_missing.all():
+            first_day, last_day = min_date, max_date
+        else:
+            first_day, last_day = min(first_day, min_date), max(last_day, max_date)
+
+    calendar = build_calendar(first_day, last_day, periods)
+
+    # Vị trí trong calendar = key - key ngày đầu tiên; ngày trống -> dòng cuối
+    positions = np.where(is_missing, len(calendar) - 1, keys - calendar.index[0])
+    return calendar[columns].iloc[positions].set_axis(created_time.index)
+
+
+def build_calendar_columns(created_time):
+    """
+    Tạo các cột theo ngày (Created Date, Created Year Month, Timeline) từ Created Time.
+
+    Created Time chỉ được parse một lần; các cột còn lại lấy từ bảng calendar theo key
+    ngày.
+    """
+    created_time = parse_created_time(created_time)
+
+    columns = join_calendar(created_time, ["Created Date", "Created Year Month", "Timeline"])
+    columns.insert(0, "Created Time", created_time)
+    return columns
+
+
+@st.cache_data(show_spinner=False)
+def get_default_periods(min_date, max_date):
+    """
+    Các period mặc định (Double Day, Mid Month, Pay Day của từng tháng) từ min_date đến
+    max_date: (tên, ngày bắt đầu, ngày kết thúc), ngày kết thúc không vượt quá max_date.
+    """
+    calendar = build_calendar(min_date, max_date).iloc[:-1]
+
+    bounds = calendar.groupby(["Created Year Month", "Day Bucket"], sort=False)[
+        "Created Date"
+    ].agg(["first", "last"])
+    bounds = bounds[bounds["last"] >= min_date]
+
+    return [
+        (bucket, start, end)
+        for (_, bucket), start, end in zip(bounds.index, bounds["first"], bounds["last"])
+    ]
+
+
+def parse_created_time_expr(dtype, strict=False):
+    """
+    Biểu thức Polars tương ứng với parse_created_time (dtype: kiểu hiện tại của cột
+    Created Time). strict=True: chuỗi sai định dạng gây lỗi (giống errors="raise").
+    """
+    created_time = pl.col("Created Time")
+
+    if isinstance(dtype, pl.Datetime):
+        return created_time.cast(pl.Datetime("ns"))
+
+    return created_time.cast(pl.String).str.strptime(
+        pl.Datetime("ns"), CREATED_TIME_FORMAT, strict=strict
+    )
+
+
+def build_calendar_exprs(dtype):
+    """
+    Biểu thức Polars cho các cột của build_calendar_columns.
+    """
+    created_time = parse_created_time_expr(dtype)
+
+    day = created_time.dt.day()
+    mm = created_time.dt.strftime("%m")
+    eom = created_time.dt.month_end().dt.day()
+
+    timeline = (
+        pl.when(day <= 13)
+        .then(pl.format("Double Day (01.{} - 13.{})", mm, mm))
+        .when(day <= 20)
+        .then(pl.format("Mid-Month (14.{} - 20.{})", mm, mm))
+        .otherwise(pl.format("Pay Day (21.{} - {}.{})", mm, eom, mm))
+    )
+
+    return {
+        "Created Time": created_time,
+        "Created Date": created_time.dt.date(),
+        "Created Year Month": created_time.dt.strftime("%Y-%m"),
+        "Timeline": timeline,
+    }
@@ -0,0 +1,40 @@
+import streamlit as st
+
+
+MIME_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+    "zip": "application/zip",
+}
+
+
+def show_download_button(label, artifact_key, widget_key, file_name, mime, get_data):
+    """
+    Nút download tạo file theo yêu cầu: ban đầu chỉ có nút "Prepare", file chỉ được tạo
+    khi bấm nút. Các file đã tạo (artifact_key, vd: (fingerprint, định dạng)) được
+    cache, các lần rerun sau hiện nút download ngay mà không phải tạo lại. get_data trả
+    về bytes hoặc file đang mở để đọc (được đóng sau khi tạo nút download).
+    """
+    prepared = st.session_state.setdefault("prepared_downloads", set())
+    if artifact_key not in prepared:
+        if not st.button(f"⚙️ Prepare {label}", key=f"prepare_{widget_key}"):
+            return
+        prepared.add(artifact_key)
+
+    with st.spinner(f"Preparing {label}..."):
+        data = get_data()
+
+    try:
+        st.download_button(
+            label=f"📥 Download {label}",
+            data=data,
+            file_name=file_name,
+            mime=mime,
+            key=widget_key,
+        )
+    finally:
+        # get_data trả về file đang mở (vd: file ZIP trên đĩa): đóng sau khi đã đọc
+        if hasattr(data, "close"):
+            data.close()
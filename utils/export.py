@@ -0,0 +1,390 @@
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+from pandas.api.types import (
+    is_bool,
+    is_datetime64_any_dtype,
+    is_float,
+    is_integer,
+    is_scalar,
+)
+
+
+# Số dòng được ghi mỗi lần (chỉ một phần của df được chuyển thành giá trị Python)
+EXCEL_CHUNK_ROWS = 10_000
+
+# Số dòng tối đa dùng để ước lượng độ rộng cột
+WIDTH_SAMPLE_ROWS = 10_000
+
+# Định dạng giống df.to_excel (pandas + xlsxwriter)
+_HEADER_FORMAT = {
+    "bold": True,
+    "align": "center",
+    "valign": "top",
+    "top": 1,
+    "right": 1,
+    "bottom": 1,
+    "left": 1,
+}
+_NUM_FORMATS = {
+    "datetime": "YYYY-MM-DD HH:MM:SS",
+    "date": "YYYY-MM-DD",
+    "timedelta": "0",
+}
+
+# Kiểu nén của file ZIP: tên -> (compression, compresslevel)
+ZIP_COMPRESSIONS = {
+    "Store (no compression)": (zipfile.ZIP_STORED, None),
+    "Deflate (fastest)": (zipfile.ZIP_DEFLATED, 1),
+    "Deflate": (zipfile.ZIP_DEFLATED, 6),
+    "Deflate (smallest)": (zipfile.ZIP_DEFLATED, 9),
+}
+# Zstandard: chỉ có từ Python 3.14
+if hasattr(zipfile, "ZIP_ZSTANDARD"):
+    ZIP_COMPRESSIONS.update(
+        {
+            "Zstandard (fastest)": (zipfile.ZIP_ZSTANDARD, 1),
+            "Zstandard": (zipfile.ZIP_ZSTANDARD, 3),
+            "Zstandard (smallest)": (zipfile.ZIP_ZSTANDARD, 19),
+        }
+    )
+DEFAULT_ZIP_COMPRESSION = "Deflate"
+
+# Thư mục chứa các file ZIP đã tạo, chỉ giữ ZIP_MAX_FILES file mới nhất
+ZIP_DIR = Path(tempfile.gettempdir()) / "cleaning_zip"
+ZIP_MAX_FILES = 8
+
+# Parquet: mỗi tháng (theo cột này, nếu có và các dòng của tháng nằm liền nhau) một row
+# group
+PARQUET_ROW_GROUP_COLUMN = "Created Year Month"
+PARQUET_COMPRESSION = "zstd"
+ARROW_COMPRESSION = "zstd"
+
+_EXCEL_EPOCH = np.datetime64("1899-12-31", "ns")
+_EXCEL_1900_01_01 = np.datetime64("1900-01-01", "D")
+_DAY_NS = 86_400 * 10**9
+
+
+def get_column_widths(df, sample_rows=WIDTH_SAMPLE_ROWS):
+    """
+    Độ rộng của từng cột: độ dài chuỗi lớn nhất (kể cả tên cột) + 2, ước lượng trên tối
+    đa sample_rows dòng cách đều nhau của df.
+    """
+    positions = np.linspace(0, len(df) - 1, min(len(df), sample_rows)).astype(int)
+    sample = df.iloc[np.unique(positions)]
+
+    widths = []
+    for col in range(sample.shape[1]):
+        lengths = sample.iloc[:, col].astype(str).str.len()
+        longest = int(lengths.max()) if len(lengths) else 0
+        widths.append(max(longest, len(str(df.columns[col]))) + 2)
+    return widths
+
+
+def _to_excel_serials(values):
+    # datetime64 -> số ngày kiểu Excel, cùng công thức (và cùng kết quả float) với
+    # xlsxwriter khi ghi từng datetime
+    delta = values.to_numpy(dtype="datetime64[ns]") - _EXCEL_EPOCH
+    ns = delta.astype(np.int64)
+    days, remainder = np.divmod(ns, _DAY_NS)
+    seconds, nanoseconds = np.divmod(remainder, 10**9)
+
+    serials = days + (seconds.astype(float) + (nanoseconds // 1000).astype(float) / 1e6) / (
+        60 * 60 * 24
+    )
+
+    # 1900-01-01 (thứ Hai, tuần ISO đầu tiên của 1900) và lỗi năm nhuận 1900 của Excel
+    dates = values.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    serials = np.where(dates == _EXCEL_1900_01_01, serials - 1, serials)
+    return np.where(serials > 59, serials + 1, serials)
+
+
+def _to_cell(value):
+    # Giống ExcelFormatter._format_value + ExcelWriter._value_with_fmt của pandas:
+    # (giá trị, loại định dạng); None: ô trống
+    if is_scalar(value) and pd.isna(value):
+        return None, None
+    if is_integer(value):
+        return int(value), None
+    if is_float(value):
+        if np.isinf(value):
+            return ("inf" if value > 0 else "-inf"), None
+        return float(value), None
+    if is_bool(value):
+        return bool(value), None
+    if getattr(value, "tzinfo", None) is not None:
+        raise ValueError(
+            "Excel does not support datetimes with timezones. Please ensure that "
+            "datetimes are timezone unaware before writing to Excel."
+        )
+    if isinstance(value, datetime.datetime):
+        return value, "datetime"
+    if isinstance(value, datetime.date):
+        return value, "date"
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds() / 86400, "timedelta"
+    return str(value), None
+
+
+def _prepare_column(values, formats):
+    """
+    Một cột của chunk -> (list giá trị, list định dạng) để ghi từng ô; giá trị None
+    không được ghi.
+    """
+    n = len(values)
+
+    if is_datetime64_any_dtype(values) and getattr(values.dtype, "tz", None) is None:
+        cells = _to_excel_serials(values).astype(object)
+        cells[values.isna().to_numpy()] = None
+        return cells.tolist(), [formats["datetime"]] * n
+
+    kind = values.dtype.kind if isinstance(values.dtype, np.dtype) else None
+    if kind in ("b", "i", "u"):
+        return values.tolist(), [None] * n
+
+    if kind == "f":
+        array = values.to_numpy()
+        cells = array.astype(object)
+        cells[np.isnan(array)] = None
+        cells[np.isposinf(array)] = "inf"
+        cells[np.isneginf(array)] = "-inf"
+        return cells.tolist(), [None] * n
+
+    # Các kiểu khác (object, category, kiểu nullable, ...): từng giá trị như pandas
+    cells = []
+    cell_formats = []
+    for value in values:
+        value, kind = _to_cell(value)
+        cells.append(value)
+        cell_formats.append(None if kind is None else formats[kind])
+    return cells, cell_formats
+
+
+# Các version xlsxwriter đã kiểm tra với _add_table (dùng thuộc tính nội bộ của
+# Worksheet); version khác thì file có bảng được ghi theo cách thông thường
+XLSXWRITER_TABLE_VERSIONS = ("3.2.9",)
+
+
+class _UntrackedCells(dict):
+    # Không ghi nhớ ô nào (xem _add_table)
+    def __setitem__(self, key, value):
+        pass
+
+
+def _add_table(worksheet, last_row, columns, style):
+    # xlsxwriter không cho add_table ở constant_memory mode vì bảng ghi các ô header.
+    # Khi chưa ghi dòng nào, header chỉ nằm ở dòng 0 (dòng đang mở), nên tạm tắt
+    # constant_memory để khai báo bảng, rồi ghi lại header dạng inline string.
+    #
+    # add_table còn lưu từng ô của bảng (chỉ để kiểm tra chồng lấn với bảng / merge
+    # range khác, ở đây không có), tốn bộ nhớ theo số ô: bỏ qua ở constant_memory mode
+    options = {"columns": [{"header": column} for column in columns], "style": style}
+
+    # Version chưa kiểm tra: chỉ dùng API công khai (-3 ở constant_memory mode, file
+    # được ghi lại theo cách thông thường)
+    if xlsxwriter.__version__ not in XLSXWRITER_TABLE_VERSIONS:
+        return worksheet.add_table(0, 0, last_row, len(columns) - 1, options)
+
+    constant_memory = worksheet.constant_memory
+    worksheet.constant_memory = False
+    if constant_memory:
+        worksheet.table_cells = _UntrackedCells()
+    try:
+        status = worksheet.add_table(0, 0, last_row, len(columns) - 1, options)
+    finally:
+        worksheet.constant_memory = constant_memory
+
+    if status == 0 and constant_memory:
+        for col, column in enumerate(columns):
+            worksheet.write_string(0, col, str(column))
+    return status
+
+
+def _write_excel(df, output, constant_memory, table_style, center_columns):
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": constant_memory})
+    worksheet = workbook.add_worksheet("Sheet1")
+
+    formats = {
+        kind: workbook.add_format({"num_format": num_format})
+        for kind, num_format in _NUM_FORMATS.items()
+    }
+    center_format = workbook.add_format({"align": "center"})
+
+    # Auto-adjust columns' width (ước lượng trên một phần các dòng)
+    for col, (column, width) in enumerate(zip(df.columns, get_column_widths(df))):
+        if column in center_columns:
+            worksheet.set_column(col, col, width, center_format)
+        else:
+            worksheet.set_column(col, col, width)
+
+    # Header (và bảng) được tạo trước khi ghi dữ liệu: ở constant_memory mode các dòng
+    # phải được ghi theo thứ tự
+    status = None
+    if table_style is not None:
+        status = _add_table(worksheet, len(df), list(df.columns), table_style)
+        if status != 0 and constant_memory:
+            workbook.close()
+            return False
+
+    # Không có bảng (hoặc không tạo được, vd: df không có dòng nào): header như to_excel
+    if status != 0:
+        header_format = workbook.add_format(_HEADER_FORMAT)
+        for col, column in enumerate(df.columns):
+            worksheet.write(0, col, _to_cell(column)[0], header_format)
+
+    write = worksheet.write
+    for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+        chunk = df.iloc[start : start + EXCEL_CHUNK_ROWS]
+        columns = [
+            _prepare_column(chunk.iloc[:, col], formats) for col in range(chunk.shape[1])
+        ]
+
+        rows = zip(*[cells for cells, _ in columns])
+        row_formats = zip(*[cell_formats for _, cell_formats in columns])
+        for row, (cells, cell_formats) in enumerate(zip(rows, row_formats), start=start + 1):
+            for col, (value, cell_format) in enumerate(zip(cells, cell_formats)):
+                if value is not None:
+                    write(row, col, value, cell_format)
+
+    workbook.close()
+    return True
+
+
+def write_excel(df, table_style=None, center_columns=()):
+    """
+    Ghi df ra file Excel (bytes), giá trị và kiểu dữ liệu của các ô giống df.to_excel
+    (engine xlsxwriter, index=False).
+
+    Các dòng được ghi theo chunk ở constant_memory mode của xlsxwriter (mỗi lần chỉ giữ
+    một dòng trong bộ nhớ). table_style: thêm bảng Excel với style này trên toàn bộ dữ
+    liệu; center_columns: các cột được căn giữa.
+    """
+    output = io.BytesIO()
+    if not _write_excel(df, output, True, table_style, center_columns):
+        # Không thêm được bảng ở constant_memory mode: ghi lại theo cách thông thường
+        output = io.BytesIO()
+        _write_excel(df, output, False, table_style, center_columns)
+
+    return output.getvalue()
+
+
+def to_csv_bytes(df):
+    """
+    Ghi df ra file CSV (bytes, UTF-8 có BOM để Excel đọc đúng tiếng Việt), không có index.
+    """
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+
+def write_zip(members, compression=DEFAULT_ZIP_COMPRESSION):
+    """
+    Ghi các member (tên, bytes) vào một file ZIP trong ZIP_DIR, trả về đường dẫn của file;
+    compression: tên trong ZIP_COMPRESSIONS.
+
+    members có thể là generator: mỗi member được nén (lần lượt, trong process hiện tại)
+    ngay khi có rồi bỏ đi, file ZIP được ghi thẳng ra đĩa, không giữ trong bộ nhớ.
+    """
+    method, level = ZIP_COMPRESSIONS[compression]
+
+    ZIP_DIR.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".zip", dir=ZIP_DIR)
+    try:
+        with open(fd, "wb") as output:
+            with zipfile.ZipFile(output, "w", method, compresslevel=level) as zf:
+                for name, data in members:
+                    zf.writestr(name, data)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    # Xóa các file cũ (file có thể đang bị session khác xóa)
+    with contextlib.suppress(FileNotFoundError):
+        files = sorted(ZIP_DIR.glob("*.zip"), key=lambda file: file.stat().st_mtime_ns)
+        for old in files[:-ZIP_MAX_FILES]:
+            old.unlink(missing_ok=True)
+
+    return path
+
+
+def _to_arrow_array(values):
+    try:
+        return pa.Array.from_pandas(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Cột object có nhiều kiểu (vd: số và chuỗi): lưu dạng string, giữ các ô trống
+        return pa.Array.from_pandas(values.astype(str).where(values.notna()), type=pa.string())
+
+
+def to_arrow(df):
+    """
+    df (pandas / Polars) -> pa.Table, giữ kiểu dữ liệu của các cột (categorical ->
+    dictionary, datetime, date, int64, bool, ...). Cột object có giá trị nhiều kiểu
+    (vd: Scheme gồm số và chuỗi) không có kiểu Arrow tương ứng, được lưu dạng string.
+    """
+    if isinstance(df, pl.DataFrame):
+        return df.to_arrow()
+
+    arrays = [_to_arrow_array(df.iloc[:, col]) for col in range(df.shape[1])]
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+
+
+def _get_month_slices(table):
+    # Các đoạn dòng liên tiếp cùng tháng (start, length); None nếu dòng của một tháng
+    # không nằm liền nhau (không sắp xếp lại các dòng)
+    codes, _ = pd.factorize(table.column(PARQUET_ROW_GROUP_COLUMN).to_pandas())
+    if not len(codes):
+        return None
+
+    starts = np.flatnonzero(np.diff(codes, prepend=codes[0] - 1))
+    if len(starts) != len(np.unique(codes)):
+        return None
+
+    return zip(starts, np.diff(np.append(starts, len(codes))))
+
+
+def write_parquet(df):
+    """
+    Ghi df ra file Parquet (bytes, nén zstd), giữ kiểu dữ liệu và thứ tự của các dòng.
+
+    Có cột Created Year Month và các dòng của mỗi tháng nằm liền nhau (vd: file sắp xếp
+    theo Created Time): mỗi tháng một row group, để đọc dữ liệu của một tháng chỉ cần đọc
+    row group của tháng đó.
+    """
+    table = to_arrow(df)
+
+    month_slices = None
+    if PARQUET_ROW_GROUP_COLUMN in table.column_names:
+        month_slices = _get_month_slices(table)
+
+    sink = pa.BufferOutputStream()
+    with pq.ParquetWriter(sink, table.schema, compression=PARQUET_COMPRESSION) as writer:
+        if month_slices is not None:
+            for start, length in month_slices:
+                writer.write_table(table.slice(start, length))
+        else:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def write_arrow(df):
+    """
+    Ghi df ra file Arrow IPC (bytes, định dạng file / Feather V2, nén zstd), giữ kiểu dữ
+    liệu của các cột.
+    """
+    # Định dạng file không cho các chunk có dictionary khác nhau
+    table = to_arrow(df).unify_dictionaries()
+
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+    with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,613 @@
+import re
+import threading
+import unicodedata
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from utils.pipeline import StageMemo
+from utils.pool import map_partitions, use_partitions
+from utils.rules import FIRST, LEFTMOST, compile_rules, get_compiled
+
+
+## PRODUCT NAME ##
+
+BRACKET_PATTERN = re.compile(r"\[(.*?)\]")
+
+
+def normalize_text(text):
+    """
+    Chuẩn hóa Unicode NFC (tên TikTok có thể ở dạng NFD, vd: "LỐC", "TẶNG" tách dấu).
+    """
+    return unicodedata.normalize("NFC", text)
+
+
+class ProductNames:
+    """
+    Các dạng chuẩn hóa của cột Product Name, tính một lần cho mỗi tên unique và dùng
+    chung cho mọi extractor:
+
+    - names: tên đã chuẩn hóa NFC
+    - upper, lower: tên viết hoa / viết thường
+    - brackets (+ brackets_upper, brackets_lower): các cụm [...] theo thứ tự xuất hiện,
+      index (vị trí tên unique, thứ tự cụm)
+
+    Giá trị null được gom vào một dòng NaN ở cuối để mọi extractor xử lý như một tên.
+    """
+
+    def __init__(self, product_names):
+        self.index = product_names.index
+
+        codes, uniques = pd.factorize(product_names)
+        self.codes = np.where(codes < 0, len(uniques), codes)
+
+        self.names = pd.Series([*uniques, np.nan], dtype=object).str.normalize("NFC")
+        self.upper = self.names.str.upper()
+        self.lower = self.names.str.lower()
+
+        self.brackets = self.names.str.extractall(BRACKET_PATTERN)[0]
+        self.brackets_upper = self.brackets.str.upper()
+        self.brackets_lower = self.brackets.str.lower()
+
+    def subset(self, positions):
+        """
+        View chỉ gồm các tên unique tại positions, dùng lại các dạng đã chuẩn hóa.
+        """
+        subset = ProductNames.__new__(ProductNames)
+        subset.index = pd.RangeIndex(len(positions))
+        subset.codes = np.arange(len(positions))
+
+        subset.names = self.names.iloc[positions].reset_index(drop=True)
+        subset.upper = self.upper.iloc[positions].reset_index(drop=True)
+        subset.lower = self.lower.iloc[positions].reset_index(drop=True)
+
+        # Các cụm [...] của các tên được chọn, đánh lại vị trí theo subset
+        name_positions = self.brackets.index.get_level_values(0)
+        is_selected = name_positions.isin(positions)
+
+        new_positions = np.full(len(self.names), -1)
+        new_positions[positions] = np.arange(len(positions))
+
+        brackets_index = pd.MultiIndex.from_arrays(
+            [
+                new_positions[name_positions[is_selected]],
+                self.brackets.index.get_level_values(1)[is_selected],
+            ],
+            names=self.brackets.index.names,
+        )
+        subset.brackets = self.brackets[is_selected].set_axis(brackets_index)
+        subset.brackets_upper = self.brackets_upper[is_selected].set_axis(brackets_index)
+        subset.brackets_lower = self.brackets_lower[is_selected].set_axis(brackets_index)
+
+        return subset
+
+    def take(self, values, name=None):
+        """
+        Map kết quả tính trên các tên unique (Series/array hoặc DataFrame) về từng dòng.
+        """
+        if isinstance(values, pd.DataFrame):
+            return values.iloc[self.codes].set_axis(self.index)
+
+        values = np.asarray(values, dtype=object)
+        return pd.Series(values[self.codes], index=self.index, dtype=object, name=name)
+
+
+def as_product_names(product_names):
+    if isinstance(product_names, ProductNames):
+        return product_names
+    return ProductNames(product_names)
+
+
+# Số Product Name tối đa được nhớ kết quả cho mỗi extractor (LRU)
+MAX_CACHED_NAMES = 200_000
+
+
+class CompiledExtractor:
+    """
+    Extractor đã compile cho một cấu hình cố định. Kết quả của từng Product Name (NFC)
+    được nhớ lại (LRU, tối đa max_entries tên), nên các lần rerun với cùng cấu hình chỉ
+    extract các tên chưa gặp.
+
+    Nhiều tên chưa gặp (từ PARTITION_MIN_VALUES) thì được chia partition cho các worker
+    process; worker dựng lại extractor từ source qua get_compiled.
+
+    Args:
+        extract_unique (callable): Nhận ProductNames, trả về kết quả cho từng tên unique
+            (array, hoặc DataFrame nếu có columns)
+        columns (list, optional): Tên các cột kết quả
+        source (tuple): (compile_func, *config) đã tạo ra extractor
+        max_entries (int): Số tên tối đa được nhớ kết quả
+    """
+
+    def __init__(self, extract_unique, columns=None, source=(), max_entries=MAX_CACHED_NAMES):
+        self._extract_unique = extract_unique
+        self._columns = columns
+        self._source = source
+        self._results = StageMemo(max_entries)
+        # Extractor dùng chung giữa các session (cache_resource): khóa khi đọc / ghi LRU
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Gửi sang worker: chỉ gửi cấu hình, worker compile lại (một lần mỗi process)
+        return get_compiled, self._source
+
+    def extract(self, product_names, name=None):
+        names = as_product_names(product_names)
+
+        # Key theo tên đã chuẩn hóa, None cho tên null
+        keys = names.names.astype(object).where(names.names.notna(), None).tolist()
+
+        # Kết quả đã nhớ (None: chưa gặp hoặc đã bị đẩy khỏi LRU)
+        with self._lock:
+            results = [self._results.get(key) for key in keys]
+
+        unseen = [i for i, result in enumerate(results) if result is None]
+        if unseen:
+            subset = names.subset(unseen)
+            if use_partitions(len(unseen)):
+                values = map_partitions(partial(_extract_names, self), subset.names)
+            else:
+                values = self._extract_unique(subset)
+            if self._columns is not None:
+                values = values.itertuples(index=False, name=None)
+            values = list(values)
+            with self._lock:
+                for i, value in zip(unseen, values):
+                    results[i] = value
+                    self._results.put(keys[i], value)
+
+        if self._columns is None:
+            return names.take(results, name=name)
+
+        return names.take(pd.DataFrame(results, columns=self._columns, dtype=object))
+
+
+def _extract_names(extractor, product_names):
+    # Chạy trong worker: kết quả cho từng dòng của một partition các tên unique
+    names = ProductNames(product_names)
+    return names.take(extractor._extract_unique(names))
+
+
+def map_unique(values, func):
+    """
+    Áp dụng func (nhận một Series các giá trị unique) rồi map kết quả về từng dòng.
+    Giá trị null luôn trả về None. Nhiều giá trị unique thì func được tính theo partition
+    trong các worker process (func phải pickle được).
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    if use_partitions(len(uniques)):
+        result = map_partitions(func, uniques)
+    else:
+        result = np.asarray(func(uniques), dtype=object)
+
+    # Thêm một ô None ở cuối để code -1 (null) trỏ vào
+    result = np.append(result, None)
+    return pd.Series(result[codes], index=values.index, dtype=object)
+
+
+## BRAND ##
+
+
+def _extract_brands_unique(names, brand_rules):
+    # Brand xuất hiện sớm nhất trong Product Name (lowercase) thắng
+    return brand_rules.match(names.lower, priority=LEFTMOST, default=np.nan)
+
+
+## SIZE ##
+
+# Một token = chuỗi liên tục các ký tự chữ/số/dấu chấm (các ký tự khác coi như khoảng trắng).
+# Token hợp lệ phải chứa cả số và đơn vị (g, kg, ml). Bỏ qua "5g" (case SIMILAC 5G).
+SIZE_PATTERN = re.compile(
+    r"(?<![\w.])(?!5g(?![\w.]))(?=[\w.]*\d)(?=[\w.]*(?:g|ml))([\w.]+)",
+    re.IGNORECASE,
+)
+GRAM_PATTERN = re.compile(r"gr\b", re.IGNORECASE)
+ENSURE_237ML_PATTERN = re.compile(r"\b237\s*ml\b")
+
+
+def _extract_sizes_unique(names, outliers_size):
+    # Step 1: Token đầu tiên chứa cả số và đơn vị, chuẩn hóa gr -> g
+    sizes = (
+        names.names.str.extract(SIZE_PATTERN, expand=False)
+        .str.replace(GRAM_PATTERN, "g", regex=True)
+        .str.lower()
+    )
+
+    # Step 2: Special logic cho Ensure 237ml
+    is_ensure_237ml = names.lower.str.contains(
+        "ensure", regex=False, na=False
+    ) & names.lower.str.contains(ENSURE_237ML_PATTERN, regex=True, na=False)
+    is_original = names.lower.str.contains("original", regex=False, na=False)
+
+    # Step 3: Outliers (Glucerna 220ml) chỉ áp dụng khi không extract được size
+    is_outlier = names.names.isin(outliers_size) & sizes.isna()
+
+    return pd.Series(
+        np.select(
+            [is_ensure_237ml & is_original, is_ensure_237ml, is_outlier, sizes.notna()],
+            ["Original 237ml", "Gold 237ml", "220ml", sizes],
+            default=None,
+        ),
+        index=names.names.index,
+        dtype=object,
+    )
+
+
+## FORMAT ##
+
+
+def determine_format_types(sizes):
+    """
+    Liquid Milk nếu Size chứa "ml", Milk Powder nếu chứa "g", còn lại No format.
+    """
+    sizes_lower = sizes.astype(str).str.lower()
+
+    return pd.Series(
+        np.select(
+            [
+                sizes_lower.str.contains("ml", regex=False),
+                sizes_lower.str.contains("g", regex=False),
+            ],
+            ["Liquid Milk", "Milk Powder"],
+            default="No format",
+        ),
+        index=sizes.index,
+        dtype=object,
+        name="Format",
+    )
+
+
+## SCHEME ##
+
+SCHEME_NO_LIQUID_SIZE = "Không extract được scheme do không tìm thấy liquid size"
+
+
+def _to_int(values):
+    # int() trên các giá trị unique (hỗ trợ cả chữ số unicode như Python int())
+    return values.map({value: int(value) for value in values.dropna().unique()})
+
+
+def _extract_schemes_unique(names, brand, size):
+    names_upper = names.upper
+
+    # === 1. COMBO: lấy 5 ký tự sau "COMBO " ===
+    combo_tail = names_upper.str.extract(r"COMBO(.{0,6})", flags=re.DOTALL, expand=False)
+    has_combo = combo_tail.notna()
+    after_combo = combo_tail.str[1:6]
+    first_char = after_combo.str[:1]
+
+    is_decimal = first_char.str.isdecimal().eq(True)
+    combo_qty = _to_int(first_char.where(is_decimal)).fillna(1).astype(int)
+
+    # Ký tự "số" nhưng không convert được sang int (vd: "²") thì coi như lỗi -> 1
+    is_invalid_combo = (after_combo.str.len() == 0) | (
+        first_char.str.isdigit().eq(True) & ~is_decimal
+    )
+    has_combo_loc = after_combo.str.contains("LỐC", regex=False, na=False)
+
+    brand_divisor = np.select(
+        [brand == "Glucerna", brand == "Ensure"], [5, 4], default=12
+    )
+
+    # === 2. LỐC (không có COMBO): số cuối cùng trong 10 ký tự trước "LỐC" ===
+    before_loc = names_upper.str.extract(r"^(.*?)LỐC", flags=re.DOTALL, expand=False)
+    has_loc = before_loc.notna() & ~has_combo
+    loc_qty = (
+        _to_int(before_loc.str[-10:].str.extract(r"(\d+)\D*$", expand=False))
+        .fillna(1)
+        .astype(int)
+    )
+
+    size_upper = size.astype(str).str.upper()
+    is_size_12 = size_upper.str.contains("110ML|180ML", regex=True, na=False)
+    is_size_4 = size_upper.str.contains("237ML|220ML", regex=True, na=False)
+
+    scheme = np.select(
+        [
+            names_upper.isna(),
+            has_combo & is_invalid_combo,
+            has_combo & has_combo_loc,
+            has_combo,
+            has_loc & is_size_12,
+            has_loc & is_size_4,
+            has_loc,
+        ],
+        [
+            1,
+            1,
+            (combo_qty / brand_divisor).astype(object),
+            combo_qty.astype(object),
+            (loc_qty / 12).astype(object),
+            (loc_qty / 4).astype(object),
+            SCHEME_NO_LIQUID_SIZE,
+        ],
+        default=1,
+    )
+
+    return pd.Series(scheme, index=names.names.index, dtype=object)
+
+
+## CLEAN SKU ##
+
+
+def _build_clean_skus_unique(names, brand, size):
+    brand = brand.astype(str).str.strip()
+    size = size.astype(str).str.strip()
+    name = names.names.astype(str)
+    name_lower = names.lower
+
+    # ===== STEP 1: SKU nền (cột E trong Excel) =====
+    base_sku = brand + " " + size
+    base_sku = base_sku.mask(
+        (base_sku == "Ensure 800g")
+        & name_lower.str.contains("ít ngọt", regex=False, na=False),
+        "Ensure Low Sugar Vanilla 800g",
+    )
+
+    # ===== STEP 2: Clean SKU (phần tên sau "Abbott Grow" / "Similac ") =====
+    is_powder = name_lower.str.contains("bột", regex=False, na=False)
+    grow_suffix = name.str.extract(r"Abbott Grow.?(.*)", flags=re.DOTALL, expand=False)
+    similac_suffix = name.str.extract(r"Similac (.*)", flags=re.DOTALL, expand=False)
+
+    clean_sku = pd.Series(
+        np.select(
+            [
+                (brand == "Grow") & is_powder & grow_suffix.notna(),
+                (brand == "Similac") & is_powder & similac_suffix.notna(),
+            ],
+            ["Grow " + grow_suffix.str.strip(), "Similac " + similac_suffix.str.strip()],
+            default=base_sku,
+        ),
+        index=name.index,
+        dtype=object,
+    )
+
+    # ===== STEP 3: Special case Glucerna 220ml =====
+    is_glucerna_220ml = clean_sku == "Glucerna 220ml"
+    is_30_chai = name.str.contains("(30 CHAI)", regex=False)
+    clean_sku = clean_sku.mask(is_glucerna_220ml & is_30_chai, "Glucerna 220ml 30 chai")
+    clean_sku = clean_sku.mask(is_glucerna_220ml & ~is_30_chai, "Glucerna 220ml 24 chai")
+
+    return clean_sku
+
+
+## PRODUCT COLUMNS ##
+
+PRODUCT_COLUMNS = ["Brand", "Size", "Format", "Scheme", "Clean 1st SKU"]
+
+
+def _extract_product_columns_unique(names, brand_rules, outliers_size):
+    products = pd.DataFrame(index=names.names.index)
+    products["Brand"] = _extract_brands_unique(names, brand_rules)
+    products["Size"] = _extract_sizes_unique(names, outliers_size)
+    products["Format"] = determine_format_types(products["Size"])
+    products["Scheme"] = _extract_schemes_unique(
+        names, products["Brand"], products["Size"]
+    )
+    products["Clean 1st SKU"] = _build_clean_skus_unique(
+        names, products["Brand"], products["Size"]
+    )
+
+    return products[PRODUCT_COLUMNS]
+
+
+def _compile_product_extractor(brands, outliers_size):
+    # lowercase to original format mapping
+    brand_rules = compile_rules(
+        {normalize_text(brand).lower(): brand for brand in brands}
+    )
+    size_outliers = [normalize_text(name) for name in outliers_size]
+
+    return CompiledExtractor(
+        lambda names: _extract_product_columns_unique(names, brand_rules, size_outliers),
+        columns=PRODUCT_COLUMNS,
+        source=(_compile_product_extractor, brands, outliers_size),
+    )
+
+
+def extract_product_columns(product_names, brands, outliers_size=()):
+    """
+    Tạo các cột Brand, Size, Format, Scheme, Clean 1st SKU (vectorized, tính trên các
+    tên unique).
+
+    - Brand: brand trong danh sách brands xuất hiện sớm nhất trong Product Name
+    - Size: token đầu tiên chứa cả số và đơn vị; Ensure 237ml; outliers_size -> "220ml"
+    - Format: Liquid Milk (ml), Milk Powder (g), No format
+    - Scheme: số sau COMBO (chia số chai/lốc theo Brand nếu có "LỐC"), hoặc số trước
+      "LỐC" chia theo Size (110ml/180ml -> 12, 237ml/220ml -> 4), còn lại 1
+    - Clean 1st SKU: Brand + Size, riêng Grow/Similac bột lấy phần tên sau brand
+
+    Args:
+        product_names (pd.Series | ProductNames): Cột Product Name
+        brands (list): Danh sách brand cần extract
+        outliers_size (list): Các tên sản phẩm được gán "220ml" khi không extract được size
+    """
+    extractor = get_compiled(
+        _compile_product_extractor, list(brands), list(outliers_size)
+    )
+
+    columns = extractor.extract(product_names)
+    columns["Scheme"] = columns["Scheme"].infer_objects()
+
+    return columns
+
+
+## KOL / DEAL ##
+
+NO_KOL = "No KOLs"
+# Phần giữa "DEAL" đầu tiên và "DEAL" tiếp theo (hoặc cuối chuỗi), như split("DEAL")[1]
+DEAL_INFO_PATTERN = re.compile(r"DEAL(.*?)(?:DEAL|\Z)", re.DOTALL)
+
+
+def _extract_kols_unique(names, kol_rules, excludes):
+    # ===== KOL: KOL đầu tiên (theo thứ tự trong list) có trong Product Name =====
+    kol = kol_rules.match(names.upper, priority=FIRST)
+
+    # ===== DEAL: cụm [...] đầu tiên chứa DEAL và không chứa exclude =====
+    keep = names.brackets_upper.str.contains("DEAL", regex=False, na=False)
+    for excl in excludes:
+        keep &= ~names.brackets_lower.str.contains(excl, regex=False, na=False)
+
+    deal_phrase = (
+        names.brackets[keep].groupby(level=0).first().reindex(names.names.index)
+    )
+
+    # Lấy phần sau "DEAL"; "Deal"/"deal" (không viết hoa) thì tách trên chuỗi đã viết hoa
+    deal_info = (
+        deal_phrase.str.extract(DEAL_INFO_PATTERN, expand=False)
+        .where(
+            deal_phrase.str.contains("DEAL", regex=False, na=False),
+            deal_phrase.str.upper().str.extract(DEAL_INFO_PATTERN, expand=False),
+        )
+        .str.strip()
+        .str.upper()
+    )
+
+    return np.select(
+        [kol.notna(), deal_info.notna()], [kol, deal_info], default=NO_KOL
+    )
+
+
+def _compile_kol_extractor(kol_outliers, exclude_outliers):
+    kols = [normalize_text(kol).upper() for kol in kol_outliers]
+    kol_rules = compile_rules(zip(kols, kols))
+    excludes = [normalize_text(excl).lower() for excl in exclude_outliers]
+
+    return CompiledExtractor(
+        lambda names: _extract_kols_unique(names, kol_rules, excludes),
+        source=(_compile_kol_extractor, kol_outliers, exclude_outliers),
+    )
+
+
+def extract_kols(product_names, kol_outliers, exclude_outliers):
+    """
+    Extract KOL cho cả cột Product Name (vectorized, tính trên các tên unique).
+
+    - Có KOL trong kol_outliers: tên KOL viết hoa (ưu tiên theo thứ tự trong list)
+    - Không có KOL: phần sau "DEAL" trong cụm [...] đầu tiên không chứa exclude_outliers
+    - Còn lại: "No KOLs"
+    """
+    extractor = get_compiled(
+        _compile_kol_extractor, list(kol_outliers), list(exclude_outliers)
+    )
+
+    return extractor.extract(product_names, name="KOL")
+
+
+## GIFT ##
+
+NO_GIFT = "NO GIFT"
+AFTER_TANG_PATTERN = re.compile(r"TẶNG(.*)", re.DOTALL)
+
+
+def _after_tang(values):
+    # Phần sau chữ "TẶNG" đầu tiên
+    return values.str.extract(AFTER_TANG_PATTERN, expand=False).str.strip()
+
+
+def _extract_gifts_unique(names, gift_rules):
+    # ===== 1. Gift outliers: key đầu tiên (theo thứ tự trong list) có trong Product Name =====
+    outlier_gift = gift_rules.match(names.names, priority=FIRST)
+
+    # ===== 2. Cụm [...] đầu tiên có chữ "TẶNG" =====
+    brackets_upper = names.brackets_upper
+    gift_bracket = (
+        brackets_upper[brackets_upper.str.contains("TẶNG", regex=False, na=False)]
+        .groupby(level=0)
+        .first()
+        .reindex(names.names.index)
+    )
+
+    # ===== 3. Chữ "TẶNG" ngay trong Product Name =====
+    has_tang = names.upper.str.contains("TẶNG", regex=False, na=False)
+
+    return np.select(
+        [outlier_gift.notna(), gift_bracket.notna(), has_tang],
+        [outlier_gift, _after_tang(gift_bracket), _after_tang(names.upper)],
+        default=NO_GIFT,
+    )
+
+
+def _compile_gift_extractor(gift_outliers):
+    gift_rules = []
+    for key, value in gift_outliers:
+        key, value = normalize_text(key), normalize_text(value)
+
+        # Thẻ quà tặng giữ nguyên value, còn lại bỏ chữ "TẶNG"
+        if "THẺ QUÀ TẶNG" not in key:
+            value = value.upper().replace("TẶNG", "").strip()
+
+        gift_rules.append((key, value))
+
+    gift_rules = compile_rules(gift_rules)
+
+    return CompiledExtractor(
+        lambda names: _extract_gifts_unique(names, gift_rules),
+        source=(_compile_gift_extractor, gift_outliers),
+    )
+
+
+def extract_gifts(product_names, gift_outliers):
+    """
+    Extract Gift cho cả cột Product Name (vectorized, tính trên các tên unique).
+
+    - Có key trong gift_outliers: value tương ứng (ưu tiên theo thứ tự trong list)
+    - Không có: phần sau "TẶNG" trong cụm [...] đầu tiên có "TẶNG", hoặc trong Product Name
+    - Còn lại: "NO GIFT"
+    """
+    extractor = get_compiled(
+        _compile_gift_extractor, [list(gift) for gift in gift_outliers]
+    )
+
+    return extractor.extract(product_names, name="Gift")
+
+
+## WAREHOUSE REGION ##
+
+# Phần trong ngoặc của Warehouse Name chứa key -> region
+CLP_EXCEPTION_IN_BRACKETS = {
+    "q6": "Hồ Chí Minh",
+    "củ chi": "Hồ Chí Minh",
+    "hcm": "Hồ Chí Minh",
+    "tuy hòa": "Phú Yên",
+    "tuy hoà": "Phú Yên",
+    "hn": "Hà Nội",
+}
+
+# Warehouse Name không có ngoặc chứa key -> region
+CLP_EXCEPTION_OUTSIDE = {
+    "hn": "Hà Nội",
+    "đn": "Đà Nẵng",
+    "hcm": "Hồ Chí Minh",
+    "bách hóa sữa bột 2": "Hồ Chí Minh",
+}
+
+
+def _extract_clp_regions_unique(names):
+    # Phần trong cặp ngoặc () đầu tiên
+    hint = names.str.extract(r"\((.*?)\)", expand=False).str.strip()
+    has_brackets = hint.notna()
+
+    in_brackets = compile_rules(CLP_EXCEPTION_IN_BRACKETS).match(hint.str.lower())
+    outside = compile_rules(CLP_EXCEPTION_OUTSIDE).match(names.str.lower())
+
+    return np.select(
+        [has_brackets & in_brackets.notna(), has_brackets, outside.notna()],
+        [in_brackets, hint.str.title(), outside],
+        default=names,
+    )
+
+
+def extract_clp_regions(warehouse_names):
+    """
+    Tạo cột Warehouse Region từ Warehouse Name (vectorized, tính trên các tên unique).
+
+    - Có ngoặc (): region theo CLP_EXCEPTION_IN_BRACKETS, nếu không khớp thì lấy phần
+      trong ngoặc (viết hoa chữ cái đầu)
+    - Không có ngoặc: region theo CLP_EXCEPTION_OUTSIDE, nếu không khớp thì giữ nguyên tên
+    """
+    return map_unique(warehouse_names, _extract_clp_regions_unique).rename(
+        "Warehouse Region"
+    )
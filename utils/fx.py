@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+import streamlit as st
+
+from utils.dates import parse_created_time, parse_created_time_expr
+
+
+# Bảng tỷ giá (date, vnd_per_usd): tỷ giá áp dụng từ ngày date cho đến dòng tiếp theo
+FX_RATES_PATH = "fx_rates.csv"
+
+
+@st.cache_data(show_spinner=False)
+def load_fx_rates(path=FX_RATES_PATH):
+    """
+    Đọc bảng tỷ giá, trả về list các cặp (ngày "YYYY-MM-DD", VND/USD) theo thứ tự ngày.
+    """
+    rates = pd.read_csv(path, parse_dates=["date"]).sort_values("date")
+    if rates.empty:
+        raise ValueError(
+            f"FX rate table {path} is empty: add at least one (date, vnd_per_usd) row"
+        )
+    return [
+        (date.strftime("%Y-%m-%d"), float(rate))
+        for date, rate in zip(rates["date"], rates["vnd_per_usd"])
+    ]
+
+
+def _split_rates(fx_rates):
+    if not len(fx_rates):
+        raise ValueError("FX rate table is empty: add at least one (date, vnd_per_usd) row")
+    dates = np.array([date for date, _ in fx_rates], dtype="datetime64[ns]")
+    rates = np.array([rate for _, rate in fx_rates], dtype=float)
+    return dates, rates
+
+
+def convert_to_usd(amounts, created_time, fx_rates):
+    """
+    Quy đổi amounts (VND) sang USD theo tỷ giá của ngày Created Time (as-of: dòng gần
+    nhất có ngày <= ngày tạo đơn), làm tròn 2 chữ số.
+
+    Tỷ giá được tra một lần cho mỗi ngày unique. Ngày trước dòng đầu tiên dùng tỷ giá
+    đầu tiên, Created Time trống dùng tỷ giá mới nhất. Bảng tỷ giá trống: ValueError.
+    """
+    dates, rates = _split_rates(fx_rates)
+
+    codes, days = pd.factorize(parse_created_time(created_time).dt.normalize())
+    positions = np.searchsorted(dates, days.to_numpy(), side="right") - 1
+
+    # Thêm tỷ giá mới nhất ở cuối để code -1 (null) trỏ vào
+    day_rates = np.append(rates[positions.clip(min=0)], rates[-1])
+    return (amounts / day_rates[codes]).round(2)
+
+
+def convert_to_usd_expr(amount, created_time_dtype, fx_rates):
+    """
+    Biểu thức Polars tương ứng với convert_to_usd (created_time_dtype: kiểu hiện tại của
+    cột Created Time).
+    """
+    dates, rates = _split_rates(fx_rates)
+    dates, rates = pl.Series(dates).dt.date(), pl.Series(rates)
+
+    day = parse_created_time_expr(created_time_dtype).dt.date()
+    positions = (pl.lit(dates).search_sorted(day, side="right").cast(pl.Int64) - 1).clip(
+        lower_bound=0
+    )
+    rate = pl.when(day.is_null()).then(pl.lit(rates[-1])).otherwise(
+        pl.lit(rates).gather(positions)
+    )
+
+    return (amount / rate).round(2)
@@ -0,0 +1,113 @@
+import datetime
+import pickle
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+# Cách mã hóa cột object trong Arrow
+_STRING = b"string"  # str (null: một loại giá trị null)
+_DATE = b"date"  # datetime.date (null: một loại giá trị null)
+_CODES = b"codes"  # Các kiểu khác (vd: int lẫn str): code + danh sách giá trị unique
+
+# Các loại giá trị null của cột object (NaN, None, NaT), khôi phục khi đọc
+_NULLS = {"nan": np.nan, "none": None, "nat": pd.NaT}
+
+
+def _get_null_kind(value):
+    if value is None:
+        return "none"
+    return "nat" if value is pd.NaT else "nan"
+
+
+def _encode_object(values):
+    """
+    Cột object -> (Arrow array, metadata). Chuỗi / ngày được lưu trực tiếp; các cột khác
+    lưu code của từng dòng, chỉ các giá trị unique được pickle.
+    """
+    values = values.to_numpy()
+    isna = pd.isna(values)
+    present = values[~isna]
+    null_kinds = sorted({_get_null_kind(value) for value in values[isna]})
+
+    if len(null_kinds) <= 1:
+        metadata = {b"null": (null_kinds or ["nan"])[0].encode()}
+        types = {type(value) for value in pd.unique(present)}
+
+        if types <= {str}:
+            return pa.array(values, type=pa.string(), mask=isna), {b"kind": _STRING, **metadata}
+        if types == {datetime.date}:
+            return pa.array(values, type=pa.date32(), mask=isna), {b"kind": _DATE, **metadata}
+
+    # Key gồm cả kiểu dữ liệu để 1 và 1.0 không bị gộp
+    uniques = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    codes[~isna] = [uniques.setdefault((type(value), value), len(uniques)) for value in present]
+    values_list = [value for _, value in uniques]
+
+    # Null được đưa vào cuối danh sách unique để giữ đúng loại (NaN / None / NaT)
+    if isna.any():
+        kinds = [_get_null_kind(value) for value in values[isna]]
+        codes[isna] = len(values_list) + pd.Index(null_kinds).get_indexer(kinds)
+        values_list += [_NULLS[kind] for kind in null_kinds]
+
+    return pa.array(codes), {b"kind": _CODES, b"uniques": pickle.dumps(values_list)}
+
+
+def to_ipc(df):
+    """
+    pd.DataFrame -> Arrow IPC stream (bytes). Các cột object được mã hóa để khi đọc lại
+    có đúng kiểu dữ liệu và giá trị (kể cả loại null) như ban đầu.
+    """
+    arrays = []
+    fields = []
+    for name in df.columns:
+        values = df[name]
+        metadata = None
+        if values.dtype == object:
+            array, metadata = _encode_object(values)
+        else:
+            array = pa.Array.from_pandas(values)
+        arrays.append(array)
+        fields.append(pa.field(name, array.type, metadata=metadata))
+
+    table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _decode_object(column, metadata):
+    if metadata[b"kind"] == _CODES:
+        uniques = pickle.loads(metadata[b"uniques"])
+        lookup = np.empty(len(uniques), dtype=object)
+        lookup[:] = uniques
+        return lookup[column.to_numpy()]
+
+    if metadata[b"kind"] == _DATE:
+        values = column.to_pandas(date_as_object=True).to_numpy(dtype=object, copy=True)
+    else:
+        values = column.to_numpy(zero_copy_only=False).astype(object)
+
+    values[column.is_null().to_numpy(zero_copy_only=False)] = _NULLS[metadata[b"null"].decode()]
+    return values
+
+
+def from_ipc(data):
+    """
+    Arrow IPC stream (bytes) của to_ipc -> pd.DataFrame.
+    """
+    table = pa.ipc.open_stream(data).read_all()
+
+    columns = {}
+    for field, column in zip(table.schema, table.columns):
+        column = column.combine_chunks()
+        if field.metadata and b"kind" in field.metadata:
+            columns[field.name] = _decode_object(column, field.metadata)
+        else:
+            columns[field.name] = column.to_pandas()
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(table.num_rows))
@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+from utils.ipc import from_ipc, to_ipc
+from utils.pipeline import Pipeline, StageMemo
+from utils.pool import get_process_pool
+from utils.sku_master import pop_new_products, save_new_products
+from utils.stages import STAGES
+
+
+# Memo các stage của worker process, giữ lại giữa các job (các job của cùng một file luôn
+# chạy trên cùng một worker)
+_worker_memo = StageMemo()
+
+# Số file được gửi cho các worker cùng lúc khi encode (thêm một file chờ sẵn để worker
+# không phải đợi)
+ENCODE_WINDOW = (os.cpu_count() or 1) + 1
+
+
+def build_pipeline(memo, recipe, backend):
+    """
+    Dựng lại pipeline từ recipe (các lần gọi load / define của Pipeline.recipe).
+    """
+    pipeline = Pipeline(memo, backend=backend)
+    for method, name, params in recipe:
+        getattr(pipeline, method)(STAGES[name], **params)
+    return pipeline
+
+
+def _clean_file(recipe, backend):
+    # Worker đọc file từ đường dẫn trong recipe, kết quả trả về dạng Arrow IPC cùng các
+    # SKU mới để process chính lưu vào SKU master
+    pipeline = build_pipeline(_worker_memo, recipe, backend)
+    return to_ipc(pipeline.materialize()), pop_new_products()
+
+
+def materialize_files(pipelines, on_progress=None):
+    """
+    materialize() toàn bộ các pipeline (dict key -> Pipeline), mỗi file một job trong
+    process pool; file đã có kết quả trong memo không phải tính lại.
+
+    on_progress(key, done, total) được gọi mỗi khi một file xong. Trả về dict key -> df.
+    """
+    results = {key: pipeline.lookup() for key, pipeline in pipelines.items()}
+    pending = [key for key, df in results.items() if df is None]
+    done = len(pipelines) - len(pending)
+
+    def finish(key, df):
+        nonlocal done
+        results[key] = df
+        done += 1
+        if on_progress is not None:
+            on_progress(key, done, len(pipelines))
+
+    if not pending:
+        return results
+
+    # Một file: tính trực tiếp, không tốn chi phí gửi kết quả giữa các process
+    if len(pending) == 1:
+        finish(pending[0], pipelines[pending[0]].materialize())
+        return results
+
+    try:
+        # Mỗi file luôn được tính trên cùng một worker (memo của worker giữ các stage)
+        pool = get_process_pool()
+        futures = {
+            pool.submit(
+                _clean_file,
+                pipelines[key].recipe,
+                pipelines[key].backend,
+                pin=pipelines[key].get_source_fingerprint(),
+            ): key
+            for key in pending
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            data, new_products = future.result()
+            save_new_products(new_products)
+            df = from_ipc(data)
+            pipelines[key].store(df)
+            finish(key, df)
+    except BrokenProcessPool:
+        # Worker bị dừng đột ngột: tạo pool mới cho lần sau, các file còn lại tính trực tiếp
+        get_process_pool.clear()
+        for key in pending:
+            if results[key] is None:
+                finish(key, pipelines[key].materialize())
+
+    return results
+
+
+def _encode_file(data, encode):
+    # Worker nhận df dạng Arrow IPC, trả về nội dung file
+    return encode(from_ipc(data))
+
+
+def encode_files(frames, encode):
+    """
+    encode(df) -> bytes cho từng frame (dict key -> df), mỗi frame một job trong process
+    pool; yield (key, bytes) theo thứ tự xong.
+
+    Chỉ tối đa ENCODE_WINDOW frame được gửi đi cùng lúc: bộ nhớ không tăng theo số file,
+    và kết quả được xử lý tiếp (vd: nén vào file ZIP) trong lúc các worker encode các
+    file sau.
+    """
+    # Một file: encode trực tiếp, không tốn chi phí gửi dữ liệu giữa các process
+    if len(frames) == 1:
+        for key, df in frames.items():
+            yield key, encode(df)
+        return
+
+    pending = iter(frames.items())
+    futures = {}
+    done = set()
+    try:
+        pool = get_process_pool()
+
+        def submit(count):
+            for key, df in islice(pending, count):
+                futures[pool.submit(_encode_file, to_ipc(df), encode)] = key
+
+        submit(ENCODE_WINDOW)
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = futures.pop(future)
+                data = future.result()
+                done.add(key)
+                yield key, data
+            submit(len(finished))
+    except BrokenProcessPool:
+        # Worker bị dừng đột ngột: tạo pool mới cho lần sau, các file còn lại encode trực tiếp
+        get_process_pool.clear()
+        futures.clear()
+        for key, df in frames.items():
+            if key not in done:
+                yield key, encode(df)
+    finally:
+        # Dừng giữa chừng (vd: lỗi khi ghi file ZIP): bỏ các job chưa chạy
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+
+
+NO_PERIOD = "No Period"
+
+
+def to_day_numbers(dates):
+    """
+    Các ngày (datetime.date / Timestamp / chuỗi ngày) -> số ngày từ 1970-01-01 (int64).
+    """
+    days = pd.to_datetime(pd.Series(list(dates), dtype=object)).to_numpy()
+    return days.astype("datetime64[D]").astype(np.int64)
+
+
+class PeriodIndex:
+    """
+    Các period (name, start_date, end_date) dưới dạng các khoảng ngày đã sắp xếp, không
+    chồng lấn: starts, ends (số ngày, tính cả hai đầu) và code của tên period.
+
+    Các period chồng lấn nhau: period khai báo sau được ưu tiên.
+    Categories: tên các period theo thứ tự thời gian, cuối cùng là "No Period".
+    """
+
+    def __init__(self, periods):
+        names = [str(name) for name, _, _ in periods]
+        starts = to_day_numbers(start for _, start, _ in periods)
+        ends = to_day_numbers(end for _, _, end in periods)
+
+        # Tô các ngày theo thứ tự khai báo (period sau ghi đè), rồi gom thành các khoảng
+        valid = np.flatnonzero(starts <= ends)
+        if len(valid):
+            first_day = starts[valid].min()
+            owners = np.full(ends[valid].max() - first_day + 1, -1)
+            for i in valid:
+                owners[starts[i] - first_day : ends[i] - first_day + 1] = i
+
+            run_starts = np.flatnonzero(np.diff(owners, prepend=-2))
+            run_ends = np.append(run_starts[1:], len(owners)) - 1
+            run_owners = owners[run_starts]
+
+            is_period = run_owners >= 0
+            self.starts = run_starts[is_period] + first_day
+            self.ends = run_ends[is_period] + first_day
+            run_names = [names[i] for i in run_owners[is_period]]
+        else:
+            self.starts = self.ends = np.array([], dtype=np.int64)
+            run_names = []
+
+        self.categories = list(dict.fromkeys([*run_names, NO_PERIOD]))
+        self.codes = pd.Index(self.categories).get_indexer(run_names)
+        self.no_period = self.categories.index(NO_PERIOD)
+
+    def get_codes(self, day_numbers):
+        """
+        Code của period chứa từng ngày (no_period nếu không thuộc period nào).
+        """
+        if not len(self.starts):
+            return np.full(len(day_numbers), self.no_period)
+
+        positions = np.searchsorted(self.starts, day_numbers, side="right") - 1
+        inside = (positions >= 0) & (day_numbers <= self.ends[positions.clip(min=0)])
+        return np.where(inside, self.codes[positions.clip(min=0)], self.no_period)
+
+
+def assign_periods_expr(created_date, periods):
+    """
+    Biểu thức Polars gán Period cho created_date (biểu thức kiểu pl.Date), giống cột
+    Period của calendar.
+    """
+    index = PeriodIndex(periods)
+    if not len(index.starts):
+        return pl.lit(NO_PERIOD).cast(pl.Enum(index.categories)).alias("Period")
+
+    day = created_date.cast(pl.Int64)
+
+    positions = pl.lit(pl.Series(index.starts, dtype=pl.Int64)).search_sorted(
+        day, side="right"
+    ).cast(pl.Int64) - 1
+    ends = pl.lit(pl.Series(index.ends, dtype=pl.Int64)).gather(positions.clip(lower_bound=0))
+    codes = pl.lit(pl.Series(index.codes, dtype=pl.Int64)).gather(positions.clip(lower_bound=0))
+
+    inside = (positions >= 0) & (day <= ends)
+    code = pl.when(inside.fill_null(False)).then(codes).otherwise(index.no_period)
+
+    categories = pl.Series(index.categories, dtype=pl.String)
+    return pl.lit(categories).gather(code).cast(pl.Enum(index.categories)).alias("Period")
+
+
+# Các cột của file period (và của bảng period khi validate)
+PERIOD_COLUMNS = ["period_name", "start_date", "end_date"]
+PERIOD_DATE_FORMAT = "%d/%m/%Y"
+
+# Đánh dấu tạm các dòng trùng hoàn toàn với một dòng phía trước
+_COPY = object()
+
+
+def _find_overlaps(starts, ends, other_starts, other_ends):
+    # Khoảng [start, end] nào giao với ít nhất một khoảng của other (sắp xếp theo start,
+    # max tích lũy của end để không bỏ sót khoảng dài nằm phía trước)
+    if not len(other_starts):
+        return np.zeros(len(starts), dtype=bool)
+
+    order = np.argsort(other_starts, kind="stable")
+    sorted_starts = other_starts[order]
+    max_ends = np.maximum.accumulate(other_ends[order])
+
+    positions = np.searchsorted(sorted_starts, ends, side="right") - 1
+    return (positions >= 0) & (max_ends[positions.clip(min=0)] >= starts)
+
+
+def _find_file_overlaps(starts, ends, rows):
+    # Các dòng (trong rows) giao với một dòng được giữ phía trước trong file, giống khi
+    # thêm lần lượt từng dòng. Sắp xếp theo start, max tích lũy của end chia các dòng
+    # thành các nhóm giao nhau; chỉ các nhóm có nhiều dòng phải xét theo thứ tự dòng
+    overlaps = np.zeros(len(starts), dtype=bool)
+    if not len(rows):
+        return overlaps
+
+    order = rows[np.argsort(starts[rows], kind="stable")]
+    reach = np.maximum.accumulate(ends[order])
+    groups = np.cumsum(np.append(True, starts[order][1:] > reach[:-1])) - 1
+
+    for group in np.flatnonzero(np.bincount(groups) > 1):
+        kept = []
+        for i in np.sort(order[groups == group]):
+            if _find_overlaps(starts[[i]], ends[[i]], starts[kept], ends[kept])[0]:
+                overlaps[i] = True
+            else:
+                kept.append(i)
+    return overlaps
+
+
+def validate_periods(candidates, existing):
+    """
+    Validate một bảng period mới (period_name, start_date, end_date, theo thứ tự trong
+    file) với các period hiện có, cho toàn bộ bảng trong một lần; kết quả giống khi thêm
+    lần lượt từng dòng theo thứ tự trong file:
+
+    - Giá trị null, ngày sai định dạng (DD/MM/YYYY), start_date > end_date
+    - Trùng hoàn toàn với period đã có: bỏ qua, không báo lỗi (file được đọc lại sau mỗi
+      lần rerun)
+    - Trùng hoàn toàn với một dòng trước đó: cùng kết quả với dòng đó, báo lỗi nếu dòng
+      đó được thêm
+    - Trùng cặp ngày, giao với period hiện có
+    - Giao với một dòng khác của bảng: dòng phía trước (trong file) được giữ lại
+
+    Returns:
+        accepted (pd.DataFrame): Các dòng hợp lệ (ngày dạng Timestamp), giữ index gốc
+        rejected (pd.DataFrame): Row (số thứ tự dòng, từ 1), Period Name, Start Date,
+            End Date, Reason
+    """
+    df = candidates[PERIOD_COLUMNS]
+    reason = pd.Series(None, index=df.index, dtype=object)
+
+    def reject(mask, message):
+        reason[mask & reason.isna()] = message
+
+    starts = pd.to_datetime(df["start_date"], format=PERIOD_DATE_FORMAT, errors="coerce")
+    ends = pd.to_datetime(df["end_date"], format=PERIOD_DATE_FORMAT, errors="coerce")
+
+    reject(df.isna().any(axis=1), "Contains null values")
+    reject(starts.isna() | ends.isna(), "Invalid date (expected DD/MM/YYYY)")
+    reject(starts > ends, "End date must be after start date")
+
+    # Số ngày (chỉ dùng cho các dòng chưa bị loại)
+    pending = reason.isna().to_numpy()
+    start_days = np.zeros(len(df), dtype=np.int64)
+    end_days = np.zeros(len(df), dtype=np.int64)
+    start_days[pending] = starts[pending].to_numpy().astype("datetime64[D]").astype(np.int64)
+    end_days[pending] = ends[pending].to_numpy().astype("datetime64[D]").astype(np.int64)
+
+    existing_names = [str(name) for name, _, _ in existing]
+    existing_starts = to_day_numbers(start for _, start, _ in existing)
+    existing_ends = to_day_numbers(end for _, _, end in existing)
+
+    keys = pd.DataFrame(
+        {"name": df["period_name"].astype(str), "start": start_days, "end": end_days}
+    )
+    existing_keys = pd.DataFrame(
+        {"name": existing_names, "start": existing_starts, "end": existing_ends}
+    )
+
+    def is_in_existing(columns):
+        return pd.Series(
+            pd.MultiIndex.from_frame(keys[columns]).isin(
+                pd.MultiIndex.from_frame(existing_keys[columns])
+            ),
+            index=df.index,
+        )
+
+    # Trùng hoàn toàn với period đã có (vd: file được đọc lại sau mỗi lần rerun): bỏ qua
+    reject(is_in_existing(["name", "start", "end"]), "")
+
+    # Trùng hoàn toàn với một dòng phía trước: cùng kết quả với dòng đó (xử lý ở cuối)
+    unique_keys = keys[reason.isna()]
+    first_rows = unique_keys.index.to_series().groupby(
+        [unique_keys["name"], unique_keys["start"], unique_keys["end"]], sort=False
+    ).transform("first")
+    is_copy = first_rows.ne(first_rows.index).reindex(df.index, fill_value=False)
+    reason[is_copy] = _COPY
+
+    same_dates = keys[reason.isna()].duplicated(["start", "end"]).reindex(
+        df.index, fill_value=False
+    )
+    reject(is_in_existing(["start", "end"]) | same_dates, "Period already exists")
+
+    overlaps = _find_overlaps(start_days, end_days, existing_starts, existing_ends)
+    reject(pd.Series(overlaps, index=df.index), "Overlaps with an existing period")
+
+    overlaps_file = _find_file_overlaps(
+        start_days, end_days, np.flatnonzero(reason.isna().to_numpy())
+    )
+    reject(pd.Series(overlaps_file, index=df.index), "Overlaps with another period in the file")
+
+    # Dòng trùng: dòng đầu tiên được thêm thì báo trùng, bị loại thì cùng lý do
+    copies = first_rows[is_copy]
+    row_numbers = df.index.get_indexer(copies) + 1
+    reason[copies.index] = [
+        f"Duplicate of row {row}" if pd.isna(first) else first
+        for row, first in zip(row_numbers, reason[copies])
+    ]
+
+    accepted = reason.isna()
+    rejected = reason.notna() & reason.ne("")
+
+    accepted_df = pd.DataFrame(
+        {
+            "period_name": df["period_name"][accepted],
+            "start_date": starts[accepted],
+            "end_date": ends[accepted],
+        }
+    )
+    rejected_df = pd.DataFrame(
+        {
+            "Row": np.flatnonzero(rejected.to_numpy()) + 1,
+            "Period Name": df["period_name"][rejected].to_numpy(),
+            "Start Date": df["start_date"][rejected].to_numpy(),
+            "End Date": df["end_date"][rejected].to_numpy(),
+            "Reason": reason[rejected].to_numpy(),
+        }
+    )
+
+    return accepted_df, rejected_df
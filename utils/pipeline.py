@@ -0,0 +1,369 @@
+import hashlib
+from collections import OrderedDict
+from functools import partial
+
+import pandas as pd
+import polars as pl
+
+from utils.polars_backend import map_unique, to_pandas
+from utils.rules import get_config_hash
+
+
+# Pipeline dựa vào copy-on-write của pandas (bật một lần khi khởi động, trong
+# streamlit_app.py và utils/worker.py): các stage chỉ thêm / thay cột, frame gốc, kết quả
+# trong memo và frame sau khi materialize dùng chung bộ nhớ của các cột không đổi
+# (copy(deep=False) là an toàn)
+
+# Số dòng được tính cho mỗi lần preview
+PREVIEW_ROWS = 1000
+
+# Backend tính các stage
+PANDAS = "pandas"
+POLARS = "polars"
+BACKENDS = [PANDAS, POLARS]
+
+
+class Stage:
+    """
+    Một bước của pipeline làm sạch dữ liệu.
+
+    Args:
+        name (str): Tên stage (dùng trong fingerprint, phải duy nhất)
+        func (callable): func(frame, *artifacts, **params), frame là các cột input
+            (chỉ gồm các dòng đang được tính)
+        inputs (list): Các cột / artifact đầu vào
+        optional_inputs (list): Các cột đầu vào chỉ được dùng nếu file có (vd: cột key
+            không phải file nào cũng có)
+        outputs (list, optional): Các cột đầu ra (None = mọi cột func trả về), hoặc tên
+            của artifact nếu artifact=True
+        artifact (bool): Kết quả là một object trung gian (không phải cột của df), luôn
+            được tính trên toàn bộ các dòng
+        polars (callable, optional): Cài đặt cho backend Polars,
+            polars(lf, *artifacts, **params) -> LazyFrame đã thêm / thay các cột output
+            (artifact: object trung gian). Không có thì func được tính trên các giá trị
+            unique của inputs (func phải tính từng dòng độc lập)
+    """
+
+    def __init__(
+        self, name, func, inputs=(), outputs=None, artifact=False, polars=None, optional_inputs=()
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.optional_inputs = list(optional_inputs)
+        self.outputs = None if outputs is None else list(outputs)
+        self.artifact = artifact
+        self.polars = polars
+
+
+class StageMemo:
+    """
+    Bộ nhớ kết quả của các stage, key theo fingerprint; giữ tối đa max_entries kết quả
+    dùng gần nhất.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+
+    def get(self, key):
+        if key not in self._results:
+            return None
+        self._results.move_to_end(key)
+        return self._results[key]
+
+    def put(self, key, result):
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
+
+
+def get_file_fingerprint(path, chunk_size=1 << 20):
+    """
+    Hash nội dung của file (cùng nội dung -> cùng fingerprint, kể cả khi đường dẫn tạm
+    thay đổi sau mỗi lần upload).
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Pipeline:
+    """
+    Pipeline làm sạch dữ liệu của một file: các cột dẫn xuất được khai báo (lazy) và chỉ
+    được tính khi cần, cho cửa sổ preview hoặc cho toàn bộ file khi export.
+
+    Mỗi cột / artifact có một fingerprint kiểu Merkle:
+        hash(tên stage, params, fingerprint của các input) + tên output
+    Kết quả của stage được memo theo fingerprint này (và cửa sổ dòng), nên khi một widget
+    thay đổi, chỉ các stage phụ thuộc vào nó phải tính lại.
+
+    Params bắt đầu bằng "_" không được đưa vào fingerprint (giống st.cache_data).
+
+    Với backend Polars, các stage cần thiết được nối thành một LazyFrame theo thứ tự khai
+    báo và chỉ collect một lần khi materialize; kết quả được chuyển về pandas với kiểu dữ
+    liệu giống backend pandas.
+    """
+
+    def __init__(self, memo, backend=PANDAS):
+        self._memo = memo
+        self.backend = backend
+
+        # Frame gốc (stage đọc file, pl.DataFrame với backend Polars) và thứ tự các cột
+        # sau khi materialize
+        self.df = pd.DataFrame()
+        self.columns = []
+        self._source_key = None
+
+        # Tên cột / artifact -> fingerprint hiện tại
+        self.fingerprints = {}
+
+        # fingerprint -> cột của frame gốc / (stage, params, key, {input: fingerprint})
+        self._source = {}
+        self._definitions = {}
+        self._names = {}
+
+        # Các stage theo thứ tự khai báo (backend Polars)
+        self._stages = []
+
+        # Các lần gọi load / define: (method, tên stage, params), dùng để dựng lại pipeline
+        # ở process khác
+        self.recipe = []
+
+    def _get_inputs(self, stage):
+        # Input -> fingerprint, giữ thứ tự của stage.inputs / optional_inputs
+        inputs = stage.inputs + [
+            name for name in stage.optional_inputs if name in self.fingerprints
+        ]
+        return {name: self.fingerprints[name] for name in inputs}
+
+    def _get_key(self, stage, params):
+        hashed_params = {k: v for k, v in params.items() if not k.startswith("_")}
+        input_fingerprints = list(self._get_inputs(stage).values())
+        return get_config_hash(stage.name, hashed_params, input_fingerprints)
+
+    def load(self, stage, **params):
+        """
+        Chạy stage đọc dữ liệu gốc (hoặc lấy từ memo), các cột trả về là frame gốc.
+        """
+        key = get_config_hash(self._get_key(stage, params), self.backend)
+        self.recipe = [("load", stage.name, params)]
+
+        df = self._memo.get(key)
+        if df is None:
+            if self.backend == POLARS:
+                df = stage.polars(pl.LazyFrame(), **params)
+            else:
+                df = stage.func(pd.DataFrame(), **params)
+            self._memo.put(key, df)
+
+        # Dùng lại frame đã memo, không copy dữ liệu
+        self.df = df if self.backend == POLARS else df.copy(deep=False)
+        self.columns = list(df.columns)
+        self._source_key = key
+
+        for name in df.columns:
+            fingerprint = get_config_hash(key, name)
+            self.fingerprints[name] = fingerprint
+            self._source[fingerprint] = name
+
+        return self.df
+
+    def define(self, stage, **params):
+        """
+        Khai báo stage (lazy): chỉ tính fingerprint của các output, dữ liệu được tính khi
+        materialize.
+        """
+        key = self._get_key(stage, params)
+        definition = (stage, params, key, self._get_inputs(stage))
+        self._stages.append(definition)
+        self.recipe.append(("define", stage.name, params))
+
+        for name in stage.outputs:
+            fingerprint = get_config_hash(key, name)
+            self.fingerprints[name] = fingerprint
+            self._definitions[fingerprint] = definition
+            self._names[fingerprint] = name
+
+            # Cột đã có giữ nguyên vị trí (giống df[name] = ...)
+            if not stage.artifact and name not in self.columns:
+                self.columns.append(name)
+
+    def _is_artifact(self, fingerprint):
+        return fingerprint in self._definitions and self._definitions[fingerprint][0].artifact
+
+    def _compute(self, definition, rows):
+        stage, params, key, input_fingerprints = definition
+
+        if stage.artifact:
+            rows = None
+        memo_key = key if rows is None else get_config_hash(key, rows.start, rows.stop)
+
+        result = self._memo.get(memo_key)
+        if result is None:
+            frame = pd.DataFrame(index=self.df.index if rows is None else self.df.index[rows])
+            artifacts = []
+            for name, fingerprint in input_fingerprints.items():
+                if self._is_artifact(fingerprint):
+                    artifacts.append(self._get(fingerprint))
+                else:
+                    frame[name] = self._get(fingerprint, rows)
+
+            result = stage.func(frame, *artifacts, **params)
+            if isinstance(result, pd.Series):
+                result = result.to_frame(stage.outputs[0])
+            self._memo.put(memo_key, result)
+
+        return result
+
+    def _get(self, fingerprint, rows=None):
+        if fingerprint in self._source:
+            column = self.df[self._source[fingerprint]]
+            return column if rows is None else column.iloc[rows]
+
+        result = self._compute(self._definitions[fingerprint], rows)
+        return result if self._is_artifact(fingerprint) else result[self._names[fingerprint]]
+
+    def _get_polars_artifact(self, fingerprint):
+        stage, params, key, input_fingerprints = self._definitions[fingerprint]
+
+        result = self._memo.get(key)
+        if result is None:
+            result = stage.polars(self._plan(input_fingerprints.values()), **params)
+            self._memo.put(key, result)
+
+        return result
+
+    def _plan(self, fingerprints, rows=None):
+        """
+        LazyFrame tính các cột có fingerprint trong fingerprints (chỉ gồm các stage cần
+        thiết, theo thứ tự khai báo) cho các dòng rows.
+        """
+        needed = set()
+        pending = [fp for fp in fingerprints if fp in self._definitions]
+        while pending:
+            _, _, key, input_fingerprints = self._definitions[pending.pop()]
+            if key not in needed:
+                needed.add(key)
+                pending.extend(
+                    fp
+                    for fp in input_fingerprints.values()
+                    if fp in self._definitions and not self._is_artifact(fp)
+                )
+
+        lf = self.df.lazy()
+        if rows is not None:
+            lf = lf.slice(rows.start, rows.stop - rows.start)
+
+        for stage, params, key, input_fingerprints in self._stages:
+            if key not in needed:
+                continue
+
+            artifacts = [
+                self._get_polars_artifact(fp)
+                for fp in input_fingerprints.values()
+                if self._is_artifact(fp)
+            ]
+            if stage.polars is not None:
+                lf = stage.polars(lf, *artifacts, **params)
+            else:
+                inputs = list(input_fingerprints)
+                lf = map_unique(lf, inputs, partial(stage.func, **params), stage.outputs)
+
+        return lf
+
+    def _materialize_polars(self, columns, rows):
+        # Toàn bộ file: các cột gốc không đổi lấy từ bản pandas của frame gốc (chỉ chuyển
+        # đổi một lần), Polars chỉ tính các cột dẫn xuất
+        source = []
+        if rows is None:
+            source = [name for name in columns if self._source.get(self.fingerprints[name]) == name]
+        derived = [name for name in columns if name not in source]
+
+        df = self._plan([self.fingerprints[name] for name in derived], rows).select(derived)
+        df = df.collect()
+
+        start = 0 if rows is None else rows.start
+        df = to_pandas(df, index=pd.RangeIndex(start, start + df.height))
+        if not source:
+            return df
+
+        key = get_config_hash(self._source_key, PANDAS)
+        source_df = self._memo.get(key)
+        if source_df is None:
+            source_df = to_pandas(self.df)
+            self._memo.put(key, source_df)
+
+        return pd.concat([source_df[source], df], axis=1)[columns]
+
+    def materialize(self, columns=None, rows=None):
+        """
+        Tính các cột (mặc định: tất cả) cho các dòng rows (slice, mặc định: tất cả).
+        """
+        if self.backend == POLARS and columns is not None:
+            return self._materialize_polars(columns, rows)
+
+        if columns is not None:
+            return pd.DataFrame(
+                {name: self._get(self.fingerprints[name], rows) for name in columns}
+            )
+
+        df = self.lookup(rows)
+        if df is not None:
+            return df
+
+        if self.backend == POLARS:
+            df = self._materialize_polars(self.columns, rows)
+        else:
+            df = (self.df if rows is None else self.df.iloc[rows]).copy(deep=False)
+            for name in self.columns:
+                fingerprint = self.fingerprints[name]
+                if self._source.get(fingerprint) != name:
+                    df[name] = self._get(fingerprint, rows)
+
+        self.store(df, rows)
+        return df.copy(deep=False)
+
+    def _get_state(self, rows):
+        return get_config_hash(
+            None if rows is None else [rows.start, rows.stop],
+            [self.fingerprints[name] for name in self.columns],
+        )
+
+    def get_source_fingerprint(self):
+        """
+        Fingerprint của frame gốc (cùng nội dung file, cùng cách đọc -> cùng fingerprint).
+        """
+        return self._source_key
+
+    def get_fingerprint(self):
+        """
+        Fingerprint của toàn bộ kết quả materialize() ở trạng thái hiện tại (cùng
+        fingerprint -> cùng dữ liệu), vd: làm key cho file download.
+        """
+        return self._get_state(None)
+
+    def lookup(self, rows=None):
+        """
+        Kết quả materialize() của trạng thái hiện tại nếu đã có trong memo, None nếu chưa.
+        """
+        df = self._memo.get(self._get_state(rows))
+        return None if df is None else df.copy(deep=False)
+
+    def store(self, df, rows=None):
+        """
+        Lưu kết quả materialize() của trạng thái hiện tại (vd: được tính ở process khác).
+        """
+        self._memo.put(self._get_state(rows), df)
+
+    def preview(self, rows=PREVIEW_ROWS):
+        """
+        Các dòng đầu tiên (đã tính đủ các cột) để hiển thị.
+        """
+        return self.materialize(rows=slice(0, rows))
@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+from pandas._libs.parsers import STR_NA_VALUES
+
+
+# Các chuỗi được đọc là null (giống pandas.read_csv / read_excel)
+NA_VALUES = sorted(STR_NA_VALUES)
+
+_TRUE_VALUES = ["True", "TRUE", "true"]
+_FALSE_VALUES = ["False", "FALSE", "false"]
+
+# Ô ngày giờ của file Excel khi đọc dạng chuỗi
+_EXCEL_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_VALUE_PREFIX = "__value__"
+
+
+def _infer_types(df, string_columns, datetimes=False):
+    """
+    Kiểu dữ liệu của các cột đọc dạng chuỗi, suy ra từ toàn bộ file (giống
+    pandas.read_csv(low_memory=False)): Int64, Float64, Boolean, Datetime (ô ngày giờ
+    của file Excel, datetimes=True) hoặc giữ nguyên String.
+    """
+    columns = [col for col in df.columns if col not in string_columns]
+
+    def parse_datetime(col):
+        return pl.col(col).str.strptime(pl.Datetime("ns"), _EXCEL_DATETIME_FORMAT, strict=False)
+
+    # Kiểm tra tất cả các cột trong một lần đọc dữ liệu
+    checks = {}
+    for i, col in enumerate(columns):
+        nulls = pl.col(col).null_count()
+        checks[f"{i}:int"] = pl.col(col).cast(pl.Int64, strict=False).null_count() == nulls
+        checks[f"{i}:float"] = pl.col(col).cast(pl.Float64, strict=False).null_count() == nulls
+        checks[f"{i}:bool"] = (
+            pl.col(col).is_in(_TRUE_VALUES + _FALSE_VALUES) | pl.col(col).is_null()
+        ).all()
+        if datetimes:
+            checks[f"{i}:datetime"] = parse_datetime(col).null_count() == nulls
+    checks = df.select(**checks).row(0, named=True) if columns else {}
+
+    casts = []
+    for i, col in enumerate(columns):
+        if checks[f"{i}:int"]:
+            casts.append(pl.col(col).cast(pl.Int64))
+        elif checks[f"{i}:float"]:
+            casts.append(pl.col(col).cast(pl.Float64))
+        elif checks[f"{i}:bool"]:
+            casts.append(pl.col(col).is_in(_TRUE_VALUES))
+        elif checks.get(f"{i}:datetime"):
+            casts.append(parse_datetime(col))
+    return df.with_columns(casts)
+
+
+def read_file(file_path, file_extension, string_columns, numeric_columns):
+    """
+    Đọc file bằng Polars, cast cột giống stage read_file của pandas:
+    - string_columns: đọc dạng chuỗi
+    - numeric_columns: cast sang số (lỗi -> null), null -> 0
+    - Bỏ ký tự Tab trong các cột chuỗi
+    """
+    # Đọc mọi cột dạng chuỗi rồi suy ra kiểu trên toàn bộ file (giống pandas)
+    if file_extension == "csv":
+        df = pl.read_csv(file_path, infer_schema=False, null_values=NA_VALUES)
+        df = _infer_types(df, string_columns)
+    else:  # xlsx or xls
+        df = pl.read_excel(file_path, infer_schema_length=0)
+        df = df.with_columns(pl.col(pl.String).replace(NA_VALUES, None))
+        df = _infer_types(df, string_columns, datetimes=True)
+
+    # pandas đọc cột số nguyên có ô trống (kể cả cột trống hoàn toàn) thành float
+    df = df.with_columns(
+        pl.col(col).cast(pl.Float64)
+        for col, dtype in df.schema.items()
+        if dtype.is_integer() and df[col].null_count()
+    )
+
+    df = df.with_columns(
+        (
+            pl.col(col)
+            if df.schema[col].is_numeric() or df.schema[col] == pl.Boolean
+            else pl.col(col).cast(pl.Float64, strict=False)
+        ).fill_null(0)
+        for col in numeric_columns
+    )
+
+    # Remove special characters
+    # - Tab
+    return df.with_columns(pl.col(pl.String).str.replace_all("\t", "", literal=True))
+
+
+def to_pandas(df, index=None):
+    """
+    pl.DataFrame -> pd.DataFrame với kiểu dữ liệu giống pipeline pandas:
+    chuỗi null -> NaN, Date -> object (datetime.date, NaT), Enum -> categorical, Object
+    giữ nguyên giá trị.
+    """
+    columns = {}
+    for series in df.iter_columns():
+        if series.dtype == pl.Date:
+            # Chỉ tạo object date cho các ngày unique (số ngày từ 1970-01-01)
+            codes, days = pd.factorize(series.to_physical().to_numpy())
+            dates = np.empty(len(days) + 1, dtype=object)
+            dates[:-1] = days.astype("int64").astype("datetime64[D]").astype(object)
+            dates[-1] = pd.NaT  # code -1 (null)
+            values = dates[codes]
+        elif isinstance(series.dtype, pl.Enum):
+            values = pd.Categorical.from_codes(
+                series.to_physical().cast(pl.Int64).fill_null(-1).to_numpy(),
+                categories=series.dtype.categories.to_list(),
+            )
+        elif series.dtype == pl.Object:
+            values = np.empty(len(series), dtype=object)
+            values[:] = series.to_list()
+        else:
+            values = series.to_numpy()
+            if series.dtype == pl.String:
+                values = values.astype(object, copy=False)
+                values[series.is_null().to_numpy()] = np.nan
+        columns[series.name] = values
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(df.height) if index is None else index)
+
+
+def _to_polars(name, values):
+    if values.dtype != object:
+        return pl.Series(name, values.to_numpy())
+
+    # Chuỗi lẫn NaN -> String (null được chuyển lại thành NaN trong to_pandas)
+    types = values.map(type)
+    if types[types != str].index.equals(values.index[values.isna() & (types == float)]):
+        return pl.Series(name, values.where(values.notna(), None).tolist(), dtype=pl.String)
+
+    # Các cột object khác (vd: str lẫn None, int lẫn str) giữ nguyên giá trị Python
+    return pl.Series(name, values.tolist(), dtype=pl.Object)
+
+
+def unique_table(lf, columns, func, outputs=None):
+    """
+    Map-over-uniques: func (hàm pandas, tính từng dòng độc lập) chỉ chạy trên các tổ hợp
+    giá trị unique của columns. Trả về pl.DataFrame gồm columns và các cột func trả về
+    (outputs[0] nếu func trả về Series).
+    """
+    uniques = lf.select(columns).unique(maintain_order=True).collect()
+
+    result = func(to_pandas(uniques))
+    if isinstance(result, pd.Series):
+        result = result.to_frame(outputs[0] if outputs else result.name)
+
+    # Cột kết quả có tiền tố để không trùng tên với các cột key
+    return uniques.with_columns(
+        _to_polars(_VALUE_PREFIX + name, result[name]) for name in result.columns
+    )
+
+
+def join_unique(lf, table, columns, outputs):
+    """
+    Gắn các cột outputs của bảng unique_table vào từng dòng (left join theo columns).
+    Cột đã có giữ nguyên vị trí.
+    """
+    values = [_VALUE_PREFIX + name for name in outputs]
+
+    lf = lf.join(
+        table.lazy().select(*columns, *values),
+        on=columns,
+        how="left",
+        nulls_equal=True,
+        maintain_order="left",
+    )
+
+    return lf.with_columns(
+        pl.col(value).alias(name) for value, name in zip(values, outputs)
+    ).drop(values)
+
+
+def map_unique(lf, columns, func, outputs):
+    """
+    Tính các cột outputs bằng func trên các giá trị unique của columns.
+    """
+    return join_unique(lf, unique_table(lf, columns, func, outputs), columns, outputs)
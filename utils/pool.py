@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from utils.ipc import from_ipc, to_ipc
+
+
+# Số giá trị (unique) tối thiểu để chia partition cho các worker; ít hơn thì tính trực
+# tiếp (chi phí gửi dữ liệu / khởi động worker lớn hơn phần tiết kiệm được)
+PARTITION_MIN_VALUES = 20_000
+
+# Module __main__ của các worker (xem utils/worker.py): script của app đặt __spec__ bằng
+# module này để worker mới không chạy lại script khi khởi động
+WORKER_MAIN = "utils.worker"
+
+
+class WorkerPool:
+    """
+    Các worker process, mỗi worker một ProcessPoolExecutor một process.
+
+    Job có pin (vd: fingerprint của file) luôn chạy trên cùng một worker: kết quả các
+    stage trong memo của worker được dùng lại ở các lần sau, và mỗi file chỉ nằm trong bộ
+    nhớ của một worker. Job không có pin được chia lần lượt cho các worker.
+    """
+
+    def __init__(self, max_workers, mp_context):
+        self._executors = [
+            ProcessPoolExecutor(max_workers=1, mp_context=mp_context)
+            for _ in range(max_workers)
+        ]
+        self._pins = {}
+        self._next = count()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, pin=None):
+        with self._lock:
+            if pin is None:
+                index = next(self._next) % len(self._executors)
+            else:
+                # File mới được gán lần lượt cho các worker
+                index = self._pins.setdefault(pin, len(self._pins) % len(self._executors))
+        return self._executors[index].submit(func, *args)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        for executor in self._executors:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+@st.cache_resource(show_spinner=False)
+def get_process_pool():
+    """
+    Process pool dùng chung cho cả app, các worker được giữ lại giữa các lần rerun.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        # Worker được fork từ một server process đã import sẵn các stage
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["utils.parallel"])
+    else:
+        context = multiprocessing.get_context("spawn")
+
+    return WorkerPool(max_workers=os.cpu_count() or 1, mp_context=context)
+
+
+def use_partitions(count):
+    """
+    Có nên chia count giá trị cho các worker không (không chia lồng trong worker).
+    """
+    return (
+        count >= PARTITION_MIN_VALUES
+        and (os.cpu_count() or 1) > 1
+        and multiprocessing.parent_process() is None
+    )
+
+
+def _run_partition(func, shm_name, size, start, stop):
+    # Đọc partition [start, stop) trực tiếp trên shared memory (không copy buffer Arrow)
+    shm = SharedMemory(name=shm_name)
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(shm.buf[:size])).read_all()
+        values = table.column(0).slice(start, stop - start).to_pandas()
+        del table
+    finally:
+        shm.close()
+
+    result = func(values.astype(object))
+    if isinstance(result, pd.DataFrame):
+        return True, to_ipc(result.reset_index(drop=True))
+    return False, to_ipc(pd.DataFrame({"value": np.asarray(result, dtype=object)}))
+
+
+def map_partitions(func, values):
+    """
+    Tính func (nhận một Series chuỗi, trả về array hoặc DataFrame cùng số dòng) trên
+    values theo từng partition trong process pool, ghép kết quả theo đúng thứ tự.
+
+    values được ghi một lần vào shared memory dạng Arrow, mỗi worker đọc phần của mình;
+    func phải pickle được (hàm cấp module, partial, ...). Giá trị null được truyền sang
+    worker dưới dạng None. values có giá trị không phải chuỗi thì func được tính trực tiếp.
+    """
+    try:
+        array = pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return func(values)
+
+    sink = pa.BufferOutputStream()
+    table = pa.table({"value": array})
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    buffer = sink.getvalue()
+
+    shm = SharedMemory(create=True, size=max(buffer.size, 1))
+    try:
+        shm.buf[: buffer.size] = memoryview(buffer).cast("B")
+
+        pool = get_process_pool()
+        bounds = np.linspace(0, len(values), os.cpu_count() + 1).astype(int)
+        futures = [
+            pool.submit(_run_partition, func, shm.name, buffer.size, start, stop)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+            if stop > start
+        ]
+        results = [future.result() for future in futures]
+    except BrokenProcessPool:
+        # Worker bị dừng đột ngột: tạo pool mới cho lần sau, lần này tính trực tiếp
+        get_process_pool.clear()
+        return func(values)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    is_frame = results[0][0]
+    frames = [from_ipc(data) for _, data in results]
+    if is_frame:
+        return pd.concat(frames, ignore_index=True)
+    return np.concatenate([frame["value"].to_numpy(dtype=object) for frame in frames])
@@ -0,0 +1,221 @@
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import streamlit as st
+from deep_translator import GoogleTranslator
+
+from utils.rules import RuleSet
+
+
+# Các tên tỉnh sai chính tả / tiếng nước ngoài -> tên chuẩn (đối chiếu theo thứ tự, có chain)
+OUTLIER_PROVINCE_MAP = {
+    "dac lak": "dak lak",
+    "lau dai dac lac": "dak lak",
+    "tan an": "long an",
+    "hin tin": "binh dinh",
+    "phong thu hang hai": "hai phong",
+    "hue": "thua thien hue",
+    "provinz quang tri": "quang tri",
+    "กรุงฮานอย": "ha noi",
+    "河内": "ha noi",
+    "海防": "hai phong",
+    "胡志明市": "ho chi minh",
+}
+OUTLIER_PROVINCES = ["ha tinh"]
+
+# Compile một lần khi import, không compile lại cho mỗi tỉnh
+OUTLIER_PROVINCE_RULES = RuleSet(list(OUTLIER_PROVINCE_MAP.items()), chain=True)
+
+
+# def remove_vietnamese_accent(text, special_char_map):
+#     """
+#     Loại bỏ dấu tiếng Việt và xử lý các ký tự đặc biệt
+
+#     Args:
+#         text (str): Văn bản cần xử lý
+#         special_char_map (dict, optional): Bảng chuyển đổi ký tự đặc biệt.
+#             Mặc định xử lý chữ 'đ'/'Đ'
+#     """
+
+#     # Loại bỏ dấu
+#     text = unicodedata.normalize("NFD", text)
+#     text = "".join(char for char in text if unicodedata.category(char) != "Mn")
+
+#     # Thay thế các ký tự đặc biệt
+#     for char, replacement in special_char_map.items():
+#         text = text.replace(char, replacement)
+
+#     return text
+
+
+def is_latin(char):
+    """
+    Kiểm tra ký tự có thuộc bảng chữ Latin không
+    """
+    try:
+        return "LATIN" in unicodedata.name(char)
+    except ValueError:
+        return False
+
+
+@st.cache_data
+def remove_vietnamese_accent(text, special_char_map=None):
+    """
+    - Bỏ dấu tiếng Việt (Unicode Latin)
+    - Giữ nguyên chữ không phải Latin (Khmer, Thai, Chinese, ...)
+    - Xử lý ký tự đặc biệt theo map
+    """
+
+    result = []
+
+    for char in text:
+        # Chuẩn hóa NFD để tách dấu
+        decomposed = unicodedata.normalize("NFD", char)
+
+        # Nếu ký tự gốc là Latin → bỏ dấu
+        if is_latin(decomposed[0]):
+            cleaned = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+            result.append(cleaned)
+        else:
+            # Không phải Latin → giữ nguyên
+            result.append(char)
+
+    text = "".join(result)
+
+    # Thay thế ký tự đặc biệt (nếu có)
+    if special_char_map:
+        for char, replacement in special_char_map.items():
+            text = text.replace(char, replacement)
+
+    return text
+
+
+def remove_unnecessary_words(province, outlier_rules, outlier_provinces):
+    """
+    outlier_rules: RuleSet đã compile (chain=True) của các tên tỉnh đặc biệt
+    """
+    # Lowercase để chuẩn hóa
+    province = province.lower()
+
+    # Bước 1: Loại bỏ các từ không cần thiết
+    province = re.sub(r"\b(thanh pho|pho|province|city)\b", "", province)
+
+    # Bước 2: Xử lý các trường hợp đặc biệt Hà Tĩnh (ha tinh))
+    for special_case in outlier_provinces:
+        if special_case in province:
+            province = special_case  # Case Ha Tinh
+        else:
+            province = re.sub(r"\btinh\b", "", province)
+
+    # Bước 3: Xử lý các trường hợp Đắk Lắk (dac lak -> dak lak)
+    province = outlier_rules.lookup(province, default=province)
+
+    # Bước 4: Loại bỏ các ký tự đặc biệt và khoảng trắng
+    province = re.sub(
+        r"[-–]", " ", province
+    )  # Case Thua Thien - Hue and Ba Ria - Vung Tau
+    province = " ".join(province.split())
+
+    return province.title()
+
+
+@st.cache_data
+def clean_province(province):
+    # Bước 1: Loại bỏ dấu tiếng Việt
+    outlier_char_map = {"đ": "d", "Đ": "D", "ð": "d", "Ð": "D"}
+
+    province = remove_vietnamese_accent(province, outlier_char_map)
+
+    # Bước 2: Loại bỏ các từ không cần thiết
+    province = remove_unnecessary_words(
+        province, OUTLIER_PROVINCE_RULES, OUTLIER_PROVINCES
+    )
+
+    return province
+
+
+# Hàm kiểm tra chuỗi có chứa ký tự đặc biệt
+@st.cache_data
+def contains_special_chars(text, include_vietnamese=False):
+    if include_vietnamese:
+        vietnamese_chars = r"[àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ]"
+        cleaned_text = re.sub(vietnamese_chars, "", text)
+        return bool(re.search(r"[^a-zA-Z\s]", cleaned_text))
+    return bool(re.search(r"[^a-zA-Z\s]", text))
+
+
+# Hàm translate các province không phải tiếng việt
+# @st.cache_data
+# def translate_text(text, target_lang="vi", max_retries=10):
+#     translator = GoogleTranslator(target=target_lang)
+#     retries = 0
+
+#     while retries < max_retries:
+#         try:
+#             # Tự động phát hiện và dịch
+#             translated = translator.translate(text)
+#             # time.sleep(0.5)
+#             return {"original": text, "translated": translated}
+
+#         except Exception as e:
+#             retries += 1
+#             print(f"[Retry {retries}/{max_retries}] SSL Error: {e}")
+#             time.sleep(2)  # nghỉ 2s rồi thử lại
+
+#     raise RuntimeError(f"Failed to translate after {max_retries} retries due to SSL errors.")
+
+
+@st.cache_data
+def process_province(text, target_lang="vi"):
+    translator = GoogleTranslator(target=target_lang)
+
+    if contains_special_chars(text, include_vietnamese=False):
+        try:
+            translated = translator.translate(text)
+            if contains_special_chars(translated, include_vietnamese=True):
+                return "Others"
+            return translated
+        except Exception:
+            return "Others"
+    return text
+
+# @st.cache_data
+# def process_province(text):
+#     return (
+#         "Others"
+#         if contains_special_chars(text, include_vietnamese=True)
+#         else text
+#     )
+
+
+def normalize_province_pipeline(province):
+    province = clean_province(province)
+    province = process_province(province)
+    province = clean_province(province)
+    return province
+
+
+def build_province_map_parallel(provinces, max_workers=6):
+    result = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(normalize_province_pipeline, p): p for p in provinces
+        }
+
+        for future in as_completed(futures):
+            p = futures[future]
+            try:
+                result[p] = future.result()
+            except Exception:
+                result[p] = "Others"
+
+    return result
+
+
+def clean_province_column(frame, province_mapping):
+    unique_provinces = frame["Province"].dropna().unique()
+    province_map = build_province_map_parallel(unique_provinces)
+
+    return frame["Province"].map(province_map).map(province_mapping)
@@ -0,0 +1,94 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.automaton import AhoCorasick
+
+
+# Priority khi nhiều rule cùng khớp
+FIRST = "first"  # Rule đứng trước trong list thắng
+LEFTMOST = "leftmost"  # Rule xuất hiện sớm nhất trong chuỗi thắng (giống regex "k1|k2|...")
+
+
+def get_config_hash(*config):
+    """
+    Hash nội dung của một cấu hình (list/tuple/dict/str/số/ngày, thứ tự có ý nghĩa).
+    """
+    payload = json.dumps(config, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def _get_compiled(config_hash, _compile):
+    return _compile()
+
+
+def get_compiled(compile_func, *config):
+    """
+    Registry dùng chung cho cả process: object compile_func(*config) chỉ được tạo một lần
+    cho mỗi cấu hình, cache theo hash nội dung của cấu hình (không theo widget/rerun).
+    """
+    config_hash = get_config_hash(compile_func.__qualname__, *config)
+    return _get_compiled(config_hash, lambda: compile_func(*config))
+
+
+class RuleSet:
+    """
+    Rule set (substring -> value) đã compile thành một automaton Aho–Corasick.
+    Chi phí match không tăng theo số lượng rule.
+    """
+
+    def __init__(self, rules, chain=False):
+        keys = [key for key, _ in rules]
+        values = [value for _, value in rules]
+
+        # chain: value của rule tiếp tục được đối chiếu với các rule phía sau
+        # (giống vòng lặp "for old, new in map.items(): if old in x: x = new")
+        if chain:
+            for i in range(len(rules)):
+                for j in range(i + 1, len(rules)):
+                    if keys[j] in values[i]:
+                        values[i] = values[j]
+
+        self.keys = keys
+        self.values = values
+        self._automaton = AhoCorasick(keys)
+
+    def lookup(self, text, priority=FIRST, default=None):
+        """
+        Value của rule khớp với một chuỗi, default nếu không có rule nào khớp.
+        """
+        if priority == FIRST:
+            index = self._automaton.find_first(text)
+        elif priority == LEFTMOST:
+            index = self._automaton.find_leftmost(text)
+        else:
+            raise ValueError(f"Unknown priority: {priority}")
+
+        return default if index is None else self.values[index]
+
+    def match(self, values, priority=FIRST, default=None):
+        """
+        Vectorized lookup cho cả một Series (mỗi giá trị unique chỉ match một lần).
+        Giá trị null trả về default.
+        """
+        codes, uniques = pd.factorize(values)
+
+        matched = np.empty(len(uniques) + 1, dtype=object)
+        matched[:-1] = [self.lookup(text, priority, default) for text in uniques]
+        matched[-1] = default  # code -1 (null)
+
+        return pd.Series(matched[codes], index=values.index, dtype=object)
+
+
+def compile_rules(rules, chain=False):
+    """
+    Compile rule set (dict hoặc list các cặp (key, value), theo thứ tự ưu tiên).
+    Mỗi rule set chỉ compile một lần, cache theo hash của rule set.
+    """
+    rules = list(rules.items()) if isinstance(rules, dict) else [tuple(rule) for rule in rules]
+
+    return get_compiled(RuleSet, rules, chain)
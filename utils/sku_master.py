@@ -0,0 +1,208 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.extraction import extract_product_columns
+
+
+# SQLite file lưu các SKU đã parse qua các lần chạy trước (đổi bằng biến môi trường
+# SKU_MASTER_PATH, mặc định ở thư mục gốc của app)
+SKU_MASTER_PATH = os.environ.get(
+    "SKU_MASTER_PATH", str(Path(__file__).resolve().parent.parent / "sku_master.sqlite")
+)
+
+# Số giây chờ khi SKU master đang được session khác ghi
+SKU_MASTER_TIMEOUT = 30
+
+# Tăng version khi logic extract thay đổi để bỏ qua các giá trị đã lưu
+SKU_MASTER_VERSION = 2
+
+KEY_COLUMNS = ["SKU ID", "Seller SKU", "Product Name"]
+VALUE_COLUMNS = ["Brand", "Size", "Format", "Scheme", "Clean 1st SKU"]
+
+_TABLE_COLUMNS = ["sku_id", "seller_sku", "product_name", "brand", "size", "format", "scheme", "clean_sku"]
+
+# Các SKU mới được parse trong worker process (worker không ghi SKU master): (path,
+# rules_hash, derived), process chính lưu lại (xem pop_new_products, save_new_products)
+_new_products = []
+
+
+def get_rules_hash(brands, outliers_size):
+    """
+    Hash của cấu hình extract (brand list, size outliers) và version của logic.
+    """
+    payload = json.dumps(
+        [SKU_MASTER_VERSION, list(brands), list(outliers_size)], ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _connect(path, readonly=False):
+    if readonly:
+        return sqlite3.connect(
+            f"{Path(path).resolve().as_uri()}?mode=ro", uri=True, timeout=SKU_MASTER_TIMEOUT
+        )
+
+    conn = sqlite3.connect(path, timeout=SKU_MASTER_TIMEOUT)
+    # WAL: các session đọc không bị chặn khi một session đang ghi
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Các cột giá trị không khai báo kiểu để giữ nguyên int/float/text (vd: Scheme)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sku_master (
+            rules_hash TEXT NOT NULL,
+            sku_id TEXT NOT NULL,
+            seller_sku TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            brand,
+            size,
+            format,
+            scheme,
+            clean_sku,
+            PRIMARY KEY (rules_hash, sku_id, seller_sku, product_name)
+        )
+        """
+    )
+    return conn
+
+
+def _derive(products, brands, outliers_size):
+    products = products.reset_index(drop=True)
+
+    derived = products[KEY_COLUMNS].copy()
+    derived[VALUE_COLUMNS] = extract_product_columns(
+        products["Product Name"], brands, outliers_size
+    )[VALUE_COLUMNS].astype(object)
+
+    return derived
+
+
+def _load(conn, rules_hash):
+    rows = conn.execute(
+        f"SELECT {', '.join(_TABLE_COLUMNS)} FROM sku_master WHERE rules_hash = ?",
+        (rules_hash,),
+    ).fetchall()
+
+    # dtype=object để giữ nguyên kiểu Python của từng giá trị
+    values = np.empty((len(rows), len(_TABLE_COLUMNS)), dtype=object)
+    if rows:
+        values[:] = rows
+
+    return pd.DataFrame(values, columns=KEY_COLUMNS + VALUE_COLUMNS)
+
+
+def _save(conn, rules_hash, derived):
+    rows = [
+        (rules_hash, *row)
+        for row in derived[KEY_COLUMNS + VALUE_COLUMNS]
+        .astype(object)
+        .where(derived.notna(), None)
+        .itertuples(index=False, name=None)
+    ]
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO sku_master (rules_hash, {', '.join(_TABLE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * (len(_TABLE_COLUMNS) + 1))})",
+            rows,
+        )
+
+
+def derive_product_columns(df, brands, outliers_size, path=SKU_MASTER_PATH):
+    """
+    Tạo các cột Brand, Size, Format, Scheme, Clean 1st SKU cho df.
+
+    Các SKU (SKU ID, Seller SKU, Product Name) đã gặp ở các lần chạy trước được lấy từ
+    SKU master; chỉ các SKU mới mới phải parse Product Name, sau đó được lưu lại. Trong
+    worker process SKU master chỉ được đọc, các SKU mới được giữ lại để process chính lưu
+    (xem pop_new_products).
+    File thiếu SKU ID / Seller SKU thì parse trực tiếp Product Name.
+    """
+    if not set(KEY_COLUMNS).issubset(df.columns):
+        return extract_product_columns(df["Product Name"], brands, outliers_size)[VALUE_COLUMNS]
+
+    has_key = df[KEY_COLUMNS].notna().all(axis=1)
+
+    # Key luôn lưu dạng chuỗi (SKU ID có thể chưa được cast sang string)
+    keys = df[KEY_COLUMNS].astype(str)
+    products = keys[has_key].drop_duplicates()
+
+    rules_hash = get_rules_hash(brands, outliers_size)
+    is_worker = multiprocessing.parent_process() is not None
+
+    conn = None
+    try:
+        conn = _connect(path, readonly=is_worker)
+        known = products.merge(_load(conn, rules_hash), how="inner", on=KEY_COLUMNS)
+    except sqlite3.Error:
+        # Không đọc được SKU master (vd: chưa có file) thì parse toàn bộ
+        known = pd.DataFrame(columns=KEY_COLUMNS + VALUE_COLUMNS)
+
+    new_products = products.merge(
+        known[KEY_COLUMNS], how="left", on=KEY_COLUMNS, indicator=True
+    ).query("_merge == 'left_only'")
+    derived = _derive(new_products, brands, outliers_size)
+
+    if is_worker and len(derived):
+        _new_products.append((path, rules_hash, derived))
+
+    if conn is not None:
+        try:
+            if not is_worker and len(derived):
+                _save(conn, rules_hash, derived)
+        except sqlite3.Error:
+            # Không lưu được thì lần sau parse lại, kết quả lần này vẫn đúng
+            pass
+        finally:
+            conn.close()
+
+    dimension = pd.concat([known, derived], ignore_index=True)
+
+    # Các dòng thiếu key không lưu vào master, parse trực tiếp
+    if not has_key.all():
+        missing = _derive(df.loc[~has_key, KEY_COLUMNS], brands, outliers_size)
+        missing[KEY_COLUMNS] = keys[~has_key].to_numpy()
+        dimension = pd.concat(
+            [dimension, missing.drop_duplicates(KEY_COLUMNS)], ignore_index=True
+        )
+
+    result = keys.merge(dimension, how="left", on=KEY_COLUMNS)[VALUE_COLUMNS]
+    result.index = df.index
+
+    # Giữ kiểu dữ liệu như khi extract trực tiếp
+    result["Brand"] = result["Brand"].where(result["Brand"].notna(), np.nan)
+    result["Size"] = result["Size"].astype(object).where(result["Size"].notna(), None)
+    result["Scheme"] = result["Scheme"].astype(object).infer_objects()
+
+    return result
+
+
+def pop_new_products():
+    """
+    Các SKU mới được parse trong process hiện tại (worker) và chưa được lưu, trả về để
+    process chính lưu bằng save_new_products.
+    """
+    new_products = list(_new_products)
+    _new_products.clear()
+    return new_products
+
+
+def save_new_products(new_products):
+    """
+    Lưu các SKU mới (kết quả pop_new_products của worker process) vào SKU master.
+    """
+    for path, rules_hash, derived in new_products:
+        try:
+            conn = _connect(path)
+            try:
+                _save(conn, rules_hash, derived)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # Không lưu được thì lần sau parse lại
+            pass
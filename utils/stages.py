@@ -0,0 +1,309 @@
+import pandas as pd
+import polars as pl
+from pandas.api.types import is_numeric_dtype
+
+from utils import polars_backend
+from utils.dates import (
+    build_calendar_columns,
+    build_calendar_exprs,
+    join_calendar,
+    parse_created_time,
+    parse_created_time_expr,
+)
+from utils.extraction import extract_kols, extract_gifts, extract_clp_regions, NO_KOL
+from utils.fx import convert_to_usd, convert_to_usd_expr
+from utils.periods import assign_periods_expr
+from utils.pipeline import Stage
+from utils.polars_backend import join_unique, unique_table
+from utils.province import clean_province_column
+from utils.sku_master import KEY_COLUMNS, derive_product_columns
+
+
+## SECTION 2: Cast Columns ##
+
+
+def _read_file(
+    frame, _file_path, file_fingerprint, file_extension, string_columns, numeric_columns
+):
+    # Create a dictionary for dtype by setting each column in the list to str
+    dtype_dict = {col: str for col in string_columns}
+
+    if file_extension == "csv":
+        df = pd.read_csv(_file_path, low_memory=False, dtype=dtype_dict)
+    else:  # xlsx or xls
+        df = pd.read_excel(_file_path, dtype=dtype_dict)
+
+    for col in numeric_columns:
+        if not is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    df[numeric_columns] = df[numeric_columns].fillna(0)
+
+    # Remove special characters
+    # - Tab
+    return df.apply(
+        lambda x: x.str.replace("\t", "", regex=False) if x.dtype == "object" else x
+    )
+
+
+def _read_file_polars(
+    lf, _file_path, file_fingerprint, file_extension, string_columns, numeric_columns
+):
+    return polars_backend.read_file(_file_path, file_extension, string_columns, numeric_columns)
+
+
+READ_FILE = Stage("read_file", _read_file, polars=_read_file_polars)
+
+
+## SECTION 3: Clean Columns ##
+
+
+CLEAN_PROVINCE = Stage(
+    "clean_province",
+    clean_province_column,
+    inputs=["Province"],
+    outputs=["Clean Province"],
+)
+
+
+## SECTION 4-5: Brand, Size ##
+
+# Brand, Size, Format, Scheme, Clean 1st SKU được tính cùng lúc (SKU master) cho toàn bộ
+# file; các cột bên dưới chỉ lấy các dòng đang được materialize
+
+def _get_key_columns(columns):
+    # Các cột key mà file có (SKU ID, Seller SKU có thể không có)
+    return [name for name in KEY_COLUMNS if name in columns]
+
+
+PRODUCT_COLUMNS = Stage(
+    "product_columns",
+    lambda frame, brands, outliers_size: derive_product_columns(frame, brands, outliers_size),
+    inputs=["Product Name"],
+    optional_inputs=["SKU ID", "Seller SKU"],
+    outputs=["product_columns"],
+    artifact=True,
+    polars=lambda lf, brands, outliers_size: unique_table(
+        lf,
+        _get_key_columns(lf.collect_schema().names()),
+        lambda frame: derive_product_columns(frame, brands, outliers_size),
+    ),
+)
+
+
+def _join_product_columns(outputs):
+    # Backend Polars: product_columns là bảng các key unique
+    return lambda lf, product_columns: join_unique(
+        lf, product_columns, _get_key_columns(product_columns.columns), outputs
+    )
+
+
+BRAND_SIZE = Stage(
+    "brand_size",
+    lambda frame, product_columns: product_columns.loc[frame.index, ["Brand", "Size"]],
+    inputs=["product_columns"],
+    outputs=["Brand", "Size"],
+    polars=_join_product_columns(["Brand", "Size"]),
+)
+
+
+## SECTION 6: Add NEW COLUMNS ##
+
+
+# Các công thức dùng chung cho cả hai backend (frame: pd.DataFrame, hoặc _Columns với
+# backend Polars)
+
+
+def _calculate_fsp(frame):
+    return (frame["SKU Subtotal Before Discount"] - frame["SKU Seller Discount"]) / frame[
+        "Quantity"
+    ]
+
+
+def _calculate_voucher(frame):
+    return frame["SKU Platform Discount"] / (
+        frame["SKU Subtotal Before Discount"] - frame["SKU Seller Discount"]
+    )
+
+
+class _Columns:
+    # frame["col"] -> pl.col("col")
+    def __getitem__(self, name):
+        return pl.col(name)
+
+
+def _with_expr(func, output):
+    return lambda lf: lf.with_columns(func(_Columns()).alias(output))
+
+
+FSP = Stage(
+    "fsp",
+    _calculate_fsp,
+    inputs=["SKU Subtotal Before Discount", "SKU Seller Discount", "Quantity"],
+    outputs=["FSP"],
+    polars=_with_expr(_calculate_fsp, "FSP"),
+)
+
+FORMAT = Stage(
+    "format",
+    lambda frame, product_columns: product_columns.loc[frame.index, "Format"],
+    inputs=["product_columns"],
+    outputs=["Format"],
+    polars=_join_product_columns(["Format"]),
+)
+
+# Tỷ giá theo ngày tạo đơn (fx_rates: bảng của load_fx_rates)
+SUBTOTAL_USD = Stage(
+    "subtotal_usd",
+    lambda frame, fx_rates: convert_to_usd(
+        frame["SKU Subtotal After Discount"], frame["Created Time"], fx_rates
+    ),
+    inputs=["SKU Subtotal After Discount", "Created Time"],
+    outputs=["SKU Subtotal After Discount (USD)"],
+    polars=lambda lf, fx_rates: lf.with_columns(
+        convert_to_usd_expr(
+            pl.col("SKU Subtotal After Discount"),
+            lf.collect_schema()["Created Time"],
+            fx_rates,
+        ).alias("SKU Subtotal After Discount (USD)")
+    ),
+)
+
+
+def _calendar_polars(outputs):
+    def add_calendar_columns(lf):
+        exprs = build_calendar_exprs(lf.collect_schema()["Created Time"])
+        return lf.with_columns(exprs[name].alias(name) for name in outputs)
+
+    return add_calendar_columns
+
+
+# Created Time được parse một lần, các cột theo ngày tính trên các ngày unique
+DATE = Stage(
+    "date",
+    lambda frame: build_calendar_columns(frame["Created Time"]),
+    inputs=["Created Time"],
+    outputs=["Created Time", "Created Date", "Created Year Month"],
+    polars=_calendar_polars(["Created Time", "Created Date", "Created Year Month"]),
+)
+
+CLP_REGION = Stage(
+    "clp_region",
+    lambda frame: extract_clp_regions(frame["Warehouse Name"]),
+    inputs=["Warehouse Name"],
+    outputs=["Warehouse Region"],
+)
+
+VOUCHER = Stage(
+    "voucher",
+    _calculate_voucher,
+    inputs=["SKU Platform Discount", "SKU Subtotal Before Discount", "SKU Seller Discount"],
+    outputs=["Voucher"],
+    polars=_with_expr(_calculate_voucher, "Voucher"),
+)
+
+TIMELINE = Stage(
+    "timeline",
+    lambda frame: build_calendar_columns(frame["Created Time"]),
+    inputs=["Created Time"],
+    outputs=["Created Time", "Timeline"],
+    polars=_calendar_polars(["Created Time", "Timeline"]),
+)
+
+SCHEME = Stage(
+    "scheme",
+    lambda frame, product_columns: product_columns.loc[frame.index, "Scheme"],
+    inputs=["product_columns"],
+    outputs=["Scheme"],
+    polars=_join_product_columns(["Scheme"]),
+)
+
+CLEAN_1ST_SKU = Stage(
+    "clean_1st_sku",
+    lambda frame, product_columns: product_columns.loc[frame.index, "Clean 1st SKU"],
+    inputs=["product_columns"],
+    outputs=["Clean 1st SKU"],
+    polars=_join_product_columns(["Clean 1st SKU"]),
+)
+
+
+## SECTION 7-8: KOL, Gift ##
+
+# Backend Polars: KOL, Gift, Warehouse Region được tính trên các Product Name /
+# Warehouse Name unique (không khai báo polars)
+
+
+def _extract_kol_columns(frame, kol_outliers, exclude_outliers):
+    kol = extract_kols(frame["Product Name"], kol_outliers, exclude_outliers)
+    return pd.DataFrame({"KOL": kol, "IS KOL": kol.ne(NO_KOL)})
+
+
+KOL = Stage(
+    "kol",
+    _extract_kol_columns,
+    inputs=["Product Name"],
+    outputs=["KOL", "IS KOL"],
+)
+
+GIFT = Stage(
+    "gift",
+    lambda frame, gifts: extract_gifts(frame["Product Name"], gifts),
+    inputs=["Product Name"],
+    outputs=["Gift"],
+)
+
+
+## SECTION 9: Divide Periods ##
+
+
+CREATED_TIME = Stage(
+    "created_time",
+    lambda frame: parse_created_time(frame["Created Time"], errors="raise"),
+    inputs=["Created Time"],
+    outputs=["Created Time"],
+    polars=lambda lf: lf.with_columns(
+        parse_created_time_expr(lf.collect_schema()["Created Time"], strict=True)
+    ),
+)
+
+
+# Period (categorical) lấy từ bảng calendar theo ngày của Created Time. _date_range:
+# khoảng ngày chung của nhiều file (cùng một calendar), không ảnh hưởng kết quả
+PERIOD = Stage(
+    "period",
+    lambda frame, periods, _date_range=None: join_calendar(
+        parse_created_time(frame["Created Time"]), ["Period"], periods, _date_range
+    ),
+    inputs=["Created Time"],
+    outputs=["Period"],
+    polars=lambda lf, periods, _date_range=None: lf.with_columns(
+        assign_periods_expr(
+            parse_created_time_expr(lf.collect_schema()["Created Time"]).dt.date(), periods
+        )
+    ),
+)
+
+
+# Stage theo tên (dựng lại pipeline từ recipe, vd: trong worker process)
+STAGES = {
+    stage.name: stage
+    for stage in [
+        READ_FILE,
+        CLEAN_PROVINCE,
+        PRODUCT_COLUMNS,
+        BRAND_SIZE,
+        FSP,
+        FORMAT,
+        SUBTOTAL_USD,
+        DATE,
+        CLP_REGION,
+        VOUCHER,
+        TIMELINE,
+        SCHEME,
+        CLEAN_1ST_SKU,
+        KOL,
+        GIFT,
+        CREATED_TIME,
+        PERIOD,
+    ]
+}
@@ -0,0 +1,12 @@
+# Module __main__ của các worker process (spawn / forkserver).
+#
+# Worker mới chạy lại module __main__ của process chính khi khởi động; với Streamlit đó là
+# script của app. streamlit_app.py đặt __spec__ bằng module này, nên worker chỉ import
+# các stage (dùng chung với preload của forkserver) mà không chạy lại app.
+
+import pandas as pd
+
+import utils.parallel  # noqa: F401
+
+# Copy-on-write giống process chính (xem streamlit_app.py)
+pd.set_option("mode.copy_on_write", True)
@@ -1,20 +1,23 @@
 import pandas as pd
-from pandas.api.types import is_numeric_dtype
 import streamlit as st
-import re
-import io
 import json
-import unicodedata
 from datetime import datetime
-from calendar import monthrange
-from deep_translator import GoogleTranslator
-import time
+from functools import partial
 import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Extra utilities
 from streamlit_extras.add_vertical_space import add_vertical_space
 
+# Cleaning pipeline (memoized stages)
+from utils.pipeline import BACKENDS, PANDAS, Pipeline, StageMemo, get_file_fingerprint
+from utils import stages
+from utils.dates import get_default_periods
+from utils.fx import load_fx_rates
+from utils.periods import PERIOD_COLUMNS, validate_periods
+from utils.downloads import MIME_TYPES, show_download_button
+from utils.export import to_csv_bytes, write_arrow, write_excel, write_parquet
+from utils.rules import get_config_hash
+
 
 ##################################### SECTION 0-1: Define Functions ######################################
 
@@ -27,245 +30,6 @@ def update_CleanProvince():
     st.session_state.is_CleanProvince = not st.session_state.is_CleanProvince
 
 
-@st.cache_data
-# def remove_vietnamese_accent(text, special_char_map):
-#     """
-#     Loại bỏ dấu tiếng Việt và xử lý các ký tự đặc biệt
-
-#     Args:
-#         text (str): Văn bản cần xử lý
-#         special_char_map (dict, optional): Bảng chuyển đổi ký tự đặc biệt.
-#             Mặc định xử lý chữ 'đ'/'Đ'
-#     """
-
-#     # Loại bỏ dấu
-#     text = unicodedata.normalize("NFD", text)
-#     text = "".join(char for char in text if unicodedata.category(char) != "Mn")
-
-#     # Thay thế các ký tự đặc biệt
-#     for char, replacement in special_char_map.items():
-#         text = text.replace(char, replacement)
-
-#     return text
-def is_latin(char):
-    """
-    Kiểm tra ký tự có thuộc bảng chữ Latin không
-    """
-    try:
-        return "LATIN" in unicodedata.name(char)
-    except ValueError:
-        return False
-
-
-@st.cache_data
-def remove_vietnamese_accent(text, special_char_map=None):
-    """
-    - Bỏ dấu tiếng Việt (Unicode Latin)
-    - Giữ nguyên chữ không phải Latin (Khmer, Thai, Chinese, ...)
-    - Xử lý ký tự đặc biệt theo map
-    """
-
-    result = []
-
-    print(text)
-    for char in text:
-        # Chuẩn hóa NFD để tách dấu
-        decomposed = unicodedata.normalize("NFD", char)
-
-        # Nếu ký tự gốc là Latin → bỏ dấu
-        if is_latin(decomposed[0]):
-            cleaned = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
-            result.append(cleaned)
-        else:
-            # Không phải Latin → giữ nguyên
-            result.append(char)
-
-    text = "".join(result)
-
-    # Thay thế ký tự đặc biệt (nếu có)
-    if special_char_map:
-        for char, replacement in special_char_map.items():
-            text = text.replace(char, replacement)
-
-    print(text)
-    return text
-
-
-@st.cache_data
-def remove_unnecessary_words(province, outlier_province_map, outlier_provinces):
-    # Lowercase để chuẩn hóa
-    province = province.lower()
-
-    # Bước 1: Loại bỏ các từ không cần thiết
-    province = re.sub(r"\b(thanh pho|pho|province|city)\b", "", province)
-
-    # Bước 2: Xử lý các trường hợp đặc biệt Hà Tĩnh (ha tinh))
-    for special_case in outlier_provinces:
-        if special_case in province:
-            province = special_case  # Case Ha Tinh
-        else:
-            province = re.sub(r"\btinh\b", "", province)
-
-    # Bước 3: Xử lý các trường hợp Đắk Lắk (dac lak -> dak lak)
-    for old_name, new_name in outlier_province_map.items():
-        if old_name in province:
-            province = new_name
-
-    # Bước 4: Loại bỏ các ký tự đặc biệt và khoảng trắng
-    province = re.sub(
-        r"[-–]", " ", province
-    )  # Case Thua Thien - Hue and Ba Ria - Vung Tau
-    province = " ".join(province.split())
-
-    return province.title()
-
-
-@st.cache_data
-def clean_province(province):
-    # Bước 1: Loại bỏ dấu tiếng Việt
-    outlier_char_map = {"đ": "d", "Đ": "D", "ð": "d", "Ð": "D"}
-
-    province = remove_vietnamese_accent(province, outlier_char_map)
-
-    # Bước 2: Loại bỏ các từ không cần thiết
-    outlier_province_map = {
-        "dac lak": "dak lak",
-        "lau dai dac lac": "dak lak",
-        "tan an": "long an",
-        "hin tin": "binh dinh",
-        "phong thu hang hai": "hai phong",
-        "hue": "thua thien hue",
-        "provinz quang tri": "quang tri",
-        "กรุงฮานอย": "ha noi",
-        "河内": "ha noi",
-        "海防": "hai phong",
-        "胡志明市": "ho chi minh",
-    }
-    outlier_provinces = ["ha tinh"]
-
-    province = remove_unnecessary_words(
-        province, outlier_province_map, outlier_provinces
-    )
-
-    return province
-
-
-# Hàm kiểm tra chuỗi có chứa ký tự đặc biệt
-@st.cache_data
-def contains_special_chars(text, include_vietnamese=False):
-    if include_vietnamese:
-        vietnamese_chars = r"[àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ]"
-        cleaned_text = re.sub(vietnamese_chars, "", text)
-        return bool(re.search(r"[^a-zA-Z\s]", cleaned_text))
-    return bool(re.search(r"[^a-zA-Z\s]", text))
-
-
-# Hàm translate các province không phải tiếng việt
-# @st.cache_data
-# def translate_text(text, target_lang="vi", max_retries=10):
-#     translator = GoogleTranslator(target=target_lang)
-#     retries = 0
-
-#     while retries < max_retries:
-#         try:
-#             # Tự động phát hiện và dịch
-#             translated = translator.translate(text)
-#             # time.sleep(0.5)
-#             return {"original": text, "translated": translated}
-
-#         except Exception as e:
-#             retries += 1
-#             print(f"[Retry {retries}/{max_retries}] SSL Error: {e}")
-#             time.sleep(2)  # nghỉ 2s rồi thử lại
-
-#     raise RuntimeError(f"Failed to translate after {max_retries} retries due to SSL errors.")
-
-
-@st.cache_data
-def process_province(text, target_lang="vi"):
-    translator = GoogleTranslator(target=target_lang)
-
-    if contains_special_chars(text, include_vietnamese=False):
-        try:
-            translated = translator.translate(text)
-            if contains_special_chars(translated, include_vietnamese=True):
-                return "Others"
-            return translated
-        except Exception:
-            return "Others"
-    return text
-
-# @st.cache_data
-# def process_province(text):
-#     return (
-#         "Others"
-#         if contains_special_chars(text, include_vietnamese=True)
-#         else text
-#     )
-
-
-def normalize_province_pipeline(province):
-    province = clean_province(province)
-    province = process_province(province)
-    province = clean_province(province)
-    return province
-
-
-def build_province_map_parallel(provinces, max_workers=4):
-    result = {}
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(normalize_province_pipeline, p): p for p in provinces
-        }
-
-        for future in as_completed(futures):
-            p = futures[future]
-            try:
-                result[p] = future.result()
-            except Exception:
-                result[p] = "Others"
-
-    return result
-
-
-## SECTION 5 ##
-
-
-@st.cache_data
-def extract_size(product_name):
-    product_name_lower = product_name.lower()
-
-    # ====== SPECIAL LOGIC FOR ENSURE ======
-    if "ensure" in product_name_lower:
-        # Check 237ml
-        if re.search(r"\b237\s*ml\b", product_name_lower):
-            if "original" in product_name_lower:
-                return "Original 237ml"
-            else:
-                return "Gold 237ml"
-
-    # Step 1: Replace special characters (except '.') with spaces
-    cleaned_name = re.sub(r"[^\w\s\.]", " ", product_name)
-
-    # Step 2: Split the cleaned name into individual words
-    words = cleaned_name.split()
-
-    # Step 3: Find any word that contains both digits and specified units
-    for word in words:
-        # Dummy coding: just for the case of SIMILAC 5G
-        if word.lower() == "5g":
-            continue
-
-        # Check if the word contains both digits and either 'g', 'kg', or 'ml'
-        if re.search(r"\d", word) and re.search(r"(g|kg|ml)", word, re.IGNORECASE):
-            # Chỉ thay gr → g trong word này (nếu còn sót)
-            cleaned_word = re.sub(r"gr\b", "g", word, flags=re.IGNORECASE)
-            return cleaned_word.lower()
-
-    return None
-
-
 ## SECTION 6 ##
 
 
@@ -313,309 +77,27 @@ def update_SCHEME():
 def update_CLEAN_1st_SKU():
     st.session_state.is_CLEAN_1st_SKU = not st.session_state.is_CLEAN_1st_SKU
 
-@st.cache_data
-def determine_format_type(size):
-    return (
-        "Liquid Milk"
-        if "ml" in str(size).lower()
-        else "Milk Powder" if "g" in str(size).lower() else "No format"
-    )
-
-
-@st.cache_data
-def extract_clp_region(name):
-    # Dictionary cho phần trong ngoặc
-    exception_in_brackets = {
-        "q6": "Hồ Chí Minh",
-        "củ chi": "Hồ Chí Minh",
-        "hcm": "Hồ Chí Minh",
-        "tuy hòa": "Phú Yên",
-        "tuy hoà": "Phú Yên",
-        "hn": "Hà Nội",
-    }
-
-    # Dictionary cho phần ngoài ngoặc
-    exception_outside = {
-        "hn": "Hà Nội",
-        "đn": "Đà Nẵng",
-        "hcm": "Hồ Chí Minh",
-        "bách hóa sữa bột 2": "Hồ Chí Minh",
-    }
-
-    # Kiểm tra phần trong ngoặc
-    match = re.search(r"\((.*?)\)", name)
-    if match:
-        region_hint = match.group(1).strip().lower()
-        for key, value in exception_in_brackets.items():
-            if key in region_hint:
-                return value
-        # Nếu không khớp key nào, trả về phần trong ngoặc (chữ hoa đầu từ)
-        return match.group(1).strip().title()
-
-    # Nếu không có ngoặc, kiểm tra tên trực tiếp
-    name_lower = name.lower()
-    for key, value in exception_outside.items():
-        if key in name_lower:
-            return value
-
-    return name
-
-
-def extract_timeline(dt):
-    day = dt.day
-    mm = dt.strftime("%m")
-    eom = dt.days_in_month
-
-    if day <= 13:
-        return f"Double Day (01.{mm} - 13.{mm})"
-    elif day <= 20:
-        return f"Mid-Month (14.{mm} - 20.{mm})"
-    else:
-        return f"Pay Day (21.{mm} - {eom}.{mm})"
-
-
-def extract_scheme(row):
-    try:
-        name = row["Product Name"]
-        brand = row["Brand"]
-
-        # Tìm vị trí COMBO
-        idx = name.upper().find("COMBO")
-        if idx == -1:
-            return 1
-
-        # Lấy phần sau COMBO (tương đương +6)
-        after_combo = name[idx + 6 : idx + 11]  # 5 ký tự
-
-        # Lấy số combo (ký tự đầu)
-        qty = int(after_combo[0])
-
-        # Kiểm tra LỐC
-        if "LỐC" in after_combo.upper():
-            divisor = 5 if brand == "Glucerna" else 4 if brand == "Ensure" else 12
-            return qty / divisor
-        else:
-            return qty
-
-    except Exception:
-        return 1
-
-
-def extract_clean_sku(row):
-    try:
-        brand = str(row["Brand"]).strip()
-        size = str(row["Size"]).strip()
-        name = str(row["Product Name"])
-
-        # ===== STEP 1: SKU nền (cột E trong Excel) =====
-        base_sku = f"{brand} {size}"
-
-        if base_sku == "Ensure 800g" and "ít ngọt" in name.lower():
-            base_sku = "Ensure Low Sugar Vanilla 800g"
-
-        # ===== STEP 2: Clean SKU =====
-        clean_sku = base_sku
-
-        if brand == "Grow" and "bột" in name.lower() and "Abbott Grow" in name:
-            idx = name.find("Abbott Grow") + 12
-            clean_sku = f"Grow {name[idx:].strip()}"
-
-        elif brand == "Similac" and "bột" in name.lower() and "Similac " in name:
-            idx = name.find("Similac ") + 8
-            clean_sku = f"Similac {name[idx:].strip()}"
-
-        # ===== STEP 3: Special case Glucerna 220ml =====
-        if clean_sku == "Glucerna 220ml":
-            if "(30 CHAI)" in name:
-                return "Glucerna 220ml 30 chai"
-            else:
-                return "Glucerna 220ml 24 chai"
-
-        return clean_sku
-
-    except Exception:
-        return None
-
-
-## SECTION 7 ##
-
-
-@st.cache_data
-def extract_deal_info(product_name, exclude_outliers, kol_outliers):
-    # Kiểm tra KOL trước
-    special_phrases = [
-        kol.upper() for kol in kol_outliers if kol.upper() in product_name.upper()
-    ]
-
-    # Nếu tìm thấy KOL thì trả về ngay
-    if special_phrases:
-        return special_phrases[0]
-
-    # Nếu không tìm thấy KOL, tiếp tục xử lý DEAL
-    brackets = re.findall(r"\[(.*?)\]", product_name)
-
-    # Loại bỏ các từ trong exclude_outliers
-    brackets = [
-        b
-        for b in brackets
-        if all(excl.lower() not in b.lower() for excl in exclude_outliers)
-    ]
-
-    # Tìm các cụm từ chứa DEAL
-    deal_phrases = [phrase for phrase in brackets if "DEAL" in phrase.upper()]
-
-    if deal_phrases:
-        # Lấy thông tin sau từ DEAL
-        deal_info = deal_phrases[0].split("DEAL")[1].strip().upper()
-        return deal_info
-
-    # Nếu không tìm thấy cả KOL và DEAL
-    return "No KOLs"
-
-
-## SECTION 8 ##
-
-
-@st.cache_data
-def extract_gift_name(product_name, list_outliers):
-    # Kiểm tra outliers trước
-    for key, value in list_outliers:
-        if key in product_name:
-            if "THẺ QUÀ TẶNG" in key:
-                return value
-
-            result = value.upper().replace("TẶNG", "").strip()
-            return result
-
-    # Nếu không có outlier nào, tiếp tục xử lý bình thường
-    brackets = re.findall(r"\[(.*?)\]", product_name)
-
-    # Kiểm tra các cụm từ trong ngoặc vuông để tìm chữ "tặng"
-    for bracket in brackets:
-        if "TẶNG" in bracket.upper():
-            gift_part = bracket.upper().split("TẶNG", 1)[1]  # Lấy phần sau "tặng"
-            return gift_part.strip()
-
-    # Nếu không tìm thấy trong ngoặc vuông, tìm trực tiếp trong product_name
-    if "TẶNG" in product_name.upper():
-        gift_part = product_name.upper().split("TẶNG", 1)[1]  # Lấy phần sau "tặng"
-        return gift_part.strip()
-
-    # Nếu không tìm thấy gift nào
-    return "NO GIFT"
-
-
-## SECTION 9 ##
-
-
-@st.cache_data
-def get_default_periods(min_date, max_date):
-    # Định nghĩa cấu hình cho từng period
-    period_configs = {
-        "Double Day": {"start_day": 1, "end_day": 13},  # Từ ngày 1 đến ngày 13
-        "Mid Month": {"start_day": 14, "end_day": 20},  # Từ ngày 14 đến ngày 20
-        "Pay Day": {"start_day": 21, "end_day": None},  # Từ ngày 21 đến cuối tháng
-    }
-
-    periods = []
-    current_date = min_date.replace(
-        day=1
-    )  # Bắt đầu từ ngày đầu tiên của tháng min_date
-
-    while current_date <= max_date:
-        # Lấy ngày cuối cùng của tháng hiện tại
-        _, last_day = monthrange(current_date.year, current_date.month)
-        month_end = current_date.replace(day=last_day)
-
-        # Nếu tháng hiện tại vượt quá max_date, điều chỉnh month_end
-        if month_end > max_date:
-            month_end = max_date
-
-        # Duyệt qua từng period trong cấu hình
-        for period_name, config in period_configs.items():
-            start_day = config["start_day"]
-            end_day = (
-                config["end_day"] if config["end_day"] else last_day
-            )  # Nếu end_day là None, lấy cuối tháng
-
-            # Tính ngày bắt đầu và kết thúc của period
-            period_start = current_date.replace(day=start_day)
-            period_end = current_date.replace(day=min(end_day, month_end.day))
-
-            # Chỉ thêm period nếu nó nằm trong khoảng min_date và max_date
-            if (
-                period_start <= max_date
-                and period_end >= min_date
-                and period_start <= period_end
-            ):
-                periods.append((period_name, period_start, period_end))
-
-        # Chuyển sang tháng tiếp theo
-        if current_date.month == 12:
-            current_date = current_date.replace(year=current_date.year + 1, month=1)
-        else:
-            current_date = current_date.replace(month=current_date.month + 1)
-
-    return periods
-
-
 ## SECTION 10 ##
 
 
-@st.cache_data
-def convert_df_to_csv(df):
-    """Convert dataframe to CSV format"""
-    return df.to_csv(index=False).encode("utf-8-sig")
-
-
-# @st.cache_data
-# def convert_df_to_excel(df):
-#     """Convert dataframe to Excel format"""
-#     output = io.BytesIO()
-#     with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-#         df.to_excel(writer, sheet_name="Sheet1", index=False)
-#         # Auto-adjust columns' width
-#         worksheet = writer.sheets["Sheet1"]
-#         for i, col in enumerate(df.columns):
-#             # Find the maximum length of the column
-#             column_len = max(df[col].astype(str).apply(len).max(), len(col)) + 2
-#             worksheet.set_column(i, i, column_len)
+# Hàm tạo file download theo định dạng;
+# XLSX: ghi theo chunk ở constant_memory mode, căn giữa cột Brand;
+# Parquet: giữ kiểu dữ liệu và thứ tự của các dòng
+DOWNLOAD_CONVERTERS = {
+    "csv": to_csv_bytes,
+    "xlsx": partial(write_excel, center_columns=["Brand"]),
+    "parquet": write_parquet,
+    "arrow": write_arrow,
+}
 
-#     output.seek(0)
-#     return output.getvalue()
-
-
-@st.cache_data
-def convert_df_to_excel(df):
-    """Convert dataframe to Excel format"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, sheet_name="Sheet1", index=False)
-
-        # Get workbook and worksheet
-        workbook = writer.book
-        worksheet = writer.sheets["Sheet1"]
-
-        # Create center alignment format
-        center_format = workbook.add_format({"align": "center"})
-
-        # Find Brand column index
-        brand_col_idx = list(df.columns).index("Brand")
-
-        # Auto-adjust columns' width
-        for i, col in enumerate(df.columns):
-            # Find the maximum length of the column
-            column_len = max(df[col].astype(str).apply(len).max(), len(col)) + 2
-
-            # Apply center format to Brand column, normal width adjustment for others
-            if i == brand_col_idx:
-                worksheet.set_column(i, i, column_len, center_format)
-            else:
-                worksheet.set_column(i, i, column_len)
 
-    # Reset pointer to the start of BytesIO object
-    output.seek(0)
-    return output.getvalue()
+@st.cache_data(show_spinner=False, max_entries=8)
+def get_download_data(fingerprint, format_type, _get_df):
+    """
+    Nội dung file download của _get_df(), cache theo (fingerprint của dữ liệu, định
+    dạng): _get_df chỉ được gọi khi file chưa có trong cache.
+    """
+    return DOWNLOAD_CONVERTERS[format_type](_get_df())
 
 
 @st.cache_data
@@ -632,7 +114,7 @@ def get_timestamp_string():
 list_component_none = [
     "upload_file",
     "upload_file_name",
-    "df",
+    "pipeline",
     "default_numeric_columns",
     "default_string_columns",
     "default_brand_names",
@@ -657,7 +139,9 @@ list_component_bool_true = [
     "is_CLEAN_1st_SKU",
     "is_CleanProvince"
 ]
-list_component_bool_false = []
+# Gift / Period được tính từ khi bấm nút Process cho đến khi Clear All (giữ qua các lần
+# rerun, vd: khi bấm Prepare để tạo file download)
+list_component_bool_false = ["is_GIFT_PROCESSED", "is_PERIOD_PROCESSED"]
 
 list_component_list = ["periods"]
 
@@ -678,6 +162,13 @@ for component in list_component_list:
     if component not in st.session_state:
         st.session_state[component] = []
 
+# Kết quả của các stage trong pipeline làm sạch
+if "stage_memo" not in st.session_state:
+    st.session_state["stage_memo"] = StageMemo()
+
+if "pipeline_backend" not in st.session_state:
+    st.session_state["pipeline_backend"] = PANDAS
+
 if "gifts" not in st.session_state:
     st.session_state["gifts"] = [
         ("TĂNG KHĂN CHOÀNG TẮM", "TẶNG KHĂN CHOÀNG TẮM"),
@@ -800,9 +291,6 @@ if st.session_state.upload_file_path:
 
         st.session_state.default_string_columns = columns_cast_string
 
-        # Create a dictionary for dtype by setting each column in the list to str
-        dtype_dict = {col: str for col in columns_cast_string}
-
     with col21:
         st.subheader("**Numeric Format**")
 
@@ -828,38 +316,30 @@ if st.session_state.upload_file_path:
         # Cập nhật session state
         st.session_state.default_numeric_columns = columns_cast_numeric
 
-    # Fully read data
-    file_extension = st.session_state.upload_file_name.split(".")[-1].lower()
-
-    if file_extension == "csv":
-        df = pd.read_csv(file_path, low_memory=False, dtype=dtype_dict)
-    else:  # xlsx or xls
-        df = pd.read_excel(file_path, dtype=dtype_dict)
-    st.session_state.df = df
-
-    # Apply the cleaning transformation to each column in the list
-    for col in columns_cast_numeric:
-        if not is_numeric_dtype(df[col]):  # Check if the column is not already Int64
-
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    df[columns_cast_numeric] = df[columns_cast_numeric].fillna(0)
-
-    # Store dataframe in session_state
-    st.session_state.df = df
-
-    # Remove special characters
-    # - Tab
-    df = df.apply(
-        lambda x: x.str.replace("\t", "", regex=False) if x.dtype == "object" else x
+    # Engine tính các cột (chọn cho mỗi lần chạy, kết quả giống nhau)
+    pipeline_backend = st.radio(
+        label="**PROCESSING ENGINE**",
+        options=BACKENDS,
+        index=BACKENDS.index(st.session_state.pipeline_backend),
+        horizontal=True,
+    )
+    st.session_state.pipeline_backend = pipeline_backend
+
+    # Fully read data: các stage chỉ chạy lại khi file hoặc widget liên quan thay đổi,
+    # các cột dẫn xuất chỉ được tính khi preview / download
+    pipeline = Pipeline(st.session_state.stage_memo, backend=pipeline_backend)
+    pipeline.load(
+        stages.READ_FILE,
+        _file_path=file_path,
+        file_fingerprint=get_file_fingerprint(file_path),
+        file_extension=file_extension,
+        string_columns=columns_cast_string,
+        numeric_columns=columns_cast_numeric,
     )
-
-    # Store dataframe in session_state
-    st.session_state.df = df
 
     add_vertical_space(1)
     with st.expander("**Dataframe Preview**"):
-        st.dataframe(df)
+        st.dataframe(pipeline.preview())
 
     ####################################################################################################
 
@@ -886,21 +366,14 @@ if st.session_state.upload_file_path:
         #     .apply(clean_province)
         # )
 
-        unique_provinces = df["Province"].dropna().unique()
-        province_map = build_province_map_parallel(unique_provinces)
-        df["Clean Province"] = df["Province"].map(province_map)
-
         with open("province_mapping.json", "r", encoding="utf-8") as f:
             province_mapping = json.load(f)
 
-        df["Clean Province"] = df["Clean Province"].map(province_mapping)
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        pipeline.define(stages.CLEAN_PROVINCE, province_mapping=province_mapping)
 
     add_vertical_space(1)
     with st.expander("**Dataframe Preview**"):
-        st.dataframe(df)
+        st.dataframe(pipeline.preview())
 
     ####################################################################################################
 
@@ -974,23 +447,6 @@ if st.session_state.upload_file_path:
             "##### **Selected brand names:**\n"
             + "\n".join(f"- {option}" for option in extract_brands_list)
         )
-        brand_map = {
-            brand.lower(): brand for brand in extract_brands_list
-        }  # lowercase to original format mapping
-
-        # Create a regex pattern from the lowercase versions of brands
-        pattern = "|".join(brand_map.keys())
-
-        # Convert product_name to lowercase, extract the brand in lowercase, and map back to original format
-        df["Brand"] = (
-            df["Product Name"]
-            .str.lower()
-            .str.extract(f"({pattern})", expand=False)  # Extract in lowercase
-            .map(brand_map)  # Map to original format using brand_map
-        )
-
-        # Store dataframe in session_state
-        st.session_state.df = df
 
     ####################################################################################################
 
@@ -999,12 +455,6 @@ if st.session_state.upload_file_path:
     with col22:
         st.subheader("**Product Sizes**")
 
-        # Apply the function to the product_name column and save the result in a new column
-        df["Size"] = df["Product Name"].apply(extract_size)
-
-        # Store dataframe in session_state
-        st.session_state.df = df
-
         # Specified default brands
         outliers_size = [
             "COMBO 4 LỐC (24 CHAI) SỮA NƯỚC GLUCERNA HƯƠNG VANI",
@@ -1060,16 +510,17 @@ if st.session_state.upload_file_path:
             + "\n".join(f"- {option}" for option in outliers_size_list)
         )
 
-        df.loc[
-            df["Product Name"].isin(outliers_size) & df["Size"].isna(),
-            "Size",
-        ] = "220ml"
-        # Store dataframe in session_state
-        st.session_state.df = df
+        # Brand, Size, Format, Scheme, Clean 1st SKU: lấy từ SKU master, chỉ parse các SKU mới
+        pipeline.define(
+            stages.PRODUCT_COLUMNS,
+            brands=extract_brands_list,
+            outliers_size=outliers_size_list,
+        )
+        pipeline.define(stages.BRAND_SIZE)
 
     add_vertical_space(1)
     with st.expander("**Dataframe Preview**"):
-        st.dataframe(df)
+        st.dataframe(pipeline.preview())
 
     ####################################################################################################
 
@@ -1087,12 +538,7 @@ if st.session_state.upload_file_path:
 
     if FSP:
         # Calculate FSP
-        df["FSP"] = (
-            df["SKU Subtotal Before Discount"] - df["SKU Seller Discount"]
-        ) / df["Quantity"]
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        pipeline.define(stages.FSP)
 
     FORMAT = st.checkbox(
         "**ADD :red[FORMAT] COLUMN**",
@@ -1101,10 +547,7 @@ if st.session_state.upload_file_path:
     )
 
     if FORMAT:
-        df["Format"] = df["Size"].apply(determine_format_type)
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        pipeline.define(stages.FORMAT)
 
     SUBTOTAL_USD = st.checkbox(
         "**ADD :red[SKU SUBTOTAL AFTER DISCOUNT (USD)] COLUMN**",
@@ -1114,12 +557,7 @@ if st.session_state.upload_file_path:
 
     if SUBTOTAL_USD:
         # Tính giá trị mới và lưu tạm vào một cột mới
-        df["SKU Subtotal After Discount (USD)"] = (
-            df["SKU Subtotal After Discount"] / 26600
-        ).round(2)
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        pipeline.define(stages.SUBTOTAL_USD, fx_rates=load_fx_rates())
 
     DATE = st.checkbox(
         "**ADD :red[DATE TIME] COLUMNS**",
@@ -1128,19 +566,8 @@ if st.session_state.upload_file_path:
     )
 
     if DATE:
-        # Convert the 'Created Time' column to datetime format with the correct format
-        df["Created Time"] = pd.to_datetime(
-            df["Created Time"], format="%d/%m/%Y %H:%M:%S", errors="coerce"
-        )
-
-        # Convert Created Time to date only for comparison
-        df["Created Date"] = df["Created Time"].dt.date
-
-        # Thêm cột mới với định dạng YYYY/MM
-        df["Created Year Month"] = df["Created Time"].dt.strftime("%Y-%m")
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        # Parse Created Time once, then derive Created Date / Created Year Month per unique day
+        pipeline.define(stages.DATE)
 
     CLP_REGION = st.checkbox(
         "**ADD :red[CLP REGION] COLUMNS**",
@@ -1149,10 +576,7 @@ if st.session_state.upload_file_path:
     )
 
     if CLP_REGION:
-        df["Warehouse Region"] = df["Warehouse Name"].apply(extract_clp_region)
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        pipeline.define(stages.CLP_REGION)
 
     VOUCHER = st.checkbox(
         "**ADD :red[VOUCHER] COLUMN**",
@@ -1161,13 +585,8 @@ if st.session_state.upload_file_path:
     )
 
     if VOUCHER:
-        # Calculate FSP
-        df["Voucher"] = df["SKU Platform Discount"] / (
-            df["SKU Subtotal Before Discount"] - df["SKU Seller Discount"]
-        )
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        # Calculate Voucher
+        pipeline.define(stages.VOUCHER)
 
     TIMELINE = st.checkbox(
         "**ADD :red[TIMELINE] COLUMN**",
@@ -1176,15 +595,8 @@ if st.session_state.upload_file_path:
     )
 
     if TIMELINE:
-        # Calculate FSP
-        df["Created Time"] = pd.to_datetime(
-            df["Created Time"], format="%d/%m/%Y %H:%M:%S", errors="coerce"
-        )
-
-        df["Timeline"] = df["Created Time"].apply(extract_timeline)
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        # Created Time is only parsed here if the DATE columns are turned off
+        pipeline.define(stages.TIMELINE)
 
     SCHEME = st.checkbox(
         "**ADD :red[SCHEME] COLUMN**",
@@ -1193,10 +605,7 @@ if st.session_state.upload_file_path:
     )
 
     if SCHEME:
-        df["Scheme"] = df.apply(extract_scheme, axis=1)
-
-        # Store dataframe in session_state
-        st.session_state.df = df
+        pipeline.define(stages.SCHEME)
 
     CLEAN_1st_SKU = st.checkbox(
         "**ADD :red[CLEAN 1ST SKU] COLUMN**",
@@ -1205,18 +614,12 @@ if st.session_state.upload_file_path:
     )
 
     if CLEAN_1st_SKU:
-        df["Clean 1st SKU"] = df.apply(extract_clean_sku, axis=1)
+        pipeline.define(stages.CLEAN_1ST_SKU)
 
-        # Store dataframe in session_state
-        st.session_state.df = df
-
-
-    # Store dataframe in session_state
-    st.session_state.df = df
 
     add_vertical_space(1)
     with st.expander("**Dataframe Preview**"):
-        st.dataframe(df)
+        st.dataframe(pipeline.preview())
 
     ####################################################################################################
 
@@ -1324,17 +727,15 @@ if st.session_state.upload_file_path:
             + "\n".join(f"- {option}" for option in kol_outliers_list)
         )
 
-    df["KOL"] = df["Product Name"].apply(
-        lambda x: extract_deal_info(x, exclude_outliers_list, kol_outliers_list)
+    pipeline.define(
+        stages.KOL,
+        kol_outliers=kol_outliers_list,
+        exclude_outliers=exclude_outliers_list,
     )
-    df["IS KOL"] = df["KOL"].apply(lambda x: False if x == "No KOLs" else True)
-
-    # Store dataframe in session_state
-    st.session_state.df = df
 
     add_vertical_space(1)
     with st.expander("**Dataframe Preview**"):
-        st.dataframe(df)
+        st.dataframe(pipeline.preview())
 
     ####################################################################################################
 
@@ -1407,23 +808,19 @@ if st.session_state.upload_file_path:
 
         ## Process and download section
         if st.button("Process All Gifts"):
-            # Store dataframe in session_state
-            st.session_state.df = df
+            st.session_state.is_GIFT_PROCESSED = True
 
-            df["Gift"] = df["Product Name"].apply(
-                lambda x: extract_gift_name(x, st.session_state.gifts)
-            )
-
-            # Store dataframe in session_state
-            st.session_state.df = df
+        if st.session_state.is_GIFT_PROCESSED:
+            pipeline.define(stages.GIFT, gifts=st.session_state.gifts)
 
             add_vertical_space(1)
             with st.expander("**Dataframe Preview**"):
-                st.dataframe(df)
+                st.dataframe(pipeline.preview())
 
         # Add clear all button
         if st.button("Clear All", key="remove_all_gifts"):
             st.session_state.gifts = []
+            st.session_state.is_GIFT_PROCESSED = False
             st.rerun()
 
     ####################################################################################################
@@ -1436,13 +833,11 @@ if st.session_state.upload_file_path:
         divider="gray",
     )
 
-    df["Created Time"] = pd.to_datetime(df["Created Time"], format="%d/%m/%Y %H:%M:%S")
-
-    # Store dataframe in session_state
-    st.session_state.df = df
+    pipeline.define(stages.CREATED_TIME)
 
-    min_date = df["Created Time"].min().date()
-    max_date = df["Created Time"].max().date()
+    created_time = pipeline.materialize(["Created Time"])["Created Time"]
+    min_date = created_time.min().date()
+    max_date = created_time.max().date()
 
     tab1, tab2, tab3 = st.tabs(["Add Default", "Add Manually", "Add by File"])
 
@@ -1451,42 +846,19 @@ if st.session_state.upload_file_path:
 
         if add_defaults:
             default_periods = get_default_periods(min_date, max_date)
-            new_periods_added = 0
 
-            for period in default_periods:
-                if period not in st.session_state.periods:
-                    # existing_names = [p[0] for p in st.session_state.periods]
-                    existing_dates = [(p[1], p[2]) for p in st.session_state.periods]
+            # Validate tất cả default period một lần (trùng / giao với các period hiện có)
+            accepted, rejected = validate_periods(
+                pd.DataFrame(default_periods, columns=PERIOD_COLUMNS),
+                st.session_state.periods,
+            )
+            st.session_state.periods.extend(default_periods[i] for i in accepted.index)
 
-                    if period in st.session_state.periods:
-                        st.warning(
-                            f"Period ({period[1].strftime('%Y-%m-%d')} to {period[2].strftime('%Y-%m-%d')}) already exists!"
-                        )
-                    elif (period[1], period[2]) in existing_dates:
-                        st.warning(
-                            f"Period ({period[1].strftime('%Y-%m-%d')} to {period[2].strftime('%Y-%m-%d')}) already exists!"
-                        )
-                    elif period not in st.session_state.periods:
-                        # Check for overlapping periods
-                        has_overlap = False
-                        for existing_start, existing_end in existing_dates:
-                            if not (
-                                period[2] < pd.Timestamp(existing_start).date()
-                                or period[1] > pd.Timestamp(existing_end).date()
-                            ):
-                                has_overlap = True
-                                break
-
-                        if has_overlap:
-                            st.warning(
-                                f"Period ({period[1].strftime('%Y-%m-%d')} to {period[2].strftime('%Y-%m-%d')}) overlaps with an existing period!"
-                            )
-                        else:
-                            st.session_state.periods.append(period)
-                            new_periods_added += 1
-
-            if new_periods_added > 0:
-                st.success(f"Added {new_periods_added} default periods successfully!")
+            if len(accepted) > 0:
+                st.success(f"Added {len(accepted)} default periods successfully!")
+            if len(rejected) > 0:
+                st.warning(f"{len(rejected)} default periods were skipped:")
+                st.dataframe(rejected, hide_index=True)
 
     with tab2:
 
@@ -1557,75 +929,16 @@ if st.session_state.upload_file_path:
         if upload_file:
             period_df = pd.read_excel(upload_file)
 
-            period_df["start_date"] = pd.to_datetime(
-                period_df["start_date"], format="%d/%m/%Y"
-            )
-            period_df["end_date"] = pd.to_datetime(
-                period_df["end_date"], format="%d/%m/%Y"
-            )
-            min_date = pd.Timestamp(min_date)
-            max_date = pd.Timestamp(max_date)
-
-            # Add new periods
-            new_periods_added = 0
-
-            for index, row in period_df.iterrows():
-                # Phase 1: Check for null values first
-                if row.isnull().any():
-                    st.warning(f"Row {index + 1} contains null values - skipping")
-                    continue
-
-                start_date = pd.to_datetime(row["start_date"], format="%d/%m/%Y")
-                end_date = pd.to_datetime(row["end_date"], format="%d/%m/%Y")
-                min_date = pd.Timestamp(min_date)
-                max_date = pd.Timestamp(max_date)
-
-                # Phase 2: Check start_date before end_date
-                if start_date > end_date:
-                    st.warning(f"Row {index + 1}: End date must be after start date!")
-                    continue
-
-                # Phase 3: Check date range
-                # if start_date < min_date or end_date > max_date:
-                #     st.warning(
-                #         f"Row {index + 1}: Dates must be between {min_date.strftime('%Y-%m-%d')} and {max_date.strftime('%Y-%m-%d')}!"
-                #     )
-                #     continue
-
-                # Process valid period
-                period = (row["period_name"], start_date, end_date)
-                if period not in st.session_state.periods:
-                    existing_dates = [(p[1], p[2]) for p in st.session_state.periods]
-
-                    if period in st.session_state.periods:
-                        st.warning(
-                            f"Period ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}) already exists!"
-                        )
-                    elif (start_date, end_date) in existing_dates:
-                        st.warning(
-                            f"Period ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}) already exists!"
-                        )
-                    else:
-                        # Check for overlapping periods
-                        has_overlap = False
-                        for existing_start, existing_end in existing_dates:
-                            if not (
-                                end_date < pd.Timestamp(existing_start)
-                                or start_date > pd.Timestamp(existing_end)
-                            ):
-                                has_overlap = True
-                                break
-
-                        if has_overlap:
-                            st.warning(
-                                f"Period ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}) overlaps with an existing period!"
-                            )
-                        else:
-                            st.session_state.periods.append(period)
-                            new_periods_added += 1
-
-            if new_periods_added > 0:
-                st.success(f"Added {new_periods_added} periods successfully!")
+            # Validate cả bảng một lần: null, định dạng ngày, start <= end, trùng / giao
+            # với các period hiện có và giữa các dòng của file
+            accepted, rejected = validate_periods(period_df, st.session_state.periods)
+            st.session_state.periods.extend(accepted.itertuples(index=False, name=None))
+
+            if len(accepted) > 0:
+                st.success(f"Added {len(accepted)} periods successfully!")
+            if len(rejected) > 0:
+                st.warning(f"{len(rejected)} rows were not imported:")
+                st.dataframe(rejected, hide_index=True)
 
     ## Display and manage periods
     if st.session_state.periods:
@@ -1661,31 +974,14 @@ if st.session_state.upload_file_path:
 
         # # Process and download section
         if st.button("Process All Periods"):
-            try:
-
-                # Store dataframe in session_state
-                st.session_state.df = df
-
-                df["Period"] = "No Period"
+            st.session_state.is_PERIOD_PROCESSED = True
 
-                # Store dataframe in session_state
-                st.session_state.df = df
-
-                for name, start_date, end_date in st.session_state.periods:
-                    start_dt = pd.to_datetime(start_date).date()
-                    end_dt = pd.to_datetime(end_date).date()
-
-                    # Compare dates only
-                    mask = (df["Created Date"] >= start_dt) & (
-                        df["Created Date"] <= end_dt
-                    )
-                    df.loc[mask, "Period"] = name
+        if st.session_state.is_PERIOD_PROCESSED:
+            pipeline.define(stages.PERIOD, periods=st.session_state.periods)
 
-                # Drop the temporary Created Date column if you don't need it
-                # df = df.drop("Created Date", axis=1)
-
-                # Store dataframe in session_state
-                st.session_state.df = df
+            # Stage chỉ được tính (và có thể lỗi) khi preview
+            try:
+                preview = pipeline.preview()
 
             except Exception as e:
                 st.error(f"Error processing data: {str(e)}")
@@ -1695,13 +991,15 @@ if st.session_state.upload_file_path:
                         "Date format error detected. Please ensure your dates are in DD/MM/YYYY HH:MM:SS format"
                     )
 
-            add_vertical_space(1)
-            with st.expander("**Dataframe Preview**"):
-                st.dataframe(df)
+            else:
+                add_vertical_space(1)
+                with st.expander("**Dataframe Preview**"):
+                    st.dataframe(preview)
 
         # Add clear all button
         if st.button("Clear All", key="remove_all_periods"):
             st.session_state.periods = []
+            st.session_state.is_PERIOD_PROCESSED = False
             st.rerun()
 
     ####################################################################################################
@@ -1714,31 +1012,37 @@ if st.session_state.upload_file_path:
         divider="gray",
     )
 
+    # Dashboard chỉ tính các cột cần dùng từ pipeline
+    st.session_state.pipeline = pipeline
+
     # Dummy code for prettier layout
     col15, col25, col35, col45, col55, col65 = st.columns(6)
     timestamp = get_timestamp_string()
 
-    with col35:
-        # CSV Download
-        csv_data = convert_df_to_csv(df)
-        st.download_button(
-            label="📥 Download as CSV",
-            data=csv_data,
-            file_name=f"data_export_{timestamp}.csv",
-            mime="text/csv",
-            key="download-csv",
-        )
-
-    with col45:
-        # Excel Download
-        excel_data = convert_df_to_excel(df)
-        st.download_button(
-            label="📥 Download as Excel",
-            data=excel_data,
-            file_name=f"data_export_{timestamp}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key="download-excel",
-        )
+    # Các file download chỉ được tạo khi bấm nút (toàn bộ file chỉ được tính lúc này);
+    # key gồm cả trạng thái Gift / Period
+    fingerprint = get_config_hash(
+        pipeline.get_fingerprint(),
+        st.session_state.is_GIFT_PROCESSED,
+        st.session_state.is_PERIOD_PROCESSED,
+    )
+    for column, format_type, label, key in [
+        (col25, "csv", "CSV", "download-csv"),
+        (col35, "xlsx", "Excel", "download-excel"),
+        (col45, "parquet", "Parquet", "download-parquet"),
+        (col55, "arrow", "Arrow", "download-arrow"),
+    ]:
+        with column:
+            show_download_button(
+                label=label,
+                artifact_key=(fingerprint, format_type),
+                widget_key=key,
+                file_name=f"data_export_{timestamp}.{format_type}",
+                mime=MIME_TYPES[format_type],
+                get_data=partial(
+                    get_download_data, fingerprint, format_type, pipeline.materialize
+                ),
+            )
 
 
 # # Create tabs for CSV and Excel downloads
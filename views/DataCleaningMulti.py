@@ -1,30 +1,48 @@
 import pandas as pd
-from pandas.api.types import is_numeric_dtype
 import streamlit as st
-import re
-import io
 import json
-import unicodedata
+import os
+import uuid
 from datetime import datetime
-from calendar import monthrange
-from deep_translator import GoogleTranslator
-import time
+from functools import partial
 import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import pandas as pd
 
 # Extra utilities
 from streamlit_extras.add_vertical_space import add_vertical_space
 
+from utils.rules import get_config_hash
+
+# Cleaning pipeline (memoized stages)
+from utils.pipeline import (
+    BACKENDS,
+    PANDAS,
+    PREVIEW_ROWS,
+    Pipeline,
+    StageMemo,
+    get_file_fingerprint,
+)
+from utils import stages
+from utils.dates import get_default_periods, parse_created_time
+from utils.fx import load_fx_rates
+from utils.parallel import encode_files, materialize_files
+from utils.periods import PERIOD_COLUMNS, validate_periods
+from utils.downloads import MIME_TYPES, show_download_button
+from utils.export import (
+    DEFAULT_ZIP_COMPRESSION,
+    ZIP_COMPRESSIONS,
+    to_csv_bytes,
+    write_arrow,
+    write_excel,
+    write_parquet,
+    write_zip,
+)
+
 import logging
 
 logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").setLevel(
     logging.ERROR
 )
 
-import uuid
-import zipfile
-
 ##################################### SECTION 0-1: Define Functions ######################################
 
 
@@ -36,245 +54,6 @@ def update_CleanProvince():
     st.session_state.is_CleanProvince = not st.session_state.is_CleanProvince
 
 
-@st.cache_data
-# def remove_vietnamese_accent(text, special_char_map):
-#     """
-#     Loại bỏ dấu tiếng Việt và xử lý các ký tự đặc biệt
-
-#     Args:
-#         text (str): Văn bản cần xử lý
-#         special_char_map (dict, optional): Bảng chuyển đổi ký tự đặc biệt.
-#             Mặc định xử lý chữ 'đ'/'Đ'
-#     """
-
-#     # Loại bỏ dấu
-#     text = unicodedata.normalize("NFD", text)
-#     text = "".join(char for char in text if unicodedata.category(char) != "Mn")
-
-#     # Thay thế các ký tự đặc biệt
-#     for char, replacement in special_char_map.items():
-#         text = text.replace(char, replacement)
-
-#     return text
-def is_latin(char):
-    """
-    Kiểm tra ký tự có thuộc bảng chữ Latin không
-    """
-    try:
-        return "LATIN" in unicodedata.name(char)
-    except ValueError:
-        return False
-
-
-@st.cache_data
-def remove_vietnamese_accent(text, special_char_map=None):
-    """
-    - Bỏ dấu tiếng Việt (Unicode Latin)
-    - Giữ nguyên chữ không phải Latin (Khmer, Thai, Chinese, ...)
-    - Xử lý ký tự đặc biệt theo map
-    """
-
-    result = []
-
-    print(text)
-    for char in text:
-        # Chuẩn hóa NFD để tách dấu
-        decomposed = unicodedata.normalize("NFD", char)
-
-        # Nếu ký tự gốc là Latin → bỏ dấu
-        if is_latin(decomposed[0]):
-            cleaned = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
-            result.append(cleaned)
-        else:
-            # Không phải Latin → giữ nguyên
-            result.append(char)
-
-    text = "".join(result)
-
-    # Thay thế ký tự đặc biệt (nếu có)
-    if special_char_map:
-        for char, replacement in special_char_map.items():
-            text = text.replace(char, replacement)
-
-    print(text)
-    return text
-
-
-@st.cache_data
-def remove_unnecessary_words(province, outlier_province_map, outlier_provinces):
-    # Lowercase để chuẩn hóa
-    province = province.lower()
-
-    # Bước 1: Loại bỏ các từ không cần thiết
-    province = re.sub(r"\b(thanh pho|pho|province|city)\b", "", province)
-
-    # Bước 2: Xử lý các trường hợp đặc biệt Hà Tĩnh (ha tinh))
-    for special_case in outlier_provinces:
-        if special_case in province:
-            province = special_case  # Case Ha Tinh
-        else:
-            province = re.sub(r"\btinh\b", "", province)
-
-    # Bước 3: Xử lý các trường hợp Đắk Lắk (dac lak -> dak lak)
-    for old_name, new_name in outlier_province_map.items():
-        if old_name in province:
-            province = new_name
-
-    # Bước 4: Loại bỏ các ký tự đặc biệt và khoảng trắng
-    province = re.sub(
-        r"[-–]", " ", province
-    )  # Case Thua Thien - Hue and Ba Ria - Vung Tau
-    province = " ".join(province.split())
-
-    return province.title()
-
-
-@st.cache_data
-def clean_province(province):
-    # Bước 1: Loại bỏ dấu tiếng Việt
-    outlier_char_map = {"đ": "d", "Đ": "D", "ð": "d", "Ð": "D"}
-
-    province = remove_vietnamese_accent(province, outlier_char_map)
-
-    # Bước 2: Loại bỏ các từ không cần thiết
-    outlier_province_map = {
-        "dac lak": "dak lak",
-        "lau dai dac lac": "dak lak",
-        "tan an": "long an",
-        "hin tin": "binh dinh",
-        "phong thu hang hai": "hai phong",
-        "hue": "thua thien hue",
-        "provinz quang tri": "quang tri",
-        "กรุงฮานอย": "ha noi",
-        "河内": "ha noi",
-        "海防": "hai phong",
-        "胡志明市": "ho chi minh",
-    }
-    outlier_provinces = ["ha tinh"]
-
-    province = remove_unnecessary_words(
-        province, outlier_province_map, outlier_provinces
-    )
-
-    return province
-
-
-# Hàm kiểm tra chuỗi có chứa ký tự đặc biệt
-@st.cache_data
-def contains_special_chars(text, include_vietnamese=False):
-    if include_vietnamese:
-        vietnamese_chars = r"[àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ]"
-        cleaned_text = re.sub(vietnamese_chars, "", text)
-        return bool(re.search(r"[^a-zA-Z\s]", cleaned_text))
-    return bool(re.search(r"[^a-zA-Z\s]", text))
-
-
-# Hàm translate các province không phải tiếng việt
-# @st.cache_data
-# def translate_text(text, target_lang="vi", max_retries=10):
-#     translator = GoogleTranslator(target=target_lang)
-#     retries = 0
-
-#     while retries < max_retries:
-#         try:
-#             # Tự động phát hiện và dịch
-#             translated = translator.translate(text)
-#             # time.sleep(0.5)
-#             return {"original": text, "translated": translated}
-
-#         except Exception as e:
-#             retries += 1
-#             print(f"[Retry {retries}/{max_retries}] SSL Error: {e}")
-#             time.sleep(2)  # nghỉ 2s rồi thử lại
-
-#     raise RuntimeError(f"Failed to translate after {max_retries} retries due to SSL errors.")
-
-
-@st.cache_data
-def process_province(text, target_lang="vi"):
-    translator = GoogleTranslator(target=target_lang)
-
-    if contains_special_chars(text, include_vietnamese=False):
-        try:
-            translated = translator.translate(text)
-            if contains_special_chars(translated, include_vietnamese=True):
-                return "Others"
-            return translated
-        except Exception:
-            return "Others"
-    return text
-
-# @st.cache_data
-# def process_province(text):
-#     return (
-#         "Others"
-#         if contains_special_chars(text, include_vietnamese=True)
-#         else text
-#     )
-
-
-def normalize_province_pipeline(province):
-    province = clean_province(province)
-    province = process_province(province)
-    province = clean_province(province)
-    return province
-
-
-def build_province_map_parallel(provinces, max_workers=6):
-    result = {}
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(normalize_province_pipeline, p): p for p in provinces
-        }
-
-        for future in as_completed(futures):
-            p = futures[future]
-            try:
-                result[p] = future.result()
-            except Exception:
-                result[p] = "Others"
-
-    return result
-
-
-## SECTION 5 ##
-
-
-@st.cache_data
-def extract_size(product_name):
-    product_name_lower = product_name.lower()
-
-    # ====== SPECIAL LOGIC FOR ENSURE ======
-    if "ensure" in product_name_lower:
-        # Check 237ml
-        if re.search(r"\b237\s*ml\b", product_name_lower):
-            if "original" in product_name_lower:
-                return "Original 237ml"
-            else:
-                return "Gold 237ml"
-
-    # Step 1: Replace special characters (except '.') with spaces
-    cleaned_name = re.sub(r"[^\w\s\.]", " ", product_name)
-
-    # Step 2: Split the cleaned name into individual words
-    words = cleaned_name.split()
-
-    # Step 3: Find any word that contains both digits and specified units
-    for word in words:
-        # Dummy coding: just for the case of SIMILAC 5G
-        if word.lower() == "5g":
-            continue
-
-        # Check if the word contains both digits and either 'g', 'kg', or 'ml'
-        if re.search(r"\d", word) and re.search(r"(g|kg|ml)", word, re.IGNORECASE):
-            # Chỉ thay gr → g trong word này (nếu còn sót)
-            cleaned_word = re.sub(r"gr\b", "g", word, flags=re.IGNORECASE)
-            return cleaned_word.lower()
-
-    return None
-
-
 ## SECTION 6 ##
 
 
@@ -328,379 +107,96 @@ def update_CLEAN_2ND_SKU():
     st.session_state.is_CLEAN_2ND_SKU = not st.session_state.is_CLEAN_2ND_SKU
 
 
-@st.cache_data
-def determine_format_type(size):
-    return (
-        "Liquid Milk"
-        if "ml" in str(size).lower()
-        else "Milk Powder" if "g" in str(size).lower() else "No format"
-    )
+## SECTION 9 ##
 
 
 @st.cache_data
-def extract_clp_region(name):
-    # Dictionary cho phần trong ngoặc
-    exception_in_brackets = {
-        "q6": "Hồ Chí Minh",
-        "củ chi": "Hồ Chí Minh",
-        "hcm": "Hồ Chí Minh",
-        "tuy hòa": "Phú Yên",
-        "tuy hoà": "Phú Yên",
-        "hn": "Hà Nội",
-    }
-
-    # Dictionary cho phần ngoài ngoặc
-    exception_outside = {
-        "hn": "Hà Nội",
-        "đn": "Đà Nẵng",
-        "hcm": "Hồ Chí Minh",
-        "bách hóa sữa bột 2": "Hồ Chí Minh",
-    }
-
-    # Kiểm tra phần trong ngoặc
-    match = re.search(r"\((.*?)\)", name)
-    if match:
-        region_hint = match.group(1).strip().lower()
-        for key, value in exception_in_brackets.items():
-            if key in region_hint:
-                return value
-        # Nếu không khớp key nào, trả về phần trong ngoặc (chữ hoa đầu từ)
-        return match.group(1).strip().title()
-
-    # Nếu không có ngoặc, kiểm tra tên trực tiếp
-    name_lower = name.lower()
-    for key, value in exception_outside.items():
-        if key in name_lower:
-            return value
-
-    return name
-
-
-def extract_timeline(dt):
-    day = dt.day
-    mm = dt.strftime("%m")
-    eom = dt.days_in_month
-
-    if day <= 13:
-        return f"Double Day (01.{mm} - 13.{mm})"
-    elif day <= 20:
-        return f"Mid-Month (14.{mm} - 20.{mm})"
-    else:
-        return f"Pay Day (21.{mm} - {eom}.{mm})"
-
-
-# def extract_scheme(row):
-#     try:
-#         name = row["Product Name"]
-#         brand = row["Brand"]
-
-#         # Tìm vị trí COMBO
-#         idx = name.upper().find("COMBO")
-#         if idx == -1:
-#             return 1
-
-#         # Lấy phần sau COMBO (tương đương +6)
-#         after_combo = name[idx + 6 : idx + 11]  # 5 ký tự
-
-#         # Lấy số combo (ký tự đầu)
-#         qty = int(after_combo[0])
-
-#         # Kiểm tra LỐC
-#         if "LỐC" in after_combo.upper():
-#             divisor = 5 if brand == "Glucerna" else 4 if brand == "Ensure" else 12
-#             return qty / divisor
-#         else:
-#             return qty
-
-#     except Exception:
-#         return 1
-
-def extract_scheme(row):
-    try:
-        name = row["Product Name"]
-        brand = row["Brand"]
-        
-        # === 1. Trường hợp có từ "COMBO" ===
-        idx = name.upper().find("COMBO")
-        if idx != -1:
-            # Lấy phần sau COMBO khoảng 5 ký tự
-            after_combo = name[idx + 6 : idx + 11]
-            qty = int(after_combo[0]) if after_combo[0].isdigit() else 1
-            
-            # Nếu có "LỐC" trong combo
-            if "LỐC" in after_combo.upper():
-                divisor = 5 if brand == "Glucerna" else 4 if brand == "Ensure" else 12
-                return qty / divisor
-            else:
-                return qty
-        
-        # === 2. Trường hợp KHÔNG có "COMBO" → kiểm tra "LỐC" ===
-        if "LỐC" in name.upper():
-            # Tìm số trước từ "LỐC"
-            upper_name = name.upper()
-            loc_pos = upper_name.find("LỐC")
-            
-            # Lấy phần trước "LỐC" khoảng 10 ký tự để tìm số
-            before_loc = upper_name[max(0, loc_pos - 10): loc_pos].strip()
-            
-            # Trích xuất số cuối cùng trước "LỐC"
-            import re
-            numbers = re.findall(r'\d+', before_loc)
-            qty = int(numbers[-1]) if numbers else 1
-            
-            # === Xác định divisor dựa vào cột Size ===
-            if "Size" not in row:
-                return "không extract được scheme lốc do không tìm thấy cột Size"
-            
-            size = str(row["Size"]).upper()
-            
-            if "110ML" in size or "180ML" in size:
-                divisor = 12
-            elif "237ML" in size or "220ML" in size:
-                divisor = 4
-            else:
-                return "Không extract được scheme do không tìm thấy liquid size"
-            
-            # Trả về số lốc (qty / divisor)
-            return qty / divisor
-        
-        # === 3. Không có COMBO và cũng không có LỐC ===
-        return 1
-
-    except Exception as e:
-        return 1
+def update_PERIOD():
+    st.session_state.is_PERIOD = not st.session_state.is_PERIOD
 
 
-def extract_clean_sku(row):
-    try:
-        brand = str(row["Brand"]).strip()
-        size = str(row["Size"]).strip()
-        name = str(row["Product Name"])
-
-        # ===== STEP 1: SKU nền (cột E trong Excel) =====
-        base_sku = f"{brand} {size}"
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_date_range(fingerprint, _get_created_time):
+    """
+    Ngày nhỏ / lớn nhất của Created Time (bỏ qua giá trị sai định dạng / trống), cache
+    theo fingerprint của cột: _get_created_time chỉ được gọi khi chưa có trong cache.
+    """
+    created_time = parse_created_time(_get_created_time())
+    return created_time.min(), created_time.max()
 
-        if base_sku == "Ensure 800g" and "ít ngọt" in name.lower():
-            base_sku = "Ensure Low Sugar Vanilla 800g"
 
-        # ===== STEP 2: Clean SKU =====
-        clean_sku = base_sku
+## SECTION 10 ##
 
-        if brand == "Grow" and "bột" in name.lower() and "Abbott Grow" in name:
-            idx = name.find("Abbott Grow") + 12
-            clean_sku = f"Grow {name[idx:].strip()}"
+# Hàm tạo file download theo định dạng (hàm của utils để chạy được trong worker process);
+# XLSX: ghi theo chunk ở constant_memory mode, bảng Excel trên toàn bộ dữ liệu;
+# Parquet / Arrow: giữ kiểu dữ liệu của các cột, đọc lại nhanh hơn CSV / XLSX nhiều lần
+DOWNLOAD_CONVERTERS = {
+    "csv": to_csv_bytes,
+    "xlsx": partial(write_excel, table_style="Table Style Light 13"),
+    "parquet": write_parquet,
+    "arrow": write_arrow,
+}
 
-        elif brand == "Similac" and "bột" in name.lower() and "Similac " in name:
-            idx = name.find("Similac ") + 8
-            clean_sku = f"Similac {name[idx:].strip()}"
 
-        # ===== STEP 3: Special case Glucerna 220ml =====
-        if clean_sku == "Glucerna 220ml":
-            if "(30 CHAI)" in name:
-                return "Glucerna 220ml 30 chai"
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_download_data(fingerprint, format_type, _get_df):
+    """
+    Nội dung file download (một trong các định dạng của DOWNLOAD_CONVERTERS) của
+    _get_df(), cache theo (fingerprint của dữ liệu, định dạng): _get_df chỉ được gọi khi
+    file chưa có trong cache.
+    """
+    return DOWNLOAD_CONVERTERS[format_type](_get_df())
+
+
+def create_zip(
+    files_data, pipelines, timestamp, format_type="csv", compression=DEFAULT_ZIP_COMPRESSION
+):
+    names = {}
+    for file_id, data in files_data.items():
+        file_name_raw = ".".join(data["file_name"].split(".")[:-1])
+        names[file_id] = f"cleaned_{file_name_raw}_{timestamp}.{format_type}"
+
+    def get_members():
+        # File đã được tạo ở tab download từng file: dùng lại cache
+        prepared = st.session_state.prepared_downloads
+        pending = {}
+        for file_id, pipeline in pipelines.items():
+            fingerprint = files_data[file_id]["fingerprint"]
+            if (fingerprint, format_type) in prepared:
+                yield names[file_id], get_download_data(
+                    fingerprint, format_type, pipeline.materialize
+                )
             else:
-                return "Glucerna 220ml 24 chai"
-
-        return clean_sku
-
-    except Exception:
-        return None
-
-## SECTION 7 ##
-
-
-@st.cache_data
-def extract_deal_info(product_name, exclude_outliers, kol_outliers):
-    # Kiểm tra KOL trước
-    special_phrases = [
-        kol.upper() for kol in kol_outliers if kol.upper() in product_name.upper()
-    ]
-
-    # Nếu tìm thấy KOL thì trả về ngay
-    if special_phrases:
-        return special_phrases[0]
-
-    # Nếu không tìm thấy KOL, tiếp tục xử lý DEAL
-    brackets = re.findall(r"\[(.*?)\]", product_name)
-
-    # Loại bỏ các từ trong exclude_outliers
-    brackets = [
-        b
-        for b in brackets
-        if all(excl.lower() not in b.lower() for excl in exclude_outliers)
-    ]
-
-    # Tìm các cụm từ chứa DEAL
-    deal_phrases = [phrase for phrase in brackets if "DEAL" in phrase.upper()]
-
-    if deal_phrases:
-        # Lấy thông tin sau từ DEAL
-        deal_info = deal_phrases[0].split("DEAL")[1].strip().upper()
-        return deal_info
-
-    # Nếu không tìm thấy cả KOL và DEAL
-    return "No KOLs"
-
-
-## SECTION 8 ##
-
-
-@st.cache_data
-def extract_gift_name(product_name, list_outliers):
-    # Kiểm tra outliers trước
-    for key, value in list_outliers:
-        if key in product_name:
-            if "THẺ QUÀ TẶNG" in key:
-                return value
-
-            result = value.upper().replace("TẶNG", "").strip()
-            return result
-
-    # Nếu không có outlier nào, tiếp tục xử lý bình thường
-    brackets = re.findall(r"\[(.*?)\]", product_name)
-
-    # Kiểm tra các cụm từ trong ngoặc vuông để tìm chữ "tặng"
-    for bracket in brackets:
-        if "TẶNG" in bracket.upper():
-            gift_part = bracket.upper().split("TẶNG", 1)[1]  # Lấy phần sau "tặng"
-            return gift_part.strip()
+                pending[file_id] = pipeline
 
-    # Nếu không tìm thấy trong ngoặc vuông, tìm trực tiếp trong product_name
-    if "TẶNG" in product_name.upper():
-        gift_part = product_name.upper().split("TẶNG", 1)[1]  # Lấy phần sau "tặng"
-        return gift_part.strip()
+        # Các file còn lại được tính rồi encode song song trong các worker, nén lần lượt
+        # khi xong
+        frames = materialize_files(pending)
+        for file_id, file_bytes in encode_files(frames, DOWNLOAD_CONVERTERS[format_type]):
+            yield names[file_id], file_bytes
 
-    # Nếu không tìm thấy gift nào
-    return "NO GIFT"
+    return write_zip(get_members(), compression)
 
 
-## SECTION 9 ##
-
-
-@st.cache_data
-def get_default_periods(min_date, max_date):
-    # Định nghĩa cấu hình cho từng period
-    period_configs = {
-        "Double Day": {"start_day": 1, "end_day": 13},  # Từ ngày 1 đến ngày 13
-        "Mid Month": {"start_day": 14, "end_day": 20},  # Từ ngày 14 đến ngày 20
-        "Pay Day": {"start_day": 21, "end_day": None},  # Từ ngày 21 đến cuối tháng
-    }
-
-    periods = []
-    current_date = min_date.replace(
-        day=1
-    )  # Bắt đầu từ ngày đầu tiên của tháng min_date
-
-    while current_date <= max_date:
-        # Lấy ngày cuối cùng của tháng hiện tại
-        _, last_day = monthrange(current_date.year, current_date.month)
-        month_end = current_date.replace(day=last_day)
-
-        # Nếu tháng hiện tại vượt quá max_date, điều chỉnh month_end
-        if month_end > max_date:
-            month_end = max_date
-
-        # Duyệt qua từng period trong cấu hình
-        for period_name, config in period_configs.items():
-            start_day = config["start_day"]
-            end_day = (
-                config["end_day"] if config["end_day"] else last_day
-            )  # Nếu end_day là None, lấy cuối tháng
-
-            # Tính ngày bắt đầu và kết thúc của period
-            period_start = current_date.replace(day=start_day)
-            period_end = current_date.replace(day=min(end_day, month_end.day))
-
-            # Chỉ thêm period nếu nó nằm trong khoảng min_date và max_date
-            if (
-                period_start <= max_date
-                and period_end >= min_date
-                and period_start <= period_end
-            ):
-                periods.append((period_name, period_start, period_end))
-
-        # Chuyển sang tháng tiếp theo
-        if current_date.month == 12:
-            current_date = current_date.replace(year=current_date.year + 1, month=1)
-        else:
-            current_date = current_date.replace(month=current_date.month + 1)
-
-    return periods
-
-
-## SECTION 10 ##
-@st.cache_data
-def convert_df_to_csv(df):
-    """Convert dataframe to CSV format"""
-    return df.to_csv(index=False).encode("utf-8-sig")
-
-
-@st.cache_data
-def convert_df_to_excel(df):
-    """Convert dataframe to Excel format"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, sheet_name="Sheet1", index=False)
-
-        # Get workbook and worksheet
-        workbook = writer.book
-        worksheet = writer.sheets["Sheet1"]
-
-        # worksheet.autofit()
-
-        # Create center alignment format
-        # center_format = workbook.add_format({"align": "center"})
-
-        # # Find Brand column index
-        # brand_col_idx = list(df.columns).index("Brand")
-
-        # Auto-adjust columns' width
-        for i, col in enumerate(df.columns):
-            # Find the maximum length of the column
-            column_len = max(df[col].astype(str).apply(len).max(), len(col)) + 2
-
-            # Apply center format to Brand column, normal width adjustment for others
-            worksheet.set_column(i, i, column_len)
-            # if i == brand_col_idx:
-            #     worksheet.set_column(i, i, column_len, center_format)
-            # else:
-            #     worksheet.set_column(i, i, column_len)
-
-        (max_row, max_col) = df.shape
-        column_settings = [{"header": column} for column in df.columns]
-        
-        worksheet.add_table(0, 0, max_row, max_col - 1, {
-            "columns": column_settings,
-            "style": "Table Style Light 13"  # Standard Excel style name
-        })
-
-    # Reset pointer to the start of BytesIO object
-    output.seek(0)
-    return output.getvalue()
-
-
-def create_zip(files_data, timestamp, format_type="csv"):
-    zip_buffer = io.BytesIO()
-
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-        for _, data in files_data.items():
-            df = data["df_processed"]
-            original_name = data["file_name"]
-
-            file_name_raw = ".".join(original_name.split(".")[:-1])
-            base_name = f"cleaned_{file_name_raw}_{timestamp}"
-
-            if format_type == "csv":
-                file_bytes = convert_df_to_csv(df)
-                ext = "csv"
-            else:
-                file_bytes = convert_df_to_excel(df)
-                ext = "xlsx"
+@st.cache_data(show_spinner=False, max_entries=8)
+def get_zip_data(files_key, format_type, timestamp, compression, _files_data, _pipelines):
+    """
+    Đường dẫn file ZIP của tất cả các file, cache theo files_key ((fingerprint, tên file)
+    của từng file), định dạng, timestamp và kiểu nén (chỉ cache đường dẫn, nội dung file
+    nằm trên đĩa).
+    """
+    return create_zip(_files_data, _pipelines, timestamp, format_type, compression)
 
-            zf.writestr(f"{base_name}.{ext}", file_bytes)
 
-    zip_buffer.seek(0)
-    return zip_buffer
+def open_zip_data(*args):
+    """
+    File ZIP của get_zip_data(*args), mở để đọc; file đã bị xóa khỏi đĩa thì được tạo lại.
+    """
+    path = get_zip_data(*args)
+    if not os.path.exists(path):
+        get_zip_data.clear(*args)
+        path = get_zip_data(*args)
+    return open(path, "rb")
 
 
 @st.cache_data
@@ -744,7 +240,9 @@ list_component_bool_true = [
     "is_CLEAN_2ND_SKU",
     "is_CleanProvince",
 ]
-list_component_bool_false = []
+# Gift / Period được tính từ khi bấm nút Process cho đến khi Clear All (giữ qua các lần
+# rerun, vd: khi bấm Prepare để tạo file download)
+list_component_bool_false = ["is_PERIOD", "is_GIFT_PROCESSED", "is_PERIOD_PROCESSED"]
 
 list_component_list = ["periods"]
 
@@ -765,6 +263,17 @@ for component in list_component_list:
     if component not in st.session_state:
         st.session_state[component] = []
 
+# Kết quả của các stage trong pipeline làm sạch
+if "stage_memo" not in st.session_state:
+    st.session_state["stage_memo"] = StageMemo()
+
+if "pipeline_backend" not in st.session_state:
+    st.session_state["pipeline_backend"] = PANDAS
+
+# Các file download đã được tạo (artifact key), xem show_download_button
+if "prepared_downloads" not in st.session_state:
+    st.session_state["prepared_downloads"] = set()
+
 if "gifts" not in st.session_state:
     st.session_state["gifts"] = [
         ("TĂNG KHĂN CHOÀNG TẮM", "TẶNG KHĂN CHOÀNG TẮM"),
@@ -899,22 +408,21 @@ if upload_files:
             tmp_file.write(upload_file.read())
             tmp_file_path = tmp_file.name
 
-        # Đọc file
+        # Chỉ đọc header, dữ liệu được đọc (một lần, có memo) ở bước Cast Columns
         file_extension = file_name.split(".")[-1].lower()
 
         if file_extension == "csv":
-            df_original = pd.read_csv(tmp_file_path, low_memory=False)
+            df_header = pd.read_csv(tmp_file_path, nrows=0)
         else:
-            df_original = pd.read_excel(tmp_file_path)
+            df_header = pd.read_excel(tmp_file_path, nrows=0)
 
         # Lưu vào session_state
         st.session_state.files_data[file_id] = {
             "file_name": file_name,
             "file_path": tmp_file_path,
             "file_extension": file_extension,
-            "df_original": df_original,
-            "df_processed": df_original.copy(),
-            "headers_list": df_original.columns.tolist()
+            "df_processed": df_header,
+            "headers_list": df_header.columns.tolist()
         }
 
         st.info(f"Processing File: {file_name}")
@@ -973,9 +481,6 @@ if upload_files:
 
         st.session_state.default_string_columns = columns_cast_string
 
-        # Create a dictionary for dtype by setting each column in the list to str
-        dtype_dict = {col: str for col in columns_cast_string}
-
 
     # ===================== NUMERIC =====================
     with col21:
@@ -1017,28 +522,32 @@ if upload_files:
 
     # ===================== APPLY TO ALL FILES =====================
 
-    for file_id, data in st.session_state.files_data.items():
-        file_path = data["file_path"]
-        file_extension = data["file_extension"]
-
-        if file_extension == "csv":
-            df = pd.read_csv(file_path, low_memory=False, dtype=dtype_dict)
-        else:  # xlsx or xls
-            df = pd.read_excel(file_path, dtype=dtype_dict) 
-
-        for col in columns_cast_numeric:
-            if not is_numeric_dtype(df[col]):  # Check if the column is not already Int64
+    # Engine tính các cột (chọn cho mỗi lần chạy, kết quả giống nhau)
+    pipeline_backend = st.radio(
+        label="**PROCESSING ENGINE**",
+        options=BACKENDS,
+        index=BACKENDS.index(st.session_state.pipeline_backend),
+        horizontal=True,
+    )
+    st.session_state.pipeline_backend = pipeline_backend
 
-                df[col] = pd.to_numeric(df[col], errors="coerce")
+    # Mỗi file một pipeline: các stage chỉ chạy lại khi file hoặc widget liên quan thay đổi,
+    # các cột dẫn xuất chỉ được tính khi download
+    pipelines = {}
 
-        df[columns_cast_numeric] = df[columns_cast_numeric].fillna(0)
+    for file_id, data in st.session_state.files_data.items():
+        file_path = data["file_path"]
 
-        df = df.apply(
-            lambda x: x.str.replace("\t", "", regex=False) if x.dtype == "object" else x
+        pipelines[file_id] = Pipeline(st.session_state.stage_memo, backend=pipeline_backend)
+        pipelines[file_id].load(
+            stages.READ_FILE,
+            _file_path=file_path,
+            file_fingerprint=get_file_fingerprint(file_path),
+            file_extension=data["file_extension"],
+            string_columns=columns_cast_string,
+            numeric_columns=columns_cast_numeric,
         )
 
-        st.session_state.files_data[file_id]["df_processed"] = df
-
     # for file_id, data in st.session_state.files_data.items():
     #     df = data["df_processed"].copy()
 
@@ -1092,17 +601,8 @@ if upload_files:
         with open("province_mapping.json", "r", encoding="utf-8") as f:
             province_mapping = json.load(f)
 
-        for file_id, data in st.session_state.files_data.items():
-            df = data["df_processed"].copy()
-
-            unique_provinces = df["Province"].dropna().unique()
-            province_map = build_province_map_parallel(unique_provinces)
-            df["Clean Province"] = df["Province"].map(province_map)
-
-            df["Clean Province"] = df["Clean Province"].map(province_mapping)
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+        for file_id, pipeline in pipelines.items():
+            pipeline.define(stages.CLEAN_PROVINCE, province_mapping=province_mapping)
 
     # # ===================== PREVIEW =====================
     # add_vertical_space(1)
@@ -1186,26 +686,6 @@ if upload_files:
             "##### **Selected brand names:**\n"
             + "\n".join(f"- {option}" for option in extract_brands_list)
         )
-        brand_map = {
-            brand.lower(): brand for brand in extract_brands_list
-        }  # lowercase to original format mapping
-
-        # Create a regex pattern from the lowercase versions of brands
-        pattern = "|".join(brand_map.keys())
-
-        # Convert product_name to lowercase, extract the brand in lowercase, and map back to original format
-        for file_id, data in st.session_state.files_data.items():
-            df = data["df_processed"].copy()
-            
-            df["Brand"] = (
-                df["Product Name"]
-                .str.lower()
-                .str.extract(f"({pattern})", expand=False)  # Extract in lowercase
-                .map(brand_map)  # Map to original format using brand_map
-            )
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
 
     ####################################################################################################
 
@@ -1214,9 +694,6 @@ if upload_files:
     with col22:
         st.subheader("**Product Sizes**")
 
-        # Store dataframe in session_state
-        st.session_state.df = df
-
         # Specified default brands
         outliers_size = [
             "COMBO 4 LỐC (24 CHAI) SỮA NƯỚC GLUCERNA HƯƠNG VANI",
@@ -1272,19 +749,15 @@ if upload_files:
             + "\n".join(f"- {option}" for option in outliers_size_list)
         )
 
-        for file_id, data in st.session_state.files_data.items():
-            df = data["df_processed"].copy()
-            
-            # Apply the function to the product_name column and save the result in a new column
-            df["Size"] = df["Product Name"].apply(extract_size)
-
-            df.loc[
-                df["Product Name"].isin(outliers_size) & df["Size"].isna(),
-                "Size",
-            ] = "220ml"
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+        # Brand, Size, Format, Scheme, Clean 1st SKU của từng file: lấy từ SKU master, chỉ parse các SKU mới
+        for file_id, pipeline in pipelines.items():
+            # Brand, Size, Format, Scheme, Clean 1st SKU: lấy từ SKU master, chỉ parse các SKU mới
+            pipeline.define(
+                stages.PRODUCT_COLUMNS,
+                brands=extract_brands_list,
+                outliers_size=outliers_size_list,
+            )
+            pipeline.define(stages.BRAND_SIZE)
 
     # add_vertical_space(1)
 
@@ -1451,85 +924,38 @@ if upload_files:
     #     # Store dataframe in session_state
     #     st.session_state.df = df
 
-    for file_id, data in st.session_state.files_data.items():
-        df = data["df_processed"].copy()
-
+    for file_id, pipeline in pipelines.items():
         if FSP:
             # Calculate FSP
-            df["FSP"] = (
-                df["SKU Subtotal Before Discount"] - df["SKU Seller Discount"]
-            ) / df["Quantity"]
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            pipeline.define(stages.FSP)
 
         if FORMAT:
-            df["Format"] = df["Size"].apply(determine_format_type)
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            pipeline.define(stages.FORMAT)
 
         if SUBTOTAL_USD:
             # Tính giá trị mới và lưu tạm vào một cột mới
-            df["SKU Subtotal After Discount (USD)"] = (
-                df["SKU Subtotal After Discount"] / 26600
-            ).round(2)
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            pipeline.define(stages.SUBTOTAL_USD, fx_rates=load_fx_rates())
 
         if DATE:
-            # Convert the 'Created Time' column to datetime format with the correct format
-            df["Created Time"] = pd.to_datetime(
-                df["Created Time"], format="%d/%m/%Y %H:%M:%S", errors="coerce"
-            )
-
-            # Convert Created Time to date only for comparison
-            df["Created Date"] = df["Created Time"].dt.date
-
-            # Thêm cột mới với định dạng YYYY/MM
-            df["Created Year Month"] = df["Created Time"].dt.strftime("%Y-%m")
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            # Parse Created Time once, then derive Created Date / Created Year Month per unique day
+            pipeline.define(stages.DATE)
 
         if CLP_REGION:
-            df["Warehouse Region"] = df["Warehouse Name"].apply(extract_clp_region)
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            pipeline.define(stages.CLP_REGION)
 
         if VOUCHER:
-            # Calculate FSP
-            df["Voucher"] = df["SKU Platform Discount"] / (
-                df["SKU Subtotal Before Discount"] - df["SKU Seller Discount"]
-            )
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            # Calculate Voucher
+            pipeline.define(stages.VOUCHER)
 
         if TIMELINE:
-            # Calculate FSP
-            df["Created Time"] = pd.to_datetime(
-                df["Created Time"], format="%d/%m/%Y %H:%M:%S", errors="coerce"
-            )
-
-            df["Timeline"] = df["Created Time"].apply(extract_timeline)
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            # Created Time is only parsed here if the DATE columns are turned off
+            pipeline.define(stages.TIMELINE)
 
         if SCHEME:
-            df["Scheme"] = df.apply(extract_scheme, axis=1)
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            pipeline.define(stages.SCHEME)
 
         if CLEAN_1ST_SKU:
-            df["Clean 1st SKU"] = df.apply(extract_clean_sku, axis=1)
-
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
+            pipeline.define(stages.CLEAN_1ST_SKU)
 
         # if CLEAN_2ND_SKU:
         #     try:
@@ -1539,12 +965,6 @@ if upload_files:
         #     except FileNotFoundError:
         #         st.warning("File 'sku_mapping.xlsx' not found.")
 
-            # Store dataframe in session_state
-            st.session_state.files_data[file_id]["df_processed"] = df
-
-    # Store dataframe in session_state
-    st.session_state.files_data[file_id]["df_processed"] = df
-
     # add_vertical_space(1)
     
     # for file_id, data in st.session_state.files_data.items():
@@ -1660,16 +1080,12 @@ if upload_files:
             + "\n".join(f"- {option}" for option in kol_outliers_list)
         )
 
-    for file_id, data in st.session_state.files_data.items():
-        df = data["df_processed"].copy()
-
-        df["KOL"] = df["Product Name"].apply(
-            lambda x: extract_deal_info(x, exclude_outliers_list, kol_outliers_list)
+    for file_id, pipeline in pipelines.items():
+        pipeline.define(
+            stages.KOL,
+            kol_outliers=kol_outliers_list,
+            exclude_outliers=exclude_outliers_list,
         )
-        df["IS KOL"] = df["KOL"].apply(lambda x: False if x == "No KOLs" else True)
-
-        # Store dataframe in session_state
-        st.session_state.files_data[file_id]["df_processed"] = df
 
     # add_vertical_space(1)
     
@@ -1751,15 +1167,11 @@ if upload_files:
 
         ## Process and download section
         if st.button("Process All Gifts"):
-            for file_id, data in st.session_state.files_data.items():
-                df = data["df_processed"].copy()
-
-                df["Gift"] = df["Product Name"].apply(
-                    lambda x: extract_gift_name(x, st.session_state.gifts)
-                )
+            st.session_state.is_GIFT_PROCESSED = True
 
-                # Store dataframe in session_state
-                st.session_state.files_data[file_id]["df_processed"] = df
+        if st.session_state.is_GIFT_PROCESSED:
+            for file_id, pipeline in pipelines.items():
+                pipeline.define(stages.GIFT, gifts=st.session_state.gifts)
 
             # add_vertical_space(1)
             
@@ -1773,285 +1185,225 @@ if upload_files:
         # Add clear all button
         if st.button("Clear All", key="remove_all_gifts"):
             st.session_state.gifts = []
+            st.session_state.is_GIFT_PROCESSED = False
             st.rerun()
 
     ####################################################################################################
 
     ##################################### SECTION 9: Divide Periods ####################################
 
-    # add_vertical_space(3)
-    # st.header(
-    #     "Divide Periods",
-    #     divider="gray",
-    # )
+    add_vertical_space(3)
+    st.header(
+        "Divide Periods",
+        divider="gray",
+    )
 
-    # df["Created Time"] = pd.to_datetime(df["Created Time"], format="%d/%m/%Y %H:%M:%S")
-
-    # # Store dataframe in session_state
-    # st.session_state.df = df
-
-    # min_date = df["Created Time"].min().date()
-    # max_date = df["Created Time"].max().date()
-
-    # tab1, tab2, tab3 = st.tabs(["Add Default", "Add Manually", "Add by File"])
-
-    # with tab1:
-    #     add_defaults = st.button("Add Default Periods")
-
-    #     if add_defaults:
-    #         default_periods = get_default_periods(min_date, max_date)
-    #         new_periods_added = 0
-
-    #         for period in default_periods:
-    #             if period not in st.session_state.periods:
-    #                 # existing_names = [p[0] for p in st.session_state.periods]
-    #                 existing_dates = [(p[1], p[2]) for p in st.session_state.periods]
-
-    #                 if period in st.session_state.periods:
-    #                     st.warning(
-    #                         f"Period ({period[1].strftime('%Y-%m-%d')} to {period[2].strftime('%Y-%m-%d')}) already exists!"
-    #                     )
-    #                 elif (period[1], period[2]) in existing_dates:
-    #                     st.warning(
-    #                         f"Period ({period[1].strftime('%Y-%m-%d')} to {period[2].strftime('%Y-%m-%d')}) already exists!"
-    #                     )
-    #                 elif period not in st.session_state.periods:
-    #                     # Check for overlapping periods
-    #                     has_overlap = False
-    #                     for existing_start, existing_end in existing_dates:
-    #                         if not (
-    #                             period[2] < pd.Timestamp(existing_start).date()
-    #                             or period[1] > pd.Timestamp(existing_end).date()
-    #                         ):
-    #                             has_overlap = True
-    #                             break
-
-    #                     if has_overlap:
-    #                         st.warning(
-    #                             f"Period ({period[1].strftime('%Y-%m-%d')} to {period[2].strftime('%Y-%m-%d')}) overlaps with an existing period!"
-    #                         )
-    #                     else:
-    #                         st.session_state.periods.append(period)
-    #                         new_periods_added += 1
-
-    #         if new_periods_added > 0:
-    #             st.success(f"Added {new_periods_added} default periods successfully!")
-
-    # with tab2:
-
-    #     form_submitted = False
-
-    #     # Add period form
-    #     with st.form("add_period_form"):
-    #         col17, col27, col37 = st.columns(3)
-    #         with col17:
-    #             period_name = st.text_input("Period Name")
-    #         with col27:
-    #             start_date = st.date_input(
-    #                 "Start Date", value=min_date, min_value=min_date, max_value=max_date
-    #             )
-    #         with col37:
-    #             end_date = st.date_input(
-    #                 "End Date", value=max_date, min_value=min_date, max_value=max_date
-    #             )
-
-    #         submitted = st.form_submit_button("Add Period")
-
-    #         if submitted and not period_name:
-    #             st.error("Please enter period name!")
-    #             print(st.session_state.periods)
-    #         elif submitted and start_date and end_date:
-    #             form_submitted = True
-
-    #     if form_submitted:
-    #         if start_date <= end_date:
-    #             period = (period_name, start_date, end_date)
-    #             # existing_names = [p[0] for p in st.session_state.periods]
-    #             existing_dates = [(p[1], p[2]) for p in st.session_state.periods]
-
-    #             if period in st.session_state.periods:
-    #                 st.warning("This period already exists!")
-    #             elif (start_date, end_date) in existing_dates:
-    #                 st.warning("This pair of start and end date already exists!")
-    #             else:
-    #                 # Check for overlapping periods
-    #                 has_overlap = False
-    #                 for existing_start, existing_end in existing_dates:
-    #                     if not (
-    #                         end_date < pd.Timestamp(existing_start).date()
-    #                         or start_date > pd.Timestamp(existing_end).date()
-    #                     ):
-    #                         has_overlap = True
-    #                         break
-
-    #                 if has_overlap:
-    #                     st.warning("This period overlaps with an existing period!")
-    #                 else:
-    #                     st.session_state.periods.append(period)
-    #                     st.success("Period added successfully!")
-
-    #         else:
-    #             st.error("End date must be after start date!")
-
-    # with tab3:
-    #     upload_file = st.file_uploader(
-    #         "CHOOSE YOUR PERIOD DATA FILE (XLSX FORMAT)", type="xlsx"
-    #     )
-    #     is_period_data = False
+    PERIOD = st.checkbox(
+        "**DIVIDE :red[PERIODS]**",
+        value=st.session_state.is_PERIOD,
+        on_change=update_PERIOD,
+    )
 
-    #     st.markdown(
-    #         "You can download a sample file [here](https://docs.google.com/spreadsheets/u/0/d/1BJ2DSfOU1p75r1lF7RWB0QBs6UL9ln28W56UB-fT2oM/export?format=xlsx)"
-    #     )
+    # Khoảng ngày chung của tất cả các file (min / max của từng file, không ghép các file),
+    # chỉ tính khi chia period và khi cột Created Time của file thay đổi; Created Time sai
+    # định dạng / trống được bỏ qua
+    date_range = None
+    if PERIOD:
+        file_min_dates = []
+        file_max_dates = []
+        for pipeline in pipelines.values():
+            file_min_date, file_max_date = get_date_range(
+                pipeline.fingerprints["Created Time"],
+                lambda: pipeline.materialize(["Created Time"])["Created Time"],
+            )
+            file_min_dates.append(file_min_date)
+            file_max_dates.append(file_max_date)
+
+        min_date = pd.Series(file_min_dates, dtype="datetime64[ns]").min()
+        max_date = pd.Series(file_max_dates, dtype="datetime64[ns]").max()
+
+        if pd.isna(min_date):
+            st.warning(
+                "No valid Created Time found. Please ensure your dates are in DD/MM/YYYY HH:MM:SS format"
+            )
+        else:
+            date_range = (min_date.date(), max_date.date())
+
+    if date_range is not None:
+        min_date, max_date = date_range
+
+        tab1, tab2, tab3 = st.tabs(["Add Default", "Add Manually", "Add by File"])
+
+        with tab1:
+            add_defaults = st.button("Add Default Periods")
+
+            if add_defaults:
+                # Các period mặc định được tạo một lần cho khoảng ngày của tất cả các file
+                default_periods = get_default_periods(min_date, max_date)
+
+                # Validate tất cả default period một lần (trùng / giao với các period hiện có)
+                accepted, rejected = validate_periods(
+                    pd.DataFrame(default_periods, columns=PERIOD_COLUMNS),
+                    st.session_state.periods,
+                )
+                st.session_state.periods.extend(default_periods[i] for i in accepted.index)
+
+                if len(accepted) > 0:
+                    st.success(f"Added {len(accepted)} default periods successfully!")
+                if len(rejected) > 0:
+                    st.warning(f"{len(rejected)} default periods were skipped:")
+                    st.dataframe(rejected, hide_index=True)
+
+        with tab2:
+
+            form_submitted = False
+
+            # Add period form
+            with st.form("add_period_form"):
+                col17, col27, col37 = st.columns(3)
+                with col17:
+                    period_name = st.text_input("Period Name")
+                with col27:
+                    start_date = st.date_input(
+                        "Start Date", value=min_date, min_value=min_date, max_value=max_date
+                    )
+                with col37:
+                    end_date = st.date_input(
+                        "End Date", value=max_date, min_value=min_date, max_value=max_date
+                    )
+
+                submitted = st.form_submit_button("Add Period")
+
+                if submitted and not period_name:
+                    st.error("Please enter period name!")
+                elif submitted and start_date and end_date:
+                    form_submitted = True
+
+            if form_submitted:
+                if start_date <= end_date:
+                    period = (period_name, start_date, end_date)
+                    existing_dates = [(p[1], p[2]) for p in st.session_state.periods]
+
+                    if period in st.session_state.periods:
+                        st.warning("This period already exists!")
+                    elif (start_date, end_date) in existing_dates:
+                        st.warning("This pair of start and end date already exists!")
+                    else:
+                        # Check for overlapping periods
+                        has_overlap = False
+                        for existing_start, existing_end in existing_dates:
+                            if not (
+                                end_date < pd.Timestamp(existing_start).date()
+                                or start_date > pd.Timestamp(existing_end).date()
+                            ):
+                                has_overlap = True
+                                break
+
+                        if has_overlap:
+                            st.warning("This period overlaps with an existing period!")
+                        else:
+                            st.session_state.periods.append(period)
+                            st.success("Period added successfully!")
+
+                else:
+                    st.error("End date must be after start date!")
+
+        with tab3:
+            upload_file = st.file_uploader(
+                "CHOOSE YOUR PERIOD DATA FILE (XLSX FORMAT)", type="xlsx"
+            )
+
+            st.markdown(
+                "You can download a sample file [here](https://docs.google.com/spreadsheets/u/0/d/1BJ2DSfOU1p75r1lF7RWB0QBs6UL9ln28W56UB-fT2oM/export?format=xlsx)"
+            )
+
+            if upload_file:
+                period_df = pd.read_excel(upload_file)
+
+                # Validate cả bảng một lần: null, định dạng ngày, start <= end, trùng / giao
+                # với các period hiện có và giữa các dòng của file
+                accepted, rejected = validate_periods(period_df, st.session_state.periods)
+                st.session_state.periods.extend(accepted.itertuples(index=False, name=None))
+
+                if len(accepted) > 0:
+                    st.success(f"Added {len(accepted)} periods successfully!")
+                if len(rejected) > 0:
+                    st.warning(f"{len(rejected)} rows were not imported:")
+                    st.dataframe(rejected, hide_index=True)
+
+        ## Display and manage periods
+        if st.session_state.periods:
+            st.write("##### Current Periods")
+
+            # Tạo 2 cột chính
+            col18, col28 = st.columns(2)
+
+            # Tính số period cho mỗi cột
+            total_periods = len(st.session_state.periods)
+            periods_per_col = (total_periods + 1) // 2  # Làm tròn lên
+
+            for i, (name, start, end) in enumerate(st.session_state.periods):
+                # Xác định period này thuộc cột nào
+                current_col = col18 if i < periods_per_col else col28
+
+                # Tạo container cho period
+                with current_col:
+                    period_container = st.container()
+                    with period_container:
+                        col181, col281 = st.columns(
+                            [3, 1]
+                        )  # Chia container thành 2 phần cho nội dung và nút remove
+
+                        with col181:
+                            st.write(
+                                f"- Period {i+1}: {name} ({start.strftime('%Y-%m-%d')} to {end.strftime('%Y-%m-%d')})"
+                            )
+                        with col281:
+                            if st.button(f"Remove", key=f"remove_period_{i}"):
+                                st.session_state.periods.pop(i)
+                                st.rerun()
+
+            # # Process and download section
+            if st.button("Process All Periods"):
+                st.session_state.is_PERIOD_PROCESSED = True
+
+            if st.session_state.is_PERIOD_PROCESSED:
+                # Tất cả các file dùng chung một calendar (khoảng ngày của tất cả các file):
+                # Period (categorical, cùng categories) được gán cho từng file theo key ngày
+                # khi materialize, không tạo bản ghép của các file
+                for pipeline in pipelines.values():
+                    pipeline.define(
+                        stages.PERIOD,
+                        periods=st.session_state.periods,
+                        _date_range=(min_date, max_date),
+                    )
+
+                add_vertical_space(1)
+                for file_id, pipeline in pipelines.items():
+                    file_name = st.session_state.files_data[file_id]["file_name"]
+
+                    # Stage chỉ được tính (và có thể lỗi) khi preview
+                    try:
+                        preview = pipeline.preview()
+
+                    except Exception as e:
+                        st.error(f"Error processing {file_name}: {str(e)}")
+                        # Add more detailed error information
+                        if "Created Time" in str(e):
+                            st.error(
+                                "Date format error detected. Please ensure your dates are in DD/MM/YYYY HH:MM:SS format"
+                            )
+                        continue
+
+                    with st.expander(f"📄 Dataframe Preview - {file_name}"):
+                        st.dataframe(preview)
+
+            # Add clear all button
+            if st.button("Clear All", key="remove_all_periods"):
+                st.session_state.periods = []
+                st.session_state.is_PERIOD_PROCESSED = False
+                st.rerun()
 
-    #     if upload_file:
-    #         period_df = pd.read_excel(upload_file)
-
-    #         period_df["start_date"] = pd.to_datetime(
-    #             period_df["start_date"], format="%d/%m/%Y"
-    #         )
-    #         period_df["end_date"] = pd.to_datetime(
-    #             period_df["end_date"], format="%d/%m/%Y"
-    #         )
-    #         min_date = pd.Timestamp(min_date)
-    #         max_date = pd.Timestamp(max_date)
-
-    #         # Add new periods
-    #         new_periods_added = 0
-
-    #         for index, row in period_df.iterrows():
-    #             # Phase 1: Check for null values first
-    #             if row.isnull().any():
-    #                 st.warning(f"Row {index + 1} contains null values - skipping")
-    #                 continue
-
-    #             start_date = pd.to_datetime(row["start_date"], format="%d/%m/%Y")
-    #             end_date = pd.to_datetime(row["end_date"], format="%d/%m/%Y")
-    #             min_date = pd.Timestamp(min_date)
-    #             max_date = pd.Timestamp(max_date)
-
-    #             # Phase 2: Check start_date before end_date
-    #             if start_date > end_date:
-    #                 st.warning(f"Row {index + 1}: End date must be after start date!")
-    #                 continue
-
-    #             # Phase 3: Check date range
-    #             # if start_date < min_date or end_date > max_date:
-    #             #     st.warning(
-    #             #         f"Row {index + 1}: Dates must be between {min_date.strftime('%Y-%m-%d')} and {max_date.strftime('%Y-%m-%d')}!"
-    #             #     )
-    #             #     continue
-
-    #             # Process valid period
-    #             period = (row["period_name"], start_date, end_date)
-    #             if period not in st.session_state.periods:
-    #                 existing_dates = [(p[1], p[2]) for p in st.session_state.periods]
-
-    #                 if period in st.session_state.periods:
-    #                     st.warning(
-    #                         f"Period ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}) already exists!"
-    #                     )
-    #                 elif (start_date, end_date) in existing_dates:
-    #                     st.warning(
-    #                         f"Period ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}) already exists!"
-    #                     )
-    #                 else:
-    #                     # Check for overlapping periods
-    #                     has_overlap = False
-    #                     for existing_start, existing_end in existing_dates:
-    #                         if not (
-    #                             end_date < pd.Timestamp(existing_start)
-    #                             or start_date > pd.Timestamp(existing_end)
-    #                         ):
-    #                             has_overlap = True
-    #                             break
-
-    #                     if has_overlap:
-    #                         st.warning(
-    #                             f"Period ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}) overlaps with an existing period!"
-    #                         )
-    #                     else:
-    #                         st.session_state.periods.append(period)
-    #                         new_periods_added += 1
-
-    #         if new_periods_added > 0:
-    #             st.success(f"Added {new_periods_added} periods successfully!")
-
-    # ## Display and manage periods
-    # if st.session_state.periods:
-    #     st.write("##### Current Periods")
-
-    #     # Tạo 2 cột chính
-    #     col18, col28 = st.columns(2)
-
-    #     # Tính số period cho mỗi cột
-    #     total_periods = len(st.session_state.periods)
-    #     periods_per_col = (total_periods + 1) // 2  # Làm tròn lên
-
-    #     for i, (name, start, end) in enumerate(st.session_state.periods):
-    #         # Xác định period này thuộc cột nào
-    #         current_col = col18 if i < periods_per_col else col28
-
-    #         # Tạo container cho period
-    #         with current_col:
-    #             period_container = st.container()
-    #             with period_container:
-    #                 col181, col281 = st.columns(
-    #                     [3, 1]
-    #                 )  # Chia container thành 2 phần cho nội dung và nút remove
-
-    #                 with col181:
-    #                     st.write(
-    #                         f"- Period {i+1}: {name} ({start.strftime('%Y-%m-%d')} to {end.strftime('%Y-%m-%d')})"
-    #                     )
-    #                 with col281:
-    #                     if st.button(f"Remove", key=f"remove_period_{i}"):
-    #                         st.session_state.periods.pop(i)
-    #                         st.rerun()
-
-    #     # # Process and download section
-    #     if st.button("Process All Periods"):
-    #         try:
-
-    #             # Store dataframe in session_state
-    #             st.session_state.df = df
-
-    #             df["Period"] = "No Period"
-
-    #             # Store dataframe in session_state
-    #             st.session_state.df = df
-
-    #             for name, start_date, end_date in st.session_state.periods:
-    #                 start_dt = pd.to_datetime(start_date).date()
-    #                 end_dt = pd.to_datetime(end_date).date()
-
-    #                 # Compare dates only
-    #                 mask = (df["Created Date"] >= start_dt) & (
-    #                     df["Created Date"] <= end_dt
-    #                 )
-    #                 df.loc[mask, "Period"] = name
-
-    #             # Drop the temporary Created Date column if you don't need it
-    #             # df = df.drop("Created Date", axis=1)
-
-    #             # Store dataframe in session_state
-    #             st.session_state.df = df
-
-    #         except Exception as e:
-    #             st.error(f"Error processing data: {str(e)}")
-    #             # Add more detailed error information
-    #             if "Created Time" in str(e):
-    #                 st.error(
-    #                     "Date format error detected. Please ensure your dates are in DD/MM/YYYY HH:MM:SS format"
-    #                 )
-
-    #         add_vertical_space(1)
-    #         with st.expander("**Dataframe Preview**"):
-    #             st.dataframe(df)
-
-    #     # Add clear all button
-    #     if st.button("Clear All", key="remove_all_periods"):
-    #         st.session_state.periods = []
-    #         st.rerun()
 
     ####################################################################################################
 
@@ -2075,26 +1427,49 @@ if upload_files:
     # col15, col25, col35, col45, col55, col65 = st.columns(6)
 
 
+    # Chỉ tính fingerprint của kết quả (gồm cả trạng thái Gift / Period); dữ liệu của các
+    # file chỉ được tính khi bấm nút Prepare (mỗi file một job trong process pool)
+    for file_id, pipeline in pipelines.items():
+        st.session_state.files_data[file_id]["fingerprint"] = get_config_hash(
+            pipeline.get_fingerprint(),
+            st.session_state.is_GIFT_PROCESSED,
+            st.session_state.is_PERIOD_PROCESSED,
+        )
+
+    def materialize_with_progress():
+        progress = st.progress(0.0, text="Cleaning files...")
+
+        def show_progress(file_id, done, total):
+            file_name = st.session_state.files_data[file_id]["file_name"]
+            progress.progress(done / total, text=f"Cleaned {file_name} ({done}/{total})")
+
+        try:
+            return materialize_files(pipelines, show_progress)
+        finally:
+            progress.empty()
+
     timestamp = get_timestamp_string(date_only=True)
 
+    # Các file download chỉ được tạo khi bấm nút (xem show_download_button)
     tab1, tab2, tab3 = st.tabs(["📦 Individual Download", "📦 Download All", "📦 Download Merged File"])
 
     with tab1:
         # Header
-        col1, col2, col3, col4 = st.columns([3, 3, 2, 2])
+        col1, col2, col3, col4, col5, col6 = st.columns([3, 3, 1, 1, 1, 1])
         col1.markdown("**File Name**")
         col2.markdown("**Custom Name**")
         col3.markdown("**CSV**")
         col4.markdown("**XLSX**")
+        col5.markdown("**PARQUET**")
+        col6.markdown("**ARROW**")
 
         for file_id, data in st.session_state.files_data.items():
-            df = data["df_processed"]
             original_name = data["file_name"]
 
             file_name_raw = ".".join(original_name.split(".")[:-1])
             default_name = f"cleaned_{file_name_raw}_{timestamp}"
 
-            col1, col2, col3, col4 = st.columns([3, 3, 2, 2])
+            col1, col2, col3, col4, col5, col6 = st.columns([3, 3, 1, 1, 1, 1])
 
             # Cột 1: tên file gốc
             with col1:
@@ -2109,142 +1484,155 @@ if upload_files:
                     label_visibility="collapsed"
                 )
 
-            # Cột 3: Download CSV
-            with col3:
-                st.download_button(
-                    label="📥 Download CSV",
-                    data=convert_df_to_csv(df),
-                    file_name=f"{custom_name}.csv",
-                    mime="text/csv",
-                    key=f"csv_{file_id}"
-                )
-
-            # Cột 4: Download XLSX
-            with col4:
-                st.download_button(
-                    label="📥 Download XLSX",
-                    data=convert_df_to_excel(df),
-                    file_name=f"{custom_name}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    key=f"xlsx_{file_id}"
-                )
+            # Cột 3-6: Download CSV / XLSX / Parquet / Arrow
+            for column, format_type in [
+                (col3, "csv"),
+                (col4, "xlsx"),
+                (col5, "parquet"),
+                (col6, "arrow"),
+            ]:
+                with column:
+                    show_download_button(
+                        label=format_type.upper(),
+                        artifact_key=(data["fingerprint"], format_type),
+                        widget_key=f"{format_type}_{file_id}",
+                        file_name=f"{custom_name}.{format_type}",
+                        mime=MIME_TYPES[format_type],
+                        get_data=partial(
+                            get_download_data,
+                            data["fingerprint"],
+                            format_type,
+                            pipelines[file_id].materialize,
+                        ),
+                    )
 
     with tab2:
         if st.session_state.files_data:
+            files_key = tuple(
+                (data["fingerprint"], data["file_name"])
+                for data in st.session_state.files_data.values()
+            )
 
-            col15, col25, col35, col45, col55, col65 = st.columns(6)
-
-            with col35:
-                zip_csv = create_zip(st.session_state.files_data, timestamp, "csv")
-
-                st.download_button(
-                    label="📥 Download ZIP (CSV format)",
-                    data=zip_csv,
-                    file_name=f"all_files_{timestamp}.zip",
-                    mime="application/zip"
-                )
+            compression = st.selectbox(
+                "ZIP Compression",
+                options=list(ZIP_COMPRESSIONS),
+                index=list(ZIP_COMPRESSIONS).index(DEFAULT_ZIP_COMPRESSION),
+                key="zip_compression",
+                help="File XLSX / Parquet / Arrow đã được nén sẵn: chọn Store để tạo file ZIP nhanh nhất",
+            )
 
-            with col45:
-                zip_xlsx = create_zip(st.session_state.files_data, timestamp, "xlsx")
+            col15, col25, col35, col45, col55, col65 = st.columns(6)
 
-                st.download_button(
-                    label="📥 Download ZIP (XLSX format)",
-                    data=zip_xlsx,
-                    file_name=f"all_files_{timestamp}.zip",
-                    mime="application/zip"
-                )
+            for column, format_type in [
+                (col25, "csv"),
+                (col35, "xlsx"),
+                (col45, "parquet"),
+                (col55, "arrow"),
+            ]:
+                with column:
+                    show_download_button(
+                        label=f"ZIP ({format_type.upper()} format)",
+                        artifact_key=(files_key, timestamp, f"zip_{format_type}", compression),
+                        widget_key=f"zip_{format_type}",
+                        file_name=f"all_files_{timestamp}.zip",
+                        mime=MIME_TYPES["zip"],
+                        get_data=partial(
+                            open_zip_data,
+                            files_key,
+                            format_type,
+                            timestamp,
+                            compression,
+                            st.session_state.files_data,
+                            pipelines,
+                        ),
+                    )
         else:
             st.info("Chưa có file nào")
 
     with tab3:
-        if st.session_state.files_data:
-            processed_dfs = [
-                data["df_processed"] for data in st.session_state.files_data.values()
-            ]
-        
-        df_concat = pd.DataFrame()
+        # Thông tin và preview được tính từ từng pipeline (không tính toàn bộ dữ liệu);
+        # file ghép chỉ được tạo khi download
+        total_rows = sum(len(pipeline.df) for pipeline in pipelines.values())
+        total_columns = len(
+            dict.fromkeys(column for pipeline in pipelines.values() for column in pipeline.columns)
+        )
 
-        if len(processed_dfs) > 1:
-            try:
-                # Vertical Relaxed: Cho phép các cột khác nhau (missing columns sẽ thành null)
-                df_concat = pd.concat(processed_dfs, ignore_index=True)
-                
-                st.success(f"✅ Successfully combined **{len(processed_dfs)} files** - Total rows: **{len(df_concat):,}**")
-
-                # Hiển thị thông tin
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Total rows", f"{len(df_concat):,}")
-                with col2:
-                    st.metric("Total columns", len(df_concat.columns))
-                with col3:
-                    st.metric("Total files", len(processed_dfs))
-
-                with st.expander("🔎 Data Preview", expanded=False):
-                    st.dataframe(df_concat, use_container_width=True)
-
-                st.session_state.df_concat = df_concat
-
-            except Exception as e:
-                st.error(f"Lỗi khi concat: {e}")
-                st.session_state.df_concat = None
-
-        elif len(processed_dfs) == 1:
-            df_concat = processed_dfs[0]
-            
+        if len(pipelines) > 1:
+            st.success(f"✅ Successfully combined **{len(pipelines)} files** - Total rows: **{total_rows:,}**")
+        elif len(pipelines) == 1:
             st.success("✅ Only 1 upload file detected")
 
+        if pipelines:
             # Hiển thị thông tin
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Total rows", f"{len(df_concat):,}")
+                st.metric("Total rows", f"{total_rows:,}")
             with col2:
-                st.metric("Total columns", len(df_concat.columns))
+                st.metric("Total columns", total_columns)
             with col3:
-                st.metric("Total files", len(processed_dfs))
+                st.metric("Total files", len(pipelines))
 
             with st.expander("🔎 Data Preview", expanded=False):
-                st.dataframe(df_concat, use_container_width=True)
-
-            st.session_state.df_concat = df_concat
+                # Preview của các file đầu tiên cho đến khi đủ PREVIEW_ROWS dòng
+                previews = []
+                preview_rows = 0
+                for pipeline in pipelines.values():
+                    if preview_rows >= PREVIEW_ROWS:
+                        break
+                    previews.append(pipeline.preview())
+                    preview_rows += len(previews[-1])
+
+                st.caption(f"First {PREVIEW_ROWS:,} rows")
+                st.dataframe(
+                    pd.concat(previews, ignore_index=True).head(PREVIEW_ROWS),
+                    use_container_width=True,
+                )
 
-        else:
-            st.session_state.df_concat = None
+            def get_merged_df():
+                processed_dfs = list(materialize_with_progress().values())
 
-        col1, col2, col3, col4, col5 = st.columns([3, 1, 2, 2, 1])
-        col1.markdown("**Custom Name**")
-        col3.markdown("**CSV**")
-        col4.markdown("**XLSX**")
+                # Vertical Relaxed: Cho phép các cột khác nhau (missing columns sẽ thành null)
+                if len(processed_dfs) == 1:
+                    return processed_dfs[0]
+                return pd.concat(processed_dfs, ignore_index=True)
 
-        timestamp = get_timestamp_string(date_only=True)
+            merged_fingerprint = get_config_hash(
+                *[data["fingerprint"] for data in st.session_state.files_data.values()]
+            )
 
-        default_name = f"combined_order_{timestamp}"
+            col1, col2, col3, col4, col5, col6, col7 = st.columns([3, 1, 1, 1, 1, 1, 1])
+            col1.markdown("**Custom Name**")
+            col3.markdown("**CSV**")
+            col4.markdown("**XLSX**")
+            col5.markdown("**PARQUET**")
+            col6.markdown("**ARROW**")
 
-        # Cột 1: input tên file
-        with col1:
-            custom_name = st.text_input(
-                label="",
-                value=default_name,
-                key=f"name_concat",
-                label_visibility="collapsed"
-            )
+            default_name = f"combined_order_{timestamp}"
 
-        # Cột 2: Download CSV
-        with col3:
-            st.download_button(
-                label="📥 Download CSV",
-                data=convert_df_to_csv(df),
-                file_name=f"{custom_name}.csv",
-                mime="text/csv",
-                key=f"csv_concat"
-            )
+            # Cột 1: input tên file
+            with col1:
+                custom_name = st.text_input(
+                    label="",
+                    value=default_name,
+                    key=f"name_concat",
+                    label_visibility="collapsed"
+                )
 
-        # Cột 3: Download XLSX
-        with col4:
-            st.download_button(
-                label="📥 Download XLSX",
-                data=convert_df_to_excel(df),
-                file_name=f"{custom_name}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                key=f"xlsx_concat"
-            )
\ No newline at end of file
+            # Cột 3-6: Download CSV / XLSX / Parquet / Arrow
+            for column, format_type in [
+                (col3, "csv"),
+                (col4, "xlsx"),
+                (col5, "parquet"),
+                (col6, "arrow"),
+            ]:
+                with column:
+                    show_download_button(
+                        label=format_type.upper(),
+                        artifact_key=(merged_fingerprint, format_type),
+                        widget_key=f"{format_type}_concat",
+                        file_name=f"{custom_name}.{format_type}",
+                        mime=MIME_TYPES[format_type],
+                        get_data=partial(
+                            get_download_data, merged_fingerprint, format_type, get_merged_df
+                        ),
+                    )
@@ -5,8 +5,13 @@ import tempfile
 from pathlib import Path
 from streamlit_extras.add_vertical_space import add_vertical_space
 from datetime import datetime
+from functools import partial
 from io import BytesIO
 
+from utils.downloads import MIME_TYPES, show_download_button
+from utils.export import write_arrow, write_parquet
+from utils.rules import get_config_hash
+
 # ===================== CONFIG =====================
 allowed_types = ["csv", "xlsx"]
 
@@ -54,6 +59,23 @@ def convert_df_to_excel(df):
     output.seek(0)
     return output.getvalue()
 
+
+# Parquet: giữ kiểu dữ liệu của các cột, nén zstd;
+# Arrow IPC (Feather V2): đọc lại trực tiếp bằng Polars / pandas
+DOWNLOAD_CONVERTERS = {
+    "parquet": write_parquet,
+    "arrow": write_arrow,
+}
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def get_download_data(fingerprint, format_type, _get_df):
+    """
+    Nội dung file download của _get_df(), cache theo (fingerprint của dữ liệu, định
+    dạng): _get_df chỉ được gọi khi file chưa có trong cache.
+    """
+    return DOWNLOAD_CONVERTERS[format_type](_get_df())
+
 ########################################################################################################
 
 ######################################## SECTION 1: Upload File ########################################
@@ -292,11 +314,16 @@ if upload_files:
 
     add_vertical_space(3)
     st.header("Download", divider="gray")
-    if st.session_state.files_data:
-        col1, col2, col3, col4, col5 = st.columns([3, 1, 2, 2, 1])
+    if st.session_state.files_data and st.session_state.df_concat is not None:
+        # File download là kết quả ghép của tất cả các file
+        df_concat = st.session_state.df_concat
+
+        col1, col2, col3, col4, col5, col6, col7 = st.columns([3, 1, 1, 1, 1, 1, 1])
         col1.markdown("**Custom Name**")
         col3.markdown("**CSV**")
         col4.markdown("**XLSX**")
+        col5.markdown("**PARQUET**")
+        col6.markdown("**ARROW**")
 
         timestamp = get_timestamp_string(date_only=True)
 
@@ -307,7 +334,7 @@ if upload_files:
             custom_name = st.text_input(
                 label="",
                 value=default_name,
-                key=f"name_{file_id}",
+                key="name_concat",
                 label_visibility="collapsed"
             )
 
@@ -315,18 +342,36 @@ if upload_files:
         with col3:
             st.download_button(
                 label="📥 Download CSV",
-                data=convert_df_to_csv(df),
+                data=convert_df_to_csv(df_concat),
                 file_name=f"{custom_name}.csv",
                 mime="text/csv",
-                key=f"csv_{file_id}"
+                key="csv_concat"
             )
 
         # Cột 3: Download XLSX
         with col4:
             st.download_button(
                 label="📥 Download XLSX",
-                data=convert_df_to_excel(df),
+                data=convert_df_to_excel(df_concat),
                 file_name=f"{custom_name}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                key=f"xlsx_{file_id}"
-            )
\ No newline at end of file
+                key="xlsx_concat"
+            )
+
+        # Cột 5-6: Download Parquet / Arrow, chỉ tạo file khi bấm nút (key theo tất cả các
+        # file và các cột được cast, không hash dữ liệu)
+        fingerprint = get_config_hash(
+            list(st.session_state.files_data), columns_cast_string, columns_cast_numeric
+        )
+        for column, format_type in [(col5, "parquet"), (col6, "arrow")]:
+            with column:
+                show_download_button(
+                    label=format_type.capitalize(),
+                    artifact_key=(fingerprint, format_type),
+                    widget_key=f"{format_type}_concat",
+                    file_name=f"{custom_name}.{format_type}",
+                    mime=MIME_TYPES[format_type],
+                    get_data=partial(
+                        get_download_data, fingerprint, format_type, lambda: df_concat
+                    ),
+                )